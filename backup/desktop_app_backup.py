@@ -1,4 +1,10 @@
+import json
+import os
 import sqlite3
+import threading
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import flet as ft
 import pandas as pd
@@ -119,6 +125,30 @@ def init_db():
                 technician_id INTEGER,
                 FOREIGN KEY (technician_id) REFERENCES Technicians(technician_id)
             );
+            -- Report filters page through requests newest first.
+            CREATE INDEX IF NOT EXISTS idx_MaintenanceRequests_status ON MaintenanceRequests (status, request_id);
+            CREATE INDEX IF NOT EXISTS idx_MaintenanceRequests_branch ON MaintenanceRequests (branch, request_id);
+        ''')
+        # Sync columns, added in place to databases created before sync existed.
+        # assigned_technician_id and server_id are the web app's technician ids.
+        for table, column in (
+            ("MaintenanceRequests", "sync_uuid TEXT"),
+            ("MaintenanceRequests", "server_version INTEGER"),
+            ("MaintenanceRequests", "dirty INTEGER NOT NULL DEFAULT 0"),
+            ("MaintenanceRequests", "assigned_technician_id INTEGER"),
+            ("Technicians", "server_id INTEGER"),
+        ):
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # already there
+        cursor.executescript('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_MaintenanceRequests_sync_uuid ON MaintenanceRequests (sync_uuid);
+            CREATE INDEX IF NOT EXISTS idx_MaintenanceRequests_dirty ON MaintenanceRequests (dirty) WHERE dirty > 0;
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_Technicians_server_id ON Technicians (server_id);
+            CREATE TABLE IF NOT EXISTS SyncState (name TEXT PRIMARY KEY, value NOT NULL);
+            INSERT OR IGNORE INTO SyncState (name, value) VALUES ('client_id', lower(hex(randomblob(16))));
+            UPDATE MaintenanceRequests SET sync_uuid = lower(hex(randomblob(16))), dirty = 1 WHERE sync_uuid IS NULL;
         ''')
         # Seed
         cursor.execute("INSERT OR IGNORE INTO Branches (branch_name) VALUES (?)", ("Main Branch",))
@@ -153,10 +183,10 @@ def authenticate_user(username, password):
 
 def add_request(data):
     request_id = execute_query('''
-        INSERT INTO MaintenanceRequests (request_date, requester_name, phone_number, branch, maintenance_type, equipment_name, fault_type, notes, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'open')
+        INSERT INTO MaintenanceRequests (request_date, requester_name, phone_number, branch, maintenance_type, equipment_name, fault_type, notes, status, sync_uuid, dirty)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'open', ?, 1)
     ''', (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), data["requester_name"], data["phone_number"], data["branch"],
-          data["maintenance_type"], data["equipment_name"], data["fault_type"], data["notes"]))
+          data["maintenance_type"], data["equipment_name"], data["fault_type"], data["notes"], str(uuid.uuid4())))
     if request_id:
         execute_query('''
             INSERT INTO Notifications (request_id, recipient_type, message, created_at)
@@ -208,25 +238,26 @@ def update_purchase_order_status(purchase_order_id, status, request_id):
                      (request_id, "engineer", f"تم رفض طلب الشراء #{purchase_order_id}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
 
 def assign_technician(request_id, technician_name):
-    res = execute_query("SELECT technician_id FROM Technicians WHERE technician_name = ?", (technician_name,), fetch=True)
-    technician_id = res[0][0] if res else None
+    res = execute_query("SELECT technician_id, server_id FROM Technicians WHERE technician_name = ?", (technician_name,), fetch=True)
+    technician_id, server_id = res[0] if res else (None, None)
     if technician_id:
-        execute_query("UPDATE MaintenanceRequests SET assigned_technician = ? WHERE request_id = ?", (technician_name, request_id))
+        execute_query("UPDATE MaintenanceRequests SET assigned_technician = ?, assigned_technician_id = ?, dirty = dirty + 1 WHERE request_id = ?",
+                     (technician_name, server_id, request_id))
         execute_query("INSERT INTO Notifications (request_id, recipient_type, recipient_id, message, created_at) VALUES (?, ?, ?, ?, ?)",
                      (request_id, "technician", technician_id, f"تم تعيينك لطلب صيانة رقم #{request_id}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         execute_query("UPDATE Notifications SET is_read = 1 WHERE request_id = ? AND recipient_type = 'engineer'", (request_id,))
 
 def update_request_status(request_id, status, start_time=None, end_time=None):
     if status == "in_progress":
-        execute_query("UPDATE MaintenanceRequests SET status = ?, start_time = ? WHERE request_id = ?", (status, start_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S"), request_id))
+        execute_query("UPDATE MaintenanceRequests SET status = ?, start_time = ?, dirty = dirty + 1 WHERE request_id = ?", (status, start_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S"), request_id))
     elif status == "closed":
-        execute_query("UPDATE MaintenanceRequests SET status = ?, end_time = ? WHERE request_id = ?", (status, end_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S"), request_id))
+        execute_query("UPDATE MaintenanceRequests SET status = ?, end_time = ?, dirty = dirty + 1 WHERE request_id = ?", (status, end_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S"), request_id))
         execute_query("INSERT INTO Notifications (request_id, recipient_type, message, created_at) VALUES (?, ?, ?, ?)",
                      (request_id, "requester", f"تم إغلاق طلب الصيانة #{request_id}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         execute_query("INSERT INTO Notifications (request_id, recipient_type, message, created_at) VALUES (?, ?, ?, ?)",
                      (request_id, "engineer", f"تم إغلاق طلب الصيانة #{request_id}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
     else:
-        execute_query("UPDATE MaintenanceRequests SET status = ? WHERE request_id = ?", (status, request_id))
+        execute_query("UPDATE MaintenanceRequests SET status = ?, dirty = dirty + 1 WHERE request_id = ?", (status, request_id))
 
 def request_spare_part(request_id, part_names):
     for part_name in part_names:
@@ -257,6 +288,60 @@ def mark_notification_read(notification_id):
 def get_requests():
     return execute_query("SELECT * FROM MaintenanceRequests", fetch=True) or []
 
+# ---------- report queries ----------
+REPORT_PAGE_SIZE = 50
+FILTER_DEBOUNCE_SECONDS = 0.3
+REPORT_COLUMNS = [
+    ("request_id", "رقم الطلب"), ("request_date", "تاريخ الطلب"), ("requester_name", "اسم الطالب"),
+    ("phone_number", "رقم الهاتف"), ("branch", "الفرع"), ("maintenance_type", "نوع الصيانة"),
+    ("equipment_name", "اسم المعدة"), ("fault_type", "نوع العطل"), ("notes", "ملاحظات"),
+    ("status", "الحالة"), ("start_time", "وقت البدء"), ("end_time", "وقت الانتهاء"),
+]
+
+def report_filter_sql(status, branch):
+    clauses, params = [], []
+    if status and status != "all":
+        clauses.append("status = ?")
+        params.append(status)
+    if branch and branch != "all":
+        clauses.append("branch = ?")
+        params.append(branch)
+    return clauses, params
+
+def count_report_rows(status, branch):
+    clauses, params = report_filter_sql(status, branch)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    res = execute_query(f"SELECT COUNT(*) FROM MaintenanceRequests{where}", params, fetch=True)
+    return res[0][0] if res else 0
+
+def get_report_page(status, branch, before_id=None, limit=REPORT_PAGE_SIZE):
+    # Newest first; before_id is the last request_id of the previous page, so every page is an index range scan.
+    clauses, params = report_filter_sql(status, branch)
+    if before_id is not None:
+        clauses.append("request_id < ?")
+        params.append(before_id)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    cols = ", ".join(name for name, _ in REPORT_COLUMNS)
+    return execute_query(
+        f"SELECT {cols} FROM MaintenanceRequests{where} ORDER BY request_id DESC LIMIT ?", params + [limit], fetch=True
+    ) or []
+
+def export_report_to_excel(status, branch, path):
+    # Straight from the query, not from the rows on screen (which are only the current page).
+    clauses, params = report_filter_sql(status, branch)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    cols = ", ".join(name for name, _ in REPORT_COLUMNS)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        df = pd.read_sql_query(f"SELECT {cols} FROM MaintenanceRequests{where} ORDER BY request_id DESC", conn, params=params)
+    finally:
+        conn.close()
+    if df.empty:
+        return 0
+    df.columns = [label for _, label in REPORT_COLUMNS]
+    df.to_excel(path, index=False, engine='openpyxl')
+    return len(df)
+
 def get_branch_id(branch_name):
     res = execute_query("SELECT branch_id FROM Branches WHERE branch_name = ?", (branch_name,), fetch=True)
     return res[0][0] if res else None
@@ -300,7 +385,207 @@ def delete_user(user_id):
 def get_users():
     return execute_query("SELECT user_id, username, role, technician_id FROM Users", fetch=True) or []
 
+# ---------- sync with the web app ----------
+SYNC_URL = os.environ.get("MMS_SYNC_URL")
+SYNC_TOKEN = os.environ.get("MMS_SYNC_TOKEN", "")
+SYNC_BATCH_SIZE = 500
+SYNC_FIELDS = ("sync_uuid", "request_date", "requester_name", "phone_number", "branch", "maintenance_type",
+               "equipment_name", "fault_type", "notes", "assigned_technician", "assigned_technician_id", "status",
+               "start_time", "end_time")
+
+class SyncEngine:
+    """Two-way delta sync of MaintenanceRequests with the web app's /api/sync endpoints.
+
+    Push sends only rows changed here since they were last synced (dirty > 0) and
+    stores the server's answer; pull fetches rows the server changed after the last
+    sequence number seen. Conflicts are settled by the server. A row edited while
+    a sync is in flight keeps its new dirty count and goes out next time.
+    Technicians are assigned by the server's id, so each sync first refreshes
+    which local technician has which server id. Edits the server refused are
+    kept in self.rejected; the stored row is the server's.
+    """
+
+    def __init__(self, base_url, token, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.transport = transport or self.http
+        self.rejected = []
+
+    def http(self, method, path, body=None):
+        request = urllib.request.Request(
+            self.base_url + path, method=method,
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def state(self, name, default=None):
+        res = execute_query("SELECT value FROM SyncState WHERE name = ?", (name,), fetch=True)
+        return res[0][0] if res else default
+
+    def store(self, rows, pushed_dirty=None, last_seq=None):
+        # Server rows overwrite local ones only if nobody edited them locally since they were read.
+        pushed_dirty = pushed_dirty or {}
+        columns = SYNC_FIELDS[1:] + ("server_version",)
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            with conn:
+                for row in rows:
+                    values = [row[name] for name in SYNC_FIELDS[1:]] + [row["version"]]
+                    updated = conn.execute(
+                        f"UPDATE MaintenanceRequests SET {', '.join(f'{name} = ?' for name in columns)}, dirty = 0 "
+                        "WHERE sync_uuid = ? AND dirty = ?",
+                        values + [row["sync_uuid"], pushed_dirty.get(row["sync_uuid"], 0)],
+                    ).rowcount
+                    if not updated and row["sync_uuid"] in pushed_dirty:
+                        # Edited again while being pushed: keep the edit, but it now builds on this version.
+                        conn.execute("UPDATE MaintenanceRequests SET server_version = ? WHERE sync_uuid = ?", (row["version"], row["sync_uuid"]))
+                    elif not updated:
+                        conn.execute(
+                            f"INSERT OR IGNORE INTO MaintenanceRequests (sync_uuid, {', '.join(columns)}) "
+                            f"VALUES ({', '.join('?' * (len(columns) + 1))})",
+                            [row["sync_uuid"]] + values,
+                        )
+                if last_seq is not None:
+                    conn.execute("INSERT OR REPLACE INTO SyncState (name, value) VALUES ('last_seq', ?)", (last_seq,))
+        finally:
+            conn.close()
+
+    def pull_technicians(self):
+        # Matched by server id, then by phone number, which is unique on both sides.
+        technicians = self.transport("GET", "/api/sync/technicians")["technicians"]
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            with conn:
+                for t in technicians:
+                    conn.execute("INSERT OR IGNORE INTO Branches (branch_name) VALUES (?)", (t["branch_name"],))
+                    branch_id = conn.execute("SELECT branch_id FROM Branches WHERE branch_name = ?", (t["branch_name"],)).fetchone()[0]
+                    values = (t["technician_name"], branch_id, t["technician_id"])
+                    if conn.execute("UPDATE Technicians SET technician_name = ?, branch_id = ? WHERE server_id = ?", values).rowcount:
+                        continue
+                    if conn.execute("UPDATE Technicians SET technician_name = ?, branch_id = ?, server_id = ? "
+                                    "WHERE phone_number = ? AND server_id IS NULL", values + (t["phone_number"],)).rowcount:
+                        continue
+                    conn.execute("INSERT OR IGNORE INTO Technicians (technician_name, branch_id, server_id, phone_number) VALUES (?, ?, ?, ?)",
+                                 values + (t["phone_number"],))
+                # Local assignments made before their technician had a server id.
+                conn.execute(
+                    "UPDATE MaintenanceRequests SET assigned_technician_id = "
+                    "(SELECT server_id FROM Technicians WHERE technician_name = assigned_technician) "
+                    "WHERE dirty > 0 AND assigned_technician_id IS NULL AND assigned_technician IS NOT NULL"
+                )
+        finally:
+            conn.close()
+        return len(technicians)
+
+    def push(self):
+        pushed = 0
+        while True:
+            rows = execute_query(
+                f"SELECT {', '.join(SYNC_FIELDS)}, server_version, dirty FROM MaintenanceRequests "
+                "WHERE dirty > 0 ORDER BY request_id LIMIT ?", (SYNC_BATCH_SIZE,), fetch=True
+            ) or []
+            if not rows:
+                return pushed
+            changes = [dict(zip(SYNC_FIELDS + ("base_version",), row[:-1])) for row in rows]
+            result = self.transport("POST", "/api/sync/push", {"client_id": self.state("client_id"), "changes": changes})
+            self.store(result["rows"], pushed_dirty={row[0]: row[-1] for row in rows})
+            self.rejected.extend(result.get("rejected", []))
+            for entry in result.get("rejected", []):
+                print("Sync: server kept its values of", ", ".join(entry["fields"]), "for", entry["sync_uuid"])
+            pushed += len(rows)
+
+    def pull(self):
+        since, client_id, pulled = self.state("last_seq", 0), self.state("client_id"), 0
+        while True:
+            result = self.transport("GET", f"/api/sync?since={since}&limit={SYNC_BATCH_SIZE}&client={client_id}")
+            since = result["next_since"]
+            self.store(result["changes"], last_seq=since)
+            pulled += len(result["changes"])
+            if not result["has_more"]:
+                return pulled
+
+    def sync(self):
+        self.pull_technicians()
+        return self.push(), self.pull()
+
+sync_engine = SyncEngine(SYNC_URL, SYNC_TOKEN) if SYNC_URL else None
+
 # ---------- Flet UI ----------
+# ---------- background DB worker ----------
+class DbExecutor:
+    """Runs database work on one background thread, so click handlers return at once.
+
+    One thread keeps SQLite writes in the order they were made, and a refresh
+    submitted after a write always sees it. Callbacks run on that thread when the
+    work is done; Flet controls may be updated from any thread.
+    """
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self.lock = threading.Lock()
+        self.refreshes = {}
+        self.submitted = 0
+        self.completed = 0
+
+    def submit(self, fn, *args, then=None, on_error=None):
+        def run():
+            try:
+                result = fn(*args)
+            except Exception as e:
+                print("DB worker error:", e)
+                if on_error:
+                    on_error(e)
+                return None
+            finally:
+                with self.lock:
+                    self.completed += 1
+            if then:
+                then(result)
+            return result
+        with self.lock:
+            self.submitted += 1
+            return self.pool.submit(run)
+
+    def refresh(self, key, fn, then):
+        # Coalesced: while a refresh for key is waiting, new requests replace its fn/then instead of
+        # queueing another one. It still runs after every write submitted before the latest request,
+        # and if a request comes in while it runs, it runs once more and the stale result is dropped.
+        with self.lock:
+            state = self.refreshes.get(key)
+            if state:
+                state.update(fn=fn, then=then, after=self.submitted, again=True)
+                return
+            state = self.refreshes[key] = {"fn": fn, "then": then, "after": self.submitted, "again": False}
+
+        def run():
+            with self.lock:
+                if self.completed < state["after"]:
+                    # A write it must see is still queued behind it.
+                    self.pool.submit(run)
+                    return
+                fn, then = state["fn"], state["then"]
+                state["again"] = False
+            try:
+                result = fn()
+            except Exception as e:
+                print("DB worker error:", e)
+                result = failed = e
+            else:
+                failed = None
+            with self.lock:
+                if state["again"]:
+                    self.pool.submit(run)
+                    return
+                del self.refreshes[key]
+            if failed is None:
+                then(result)
+
+        self.pool.submit(run)
+
+db_executor = DbExecutor()
+
 def main(page: ft.Page):
     page.title = "تطبيق إدارة الصيانة"
     page.window_width = 1000
@@ -320,73 +605,91 @@ def main(page: ft.Page):
         snack.open = True
         page_obj.update()
 
+    def show_view(build):
+        # Builds the view, and runs its queries, on the DB thread; the page only swaps in the finished view.
+        def apply(view):
+            page.views.clear()
+            page.views.append(view)
+            page.update()
+        db_executor.refresh("view", build, apply)
+
+    def run_then_show(work, message, build):
+        # The write, its message and the refreshed view, all off the UI thread.
+        db_executor.submit(work, then=lambda result: show_snackbar(page, message(result) if callable(message) else message))
+        show_view(build)
+
+    def sync_now(e):
+        # Runs on the DB thread, so local writes made before the click are pushed.
+        db_executor.submit(
+            sync_engine.sync,
+            then=lambda result: show_snackbar(page, f"تمت المزامنة: أُرسل {result[0]} واستُلم {result[1]} طلب"),
+            on_error=lambda error: show_snackbar(page, "تعذرت المزامنة مع الخادم"),
+        )
+
     def logout(e):
         page.session.clear()
-        page.views.clear()
         show_snackbar(page, "تم تسجيل الخروج بنجاح")
-        page.views.append(login_view())
-        page.update()
+        show_view(login_view)
 
     def route_change(route):
         role = page.session.get("user_role") or None
-        page.views.clear()
         print(f"Navigating to route: {page.route}, Role: {role}")  # Debug
         if page.route == "/login" or not role:
             print("Rendering login_view")  # Debug
-            page.views.append(login_view())
+            build = login_view
         elif page.route == "/":
             print("Rendering main_menu_view")  # Debug
-            page.views.append(main_menu_view())
+            build = main_menu_view
         elif page.route == "/create_request" and role in ["engineer", "branch", "admin"]:
             print("Rendering create_request_view")  # Debug
-            page.views.append(create_request_view())
+            build = create_request_view
         elif page.route == "/manage_data" and role in ["engineer", "admin"]:
             print("Rendering manage_data_view")  # Debug
-            page.views.append(manage_data_view())
+            build = manage_data_view
         elif page.route == "/report" and role in ["engineer", "admin"]:
             print("Rendering report_view")  # Debug
-            page.views.append(report_view())
+            build = report_view
         elif page.route == "/engineer" and role in ["engineer", "admin"]:
             print("Rendering engineer_view")  # Debug
-            page.views.append(engineer_view())
+            build = engineer_view
         elif page.route == "/technician" and role in ["technician", "admin"]:
             print("Rendering technician_view")  # Debug
-            page.views.append(technician_view())
+            build = technician_view
         elif page.route == "/store" and role in ["store", "admin"]:
             print("Rendering store_view")  # Debug
-            page.views.append(store_view())
+            build = store_view
         elif page.route == "/purchase_orders" and role in ["engineer", "admin"]:
             print("Rendering purchase_orders_view")  # Debug
-            page.views.append(purchase_orders_view())
+            build = purchase_orders_view
         elif page.route == "/branch" and role in ["branch", "admin"]:
             print("Rendering branch_view")  # Debug
-            page.views.append(branch_view())
+            build = branch_view
         elif page.route == "/manage_users" and role == "admin":
             print("Rendering manage_users_view")  # Debug
-            page.views.append(manage_users_view())
+            build = manage_users_view
         elif page.route == "/manage_technicians" and role == "admin":
             print("Rendering manage_technicians_view")  # Debug
-            page.views.append(manage_technicians_view())
+            build = manage_technicians_view
         elif page.route == "/add_branch" and role == "admin":
             print("Rendering add_branch_view")  # Debug
-            page.views.append(add_branch_view())
+            build = add_branch_view
         elif page.route == "/add_maintenance_type" and role == "admin":
             print("Rendering add_maintenance_type_view")  # Debug
-            page.views.append(add_maintenance_type_view())
+            build = add_maintenance_type_view
         elif page.route == "/add_equipment" and role == "admin":
             print("Rendering add_equipment_name_view")  # Debug
-            page.views.append(add_equipment_name_view())
+            build = add_equipment_name_view
         elif page.route == "/add_fault_type" and role == "admin":
             print("Rendering add_fault_type_view")  # Debug
-            page.views.append(add_fault_type_view())
+            build = add_fault_type_view
         elif page.route == "/add_spare_part" and role == "admin":
             print("Rendering add_spare_part_view")  # Debug
-            page.views.append(add_spare_part_view())
+            build = add_spare_part_view
         else:
             print("Rendering default main_menu_view")  # Debug
             show_snackbar(page, "غير مصرح لك بالوصول إلى هذه الصفحة")
-            page.views.append(main_menu_view())
-        page.update()
+            build = main_menu_view
+        show_view(build)
 
     page.on_route_change = route_change
     page.go("/login")
@@ -396,15 +699,14 @@ def main(page: ft.Page):
         username = ft.TextField(label="اسم المستخدم", width=300, text_align=ft.TextAlign.RIGHT, autofocus=True)
         password = ft.TextField(label="كلمة المرور", password=True, width=300, text_align=ft.TextAlign.RIGHT)
         def login(e):
-            auth_result = authenticate_user(username.value, password.value)
+            db_executor.submit(authenticate_user, username.value, password.value, then=on_login)
+        def on_login(auth_result):
             if auth_result:
                 role, technician_id = auth_result
                 page.session.set("user_role", role)
                 if role == "technician" and technician_id:
                     page.session.set("technician_id", technician_id)
-                page.views.clear()
-                page.views.append(main_menu_view())
-                page.update()
+                show_view(main_menu_view)
             else:
                 show_snackbar(page, "اسم المستخدم أو كلمة المرور غير صحيحة")
         return ft.View("/login", [
@@ -431,6 +733,8 @@ def main(page: ft.Page):
                 ft.ElevatedButton("لوحة المهندس", on_click=lambda e: page.go("/engineer")),
                 ft.ElevatedButton("إدارة البيانات", on_click=lambda e: page.go("/manage_data"))
             ])
+        if sync_engine and role in ["engineer", "admin"]:
+            buttons.append(ft.ElevatedButton("مزامنة مع الخادم", icon=ft.Icons.SYNC, on_click=sync_now))
         if role in ["technician", "admin"]:
             buttons.append(ft.ElevatedButton("لوحة الفني", on_click=lambda e: page.go("/technician")))
         if role in ["store", "admin"]:
@@ -478,11 +782,7 @@ def main(page: ft.Page):
                 "fault_type": fault_type.value,
                 "notes": notes.value
             }
-            request_id = add_request(data)
-            show_snackbar(page, f"تم إنشاء الطلب #{request_id} بنجاح")
-            page.views.clear()
-            page.views.append(main_menu_view())
-            page.update()
+            run_then_show(lambda: add_request(data), lambda request_id: f"تم إنشاء الطلب #{request_id} بنجاح", main_menu_view)
         return ft.View("/create_request", [
             ft.AppBar(actions=[ft.IconButton(icon=ft.Icons.LOGOUT, on_click=logout)], automatically_imply_leading=False, title=ft.Text("إنشاء طلب صيانة", style=ft.TextStyle(weight=ft.FontWeight.BOLD))),
             ft.Container(
@@ -502,8 +802,8 @@ def main(page: ft.Page):
         field = ft.TextField(label=label_text, width=300, text_align=ft.TextAlign.RIGHT)
         def submit(e):
             if field.value:
-                add_fn(field.value)
-                show_snackbar(page, f"تم إضافة {field.value}")
+                value = field.value
+                db_executor.submit(add_fn, value, then=lambda _: show_snackbar(page, f"تم إضافة {value}"))
                 page.go("/")
             else:
                 show_snackbar(page, "يرجى إدخال القيمة")
@@ -536,17 +836,10 @@ def main(page: ft.Page):
             rid, name = rec[0], rec[1]
             name_tf = ft.TextField(value=name, width=200, text_align=ft.TextAlign.RIGHT)
             def do_update(e, rid=rid, tf=name_tf):
-                update_fn(rid, tf.value)
-                show_snackbar(page, f"تم تحديث '{tf.value}'")
-                page.views.clear()
-                page.views.append(manage_data_view())
-                page.update()
+                value = tf.value
+                run_then_show(lambda: update_fn(rid, value), f"تم تحديث '{value}'", manage_data_view)
             def do_delete(e, rid=rid):
-                delete_fn(rid)
-                show_snackbar(page, "تم الحذف")
-                page.views.clear()
-                page.views.append(manage_data_view())
-                page.update()
+                run_then_show(lambda: delete_fn(rid), "تم الحذف", manage_data_view)
             rows.append(
                 ft.DataRow(
                     cells=[
@@ -621,26 +914,21 @@ def main(page: ft.Page):
                 if not uname_tf.value.strip():
                     show_snackbar(page, "اسم المستخدم لا يمكن أن يكون فارغًا")
                     return
-                if pass_tf.value:
-                    new_pass = pass_tf.value
-                else:
-                    res = execute_query("SELECT password FROM Users WHERE user_id=?", (uid,), fetch=True)
-                    new_pass = res[0][0] if res and res[0] else ""
+                uname, password, role = uname_tf.value.strip(), pass_tf.value, role_dd.value
                 tech_id = int(technician_dd.value) if technician_dd.value and technician_dd.value != "NULL" else None
-                res_upd = update_user(uid, uname_tf.value.strip(), new_pass, role_dd.value, tech_id)
-                if res_upd is None:
-                    show_snackbar(page, "خطأ أثناء تحديث المستخدم (ربما اسم المستخدم موجود مسبقًا)")
-                else:
-                    show_snackbar(page, f"تم تحديث المستخدم '{uname_tf.value}'")
-                page.views.clear()
-                page.views.append(manage_users_view())
-                page.update()
+                def work():
+                    new_pass = password
+                    if not new_pass:
+                        res = execute_query("SELECT password FROM Users WHERE user_id=?", (uid,), fetch=True)
+                        new_pass = res[0][0] if res and res[0] else ""
+                    return update_user(uid, uname, new_pass, role, tech_id)
+                run_then_show(
+                    work,
+                    lambda res_upd: "خطأ أثناء تحديث المستخدم (ربما اسم المستخدم موجود مسبقًا)" if res_upd is None else f"تم تحديث المستخدم '{uname}'",
+                    manage_users_view
+                )
             def do_delete(e, uid=uid):
-                delete_user(uid)
-                show_snackbar(page, "تم حذف المستخدم")
-                page.views.clear()
-                page.views.append(manage_users_view())
-                page.update()
+                run_then_show(lambda: delete_user(uid), "تم حذف المستخدم", manage_users_view)
             rows.append(
                 ft.DataRow(
                     cells=[
@@ -690,14 +978,12 @@ def main(page: ft.Page):
                 show_snackbar(page, "يرجى إدخال جميع بيانات المستخدم الجديد")
                 return
             tech_id = int(new_technician.value) if new_technician.value and new_technician.value != "NULL" else None
-            res = add_user(new_username.value.strip(), new_password.value, new_role.value, tech_id)
-            if res is None:
-                show_snackbar(page, "خطأ أثناء إضافة المستخدم (اسم المستخدم قد يكون موجودًا)")
-            else:
-                show_snackbar(page, "تم إضافة المستخدم بنجاح")
-            page.views.clear()
-            page.views.append(manage_users_view())
-            page.update()
+            user = (new_username.value.strip(), new_password.value, new_role.value, tech_id)
+            run_then_show(
+                lambda: add_user(*user),
+                lambda res: "خطأ أثناء إضافة المستخدم (اسم المستخدم قد يكون موجودًا)" if res is None else "تم إضافة المستخدم بنجاح",
+                manage_users_view
+            )
         return ft.View("/manage_users", [
             ft.AppBar(actions=[ft.IconButton(icon=ft.Icons.LOGOUT, on_click=logout)], automatically_imply_leading=False, title=ft.Text("إدارة المستخدمين", style=ft.TextStyle(weight=ft.FontWeight.BOLD))),
             ft.Container(
@@ -730,17 +1016,10 @@ def main(page: ft.Page):
                 width=180, text_align=ft.TextAlign.RIGHT
             )
             def do_update(e, tid=tid, name_tf=name_tf, phone_tf=phone_tf, branch_dd=branch_dd):
-                update_technician(tid, name_tf.value, phone_tf.value, int(branch_dd.value))
-                show_snackbar(page, f"تم تحديث الفني '{name_tf.value}'")
-                page.views.clear()
-                page.views.append(manage_technicians_view())
-                page.update()
+                technician = (tid, name_tf.value, phone_tf.value, int(branch_dd.value))
+                run_then_show(lambda: update_technician(*technician), f"تم تحديث الفني '{name_tf.value}'", manage_technicians_view)
             def do_delete(e, tid=tid):
-                delete_technician(tid)
-                show_snackbar(page, "تم حذف الفني")
-                page.views.clear()
-                page.views.append(manage_technicians_view())
-                page.update()
+                run_then_show(lambda: delete_technician(tid), "تم حذف الفني", manage_technicians_view)
             rows.append(
                 ft.DataRow(
                     cells=[
@@ -772,11 +1051,8 @@ def main(page: ft.Page):
             if not (new_name.value and new_phone.value and new_branch.value):
                 show_snackbar(page, "يرجى إدخال جميع بيانات الفني الجديد")
                 return
-            add_technician(new_name.value, new_phone.value, int(new_branch.value))
-            show_snackbar(page, "تم إضافة الفني بنجاح")
-            page.views.clear()
-            page.views.append(manage_technicians_view())
-            page.update()
+            technician = (new_name.value, new_phone.value, int(new_branch.value))
+            run_then_show(lambda: add_technician(*technician), "تم إضافة الفني بنجاح", manage_technicians_view)
         return ft.View("/manage_technicians", [
             ft.AppBar(actions=[ft.IconButton(icon=ft.Icons.LOGOUT, on_click=logout)], automatically_imply_leading=False, title=ft.Text("إدارة الفنيين", style=ft.TextStyle(weight=ft.FontWeight.BOLD))),
             ft.Container(
@@ -810,136 +1086,97 @@ def main(page: ft.Page):
             options=[ft.dropdown.Option("all", "الكل")] + [ft.dropdown.Option(b[1], b[1]) for b in get_branches()],
             value="all", width=200, text_align=ft.TextAlign.RIGHT
         )
-        def get_report_rows():
-            rows = []
-            for req in get_requests():
-                if status_filter.value != "all" and req[10] != status_filter.value: continue
-                if branch_filter.value != "all" and req[4] != branch_filter.value: continue
-                rows.append(
-                    ft.DataRow(
-                        cells=[
-                            ft.DataCell(ft.Text(str(req[0]))),
-                            ft.DataCell(ft.Text(req[1])),
-                            ft.DataCell(ft.Text(req[2])),
-                            ft.DataCell(ft.Text(req[3])),
-                            ft.DataCell(ft.Text(req[4])),
-                            ft.DataCell(ft.Text(req[5])),
-                            ft.DataCell(ft.Text(req[6])),
-                            ft.DataCell(ft.Text(req[7])),
-                            ft.DataCell(ft.Text(req[10]))
-                        ]
-                    )
-                )
-            return rows
-        rows = get_report_rows()
-        table_content = ft.Text("لا توجد بيانات متاحة للعرض") if not rows else ft.DataTable(
-            columns=[
-                ft.DataColumn(ft.Text("رقم الطلب")),
-                ft.DataColumn(ft.Text("التاريخ")),
-                ft.DataColumn(ft.Text("الطالب")),
-                ft.DataColumn(ft.Text("الهاتف")),
-                ft.DataColumn(ft.Text("الفرع")),
-                ft.DataColumn(ft.Text("نوع الصيانة")),
-                ft.DataColumn(ft.Text("المعدة")),
-                ft.DataColumn(ft.Text("العطل")),
-                ft.DataColumn(ft.Text("الحالة"))
-            ],
-            rows=rows,
+        # Only one page of rows is ever built; cursors[-1] is the request_id the current page starts below.
+        state = {"cursors": [None], "next_cursor": None, "total": 0, "debounce": None}
+        table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(label)) for _, label in REPORT_COLUMNS],
+            rows=[],
             border=ft.border.all(1, ft.Colors.GREY_400),
             heading_row_color=ft.Colors.BLUE_50,
             data_row_color=ft.Colors.WHITE,
             expand=True
         )
-        def update_report(e):
-            page.views.clear()
-            page.views.append(report_view())
-            page.update()
+        empty_text = ft.Text("لا توجد بيانات متاحة للعرض", visible=False)
+        page_text = ft.Text()
+        prev_button = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="الصفحة السابقة")
+        next_button = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="الصفحة التالية")
+
+        def fetch_page():
+            rows = get_report_page(status_filter.value, branch_filter.value, state["cursors"][-1], REPORT_PAGE_SIZE + 1)
+            total = count_report_rows(status_filter.value, branch_filter.value) if len(state["cursors"]) == 1 else None
+            return rows, total
+
+        def show_page(result, refresh=True):
+            rows, total = result
+            if total is not None:
+                state["total"] = total
+            has_next = len(rows) > REPORT_PAGE_SIZE
+            rows = rows[:REPORT_PAGE_SIZE]
+            table.rows = [
+                ft.DataRow(cells=[ft.DataCell(ft.Text("غير محدد" if value is None else str(value))) for value in row])
+                for row in rows
+            ]
+            state["next_cursor"] = rows[-1][0] if has_next else None
+            first = (len(state["cursors"]) - 1) * REPORT_PAGE_SIZE + 1
+            page_text.value = f"{first} - {first + len(rows) - 1} من {state['total']}" if rows else ""
+            table.visible, empty_text.visible = bool(rows), not rows
+            prev_button.disabled = len(state["cursors"]) == 1
+            next_button.disabled = not has_next
+            if refresh:
+                page.update()
+
+        def load_page():
+            db_executor.refresh("report_page", fetch_page, show_page)
+
+        def reload():
+            state["cursors"] = [None]
+            load_page()
+
+        def next_page(e):
+            if state["next_cursor"] is not None:
+                state["cursors"].append(state["next_cursor"])
+                state["next_cursor"] = None
+                load_page()
+
+        def prev_page(e):
+            if len(state["cursors"]) > 1:
+                state["cursors"].pop()
+                load_page()
+
+        def on_filter_change(e):
+            # Several quick changes only run the query once, after the last one.
+            if state["debounce"]:
+                state["debounce"].cancel()
+            state["debounce"] = threading.Timer(FILTER_DEBOUNCE_SECONDS, reload)
+            state["debounce"].start()
+
         def export_report(e):
-            data = []
-            for req in get_requests():
-                if status_filter.value != "all" and req[10] != status_filter.value: continue
-                if branch_filter.value != "all" and req[4] != branch_filter.value: continue
-                data.append({
-                    "رقم الطلب": req[0], "التاريخ": req[1], "الطالب": req[2],
-                    "الهاتف": req[3], "الفرع": req[4], "نوع الصيانة": req[5],
-                    "المعدة": req[6], "العطل": req[7], "الحالة": req[10]
-                })
-            df = pd.DataFrame(data)
-            df.to_excel("maintenance_report.xlsx", index=False, engine='openpyxl')
-            show_snackbar(page, "تم تصدير التقرير إلى maintenance_report.xlsx")
+            def done(count):
+                if not count:
+                    show_snackbar(page, "لا توجد بيانات لتصديرها")
+                    return
+                show_snackbar(page, f"تم تصدير {count} طلب إلى maintenance_report.xlsx")
+            show_snackbar(page, "جاري تصدير التقرير...")
+            db_executor.submit(export_report_to_excel, status_filter.value, branch_filter.value, "maintenance_report.xlsx", then=done)
+
+        status_filter.on_change = on_filter_change
+        branch_filter.on_change = on_filter_change
+        prev_button.on_click = prev_page
+        next_button.on_click = next_page
+        # report_view itself is built on the DB thread (see show_view), so the first page is fetched inline.
+        show_page(fetch_page(), refresh=False)
         return ft.View("/report", [
             ft.AppBar(actions=[ft.IconButton(icon=ft.Icons.LOGOUT, on_click=logout)], automatically_imply_leading=False, title=ft.Text("تقرير طلبات الصيانة", style=ft.TextStyle(weight=ft.FontWeight.BOLD))),
             ft.Container(
                 content=ft.Column([
                     ft.Row([status_filter, branch_filter], alignment=ft.MainAxisAlignment.CENTER),
                     ft.Row([
-                        ft.ElevatedButton("تحديث التقرير", icon=ft.Icons.REFRESH, on_click=update_report),
-                        ft.ElevatedButton("تصدير التقرير", icon=ft.Icons.DOWNLOAD, on_click=export_report)
+                        ft.ElevatedButton("تحديث التقرير", icon=ft.Icons.REFRESH, on_click=lambda e: reload()),
+                        ft.ElevatedButton("تصدير إلى Excel", icon=ft.Icons.TABLE_CHART, on_click=export_report)
                     ], alignment=ft.MainAxisAlignment.CENTER),
-                    table_content,
-                    ft.ElevatedButton("رجوع", icon=ft.Icons.ARROW_BACK, on_click=lambda e: page.go("/"))
-                ], scroll=ft.ScrollMode.AUTO, spacing=20),
-                padding=20, expand=True
-            )
-        ])
-        def on_filter_change(e):
-            page.views.clear()
-            page.views.append(report_view())
-            page.update()
-        status_filter.on_change = on_filter_change
-        rows = []
-        for r in get_report_rows():
-            rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(r[0]))),
-                        ft.DataCell(ft.Text(r[1])),
-                        ft.DataCell(ft.Text(r[2])),
-                        ft.DataCell(ft.Text(r[3])),
-                        ft.DataCell(ft.Text(r[4])),
-                        ft.DataCell(ft.Text(r[5])),
-                        ft.DataCell(ft.Text(r[6])),
-                        ft.DataCell(ft.Text(r[7])),
-                        ft.DataCell(ft.Text(r[8] or "غير محدد")),
-                        ft.DataCell(ft.Text(r[10])),
-                        ft.DataCell(ft.Text(r[11] or "غير محدد")),
-                        ft.DataCell(ft.Text(r[12] or "غير محدد"))
-                    ]
-                )
-            )
-        print(f"report_view: Number of rows = {len(rows)}")  # Debug
-        table_content = ft.Text("لا توجد بيانات متاحة للعرض") if not rows else ft.DataTable(
-            columns=[
-                ft.DataColumn(ft.Text("رقم الطلب")),
-                ft.DataColumn(ft.Text("تاريخ الطلب")),
-                ft.DataColumn(ft.Text("اسم الطالب")),
-                ft.DataColumn(ft.Text("رقم الهاتف")),
-                ft.DataColumn(ft.Text("الفرع")),
-                ft.DataColumn(ft.Text("نوع الصيانة")),
-                ft.DataColumn(ft.Text("اسم المعدة")),
-                ft.DataColumn(ft.Text("نوع العطل")),
-                ft.DataColumn(ft.Text("ملاحظات")),
-                ft.DataColumn(ft.Text("الحالة")),
-                ft.DataColumn(ft.Text("وقت البدء")),
-                ft.DataColumn(ft.Text("وقت الانتهاء"))
-            ],
-            rows=rows,
-            expand=True
-        )
-        def export_to_excel(e):
-            if not rows:
-                show_snackbar(page, "لا توجد بيانات لتصديرها")
-                return
-            df = pd.DataFrame([r.cells for r in rows], columns=[c.label.value for c in table_content.columns])
-            df.to_excel("maintenance_report.xlsx", index=False)
-            show_snackbar(page, "تم تصدير التقرير إلى maintenance_report.xlsx")
-        return ft.View("/report", [
-            ft.AppBar(actions=[ft.IconButton(icon=ft.Icons.LOGOUT, on_click=logout)], automatically_imply_leading=False, title=ft.Text("تقرير طلبات الصيانة", style=ft.TextStyle(weight=ft.FontWeight.BOLD))),
-            ft.Container(
-                content=ft.Column([
-                    status_filter,
-                    table_content,
-                    ft.ElevatedButton("تصدير إلى Excel", icon=ft.Icons.TABLE_CHART, on_click=export_to_excel),
+                    table,
+                    empty_text,
+                    ft.Row([prev_button, page_text, next_button], alignment=ft.MainAxisAlignment.CENTER),
                     ft.ElevatedButton("رجوع", icon=ft.Icons.ARROW_BACK, on_click=lambda e: page.go("/"))
                 ], scroll=ft.ScrollMode.AUTO, spacing=20),
                 padding=20, expand=True
@@ -965,25 +1202,27 @@ def main(page: ft.Page):
             )
             def assign(e, request_id=request_id, technician_dd=technician_dd):
                 if technician_dd.value:
-                    assign_technician(request_id, technician_dd.value)
-                    mark_notification_read(nid)
-                    show_snackbar(page, f"تم تعيين الفني لطلب #{request_id}")
-                    page.views.clear()
-                    page.views.append(engineer_view())
-                    page.update()
+                    technician_name = technician_dd.value
+                    def work():
+                        assign_technician(request_id, technician_name)
+                        mark_notification_read(nid)
+                    run_then_show(work, f"تم تعيين الفني لطلب #{request_id}", engineer_view)
             def create_purchase_order(e, request_id=request_id):
-                # استرجاع الأصناف غير المتوفرة
-                unavailable_parts = execute_query("SELECT part_name FROM SparePartsRequests WHERE request_id = ? AND status = 'unavailable'", (request_id,), fetch=True)
-                parts_list = ', '.join([p[0] for p in unavailable_parts]) if unavailable_parts else ""
-                if parts_list:
-                    add_purchase_order(request_id, parts_list, parts_list)
-                    execute_query("INSERT INTO Notifications (request_id, recipient_type, message, created_at) VALUES (?, ?, ?, ?)",
-                                 (request_id, "admin", f"طلب شراء جديد #{request_id} للأصناف: {parts_list}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-                    mark_notification_read(nid)
-                    show_snackbar(page, f"تم إنشاء طلب شراء للطلب #{request_id}")
-                    page.views.clear()
-                    page.views.append(engineer_view())
-                    page.update()
+                def work():
+                    # استرجاع الأصناف غير المتوفرة
+                    unavailable_parts = execute_query("SELECT part_name FROM SparePartsRequests WHERE request_id = ? AND status = 'unavailable'", (request_id,), fetch=True)
+                    parts_list = ', '.join([p[0] for p in unavailable_parts]) if unavailable_parts else ""
+                    if parts_list:
+                        add_purchase_order(request_id, parts_list, parts_list)
+                        execute_query("INSERT INTO Notifications (request_id, recipient_type, message, created_at) VALUES (?, ?, ?, ?)",
+                                     (request_id, "admin", f"طلب شراء جديد #{request_id} للأصناف: {parts_list}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                        mark_notification_read(nid)
+                    return parts_list
+                def done(parts_list):
+                    if parts_list:
+                        show_snackbar(page, f"تم إنشاء طلب شراء للطلب #{request_id}")
+                        show_view(engineer_view)
+                db_executor.submit(work, then=done)
             buttons = [
                 ft.ElevatedButton("تعيين", on_click=assign) if r[10] == "open" else None,
                 ft.ElevatedButton("موافقة على الشراء", on_click=create_purchase_order) if "الأصناف غير المتوفرة" in message else None
@@ -1054,23 +1293,20 @@ def main(page: ft.Page):
                 padding=5
             )
             def change_status(e, request_id=request_id, status=None):
-                update_request_status(request_id, status)
-                mark_notification_read(nid)
-                show_snackbar(page, f"تم تحديث حالة الطلب #{request_id} إلى {status}")
-                page.views.clear()
-                page.views.append(technician_view())
-                page.update()
+                def work():
+                    update_request_status(request_id, status)
+                    mark_notification_read(nid)
+                run_then_show(work, f"تم تحديث حالة الطلب #{request_id} إلى {status}", technician_view)
             def request_parts(e, request_id=request_id):
                 if not selected_parts:
                     show_snackbar(page, "يرجى اختيار قطعة غيار واحدة على الأقل")
                     return
-                request_spare_part(request_id, selected_parts)
-                update_request_status(request_id, "waiting")
-                mark_notification_read(nid)
-                show_snackbar(page, f"تم طلب قطع الغيار للطلب #{request_id}")
-                page.views.clear()
-                page.views.append(technician_view())
-                page.update()
+                parts = list(selected_parts)
+                def work():
+                    request_spare_part(request_id, parts)
+                    update_request_status(request_id, "waiting")
+                    mark_notification_read(nid)
+                run_then_show(work, f"تم طلب قطع الغيار للطلب #{request_id}", technician_view)
             buttons = []
             if r[10] == "open":
                 buttons.append(ft.ElevatedButton("بدء العمل", on_click=lambda e: change_status(e, request_id, "in_progress")))
@@ -1129,12 +1365,10 @@ def main(page: ft.Page):
                 if s_request_id != request_id:
                     continue
                 def update_part_status(e, srid=srid, status=None):
-                    update_spare_part_status(srid, status)
-                    mark_notification_read(nid)
-                    show_snackbar(page, f"تم تحديث حالة قطعة الغيار '{part_name}' إلى {status}")
-                    page.views.clear()
-                    page.views.append(store_view())
-                    page.update()
+                    def work():
+                        update_spare_part_status(srid, status)
+                        mark_notification_read(nid)
+                    run_then_show(work, f"تم تحديث حالة قطعة الغيار '{part_name}' إلى {status}", store_view)
                 rows.append(
                     ft.DataRow(
                         cells=[
@@ -1177,17 +1411,9 @@ def main(page: ft.Page):
         for po in get_purchase_orders():
             po_id, request_id, part_name, details, created_at, status = po
             def approve_purchase(e, po_id=po_id, request_id=request_id):
-                update_purchase_order_status(po_id, "approved", request_id)
-                show_snackbar(page, f"تم الموافقة على طلب الشراء #{po_id}")
-                page.views.clear()
-                page.views.append(purchase_orders_view())
-                page.update()
+                run_then_show(lambda: update_purchase_order_status(po_id, "approved", request_id), f"تم الموافقة على طلب الشراء #{po_id}", purchase_orders_view)
             def reject_purchase(e, po_id=po_id, request_id=request_id):
-                update_purchase_order_status(po_id, "rejected", request_id)
-                show_snackbar(page, f"تم رفض طلب الشراء #{po_id}")
-                page.views.clear()
-                page.views.append(purchase_orders_view())
-                page.update()
+                run_then_show(lambda: update_purchase_order_status(po_id, "rejected", request_id), f"تم رفض طلب الشراء #{po_id}", purchase_orders_view)
             rows.append(
                 ft.DataRow(
                     cells=[
@@ -1238,12 +1464,8 @@ def main(page: ft.Page):
         rows = []
         for n in notifications:
             nid, request_id, _, _, message, created_at, _ = n
-            def mark_read(e, nid=nid):
-                mark_notification_read(nid)
-                show_snackbar(page, f"تم تحديد الإشعار #{request_id} كمقروء")
-                page.views.clear()
-                page.views.append(branch_view())
-                page.update()
+            def mark_read(e, nid=nid, request_id=request_id):
+                run_then_show(lambda: mark_notification_read(nid), f"تم تحديد الإشعار #{request_id} كمقروء", branch_view)
             rows.append(
                 ft.DataRow(
                     cells=[
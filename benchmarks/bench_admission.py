@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Interactive latency during a report storm against gunicorn, with and without ADMISSION_CONTROL.
+
+    python benchmarks/bench_admission.py --workers 2 --storm 8 --seconds 15
+"""
+
+import argparse
+import http.cookiejar
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def populate(env, rows):
+    """Create and fill the database in a child process, so this one never imports the app."""
+    script = (
+        "import io, web_app\n"
+        "with web_app.app.app_context():\n"
+        "    web_app.db.create_all(); web_app.ensure_search_index(); web_app.seed_data()\n"
+        "    rows = ''.join(f'2024-01-01 08:00:00,R{i},0100,Main Branch,Corrective,Machine A,Electrical,closed\\n'"
+        f"  for i in range({rows}))\n"
+        "    web_app.import_csv('requests', io.StringIO("
+        "'request_date,requester_name,phone_number,branch,maintenance_type,equipment_name,fault_type,status\\n' + rows))\n"
+    )
+    subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT, check=True)
+
+
+def logged_in_opener(base_url):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    page = opener.open(base_url + "/login").read().decode()
+    token = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page).group(1)
+    form = urllib.parse.urlencode({"username": "admin", "password": "pass123", "csrf_token": token}).encode()
+    opener.open(base_url + "/login", form).read()
+    return opener
+
+
+def fetch(opener, url):
+    """(status, Retry-After seconds) of a GET."""
+    try:
+        with opener.open(url, timeout=300) as response:
+            response.read()
+            return response.status, 0
+    except urllib.error.HTTPError as error:
+        return error.code, float(error.headers.get("Retry-After") or 0)
+
+
+def run(mode, args, base_env):
+    env = dict(base_env, ADMISSION_CONTROL="1" if mode == "on" else "0", WEB_CONCURRENCY=str(args.workers))
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--workers", str(args.workers), "--timeout", "300",
+         "--bind", f"127.0.0.1:{port}", "web_app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base_url + "/login", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.2)
+
+        # Each export must give its slot back, however its body is sent.
+        opener = logged_in_opener(base_url)
+        statuses = [fetch(opener, base_url + path)[0] for path in ("/export_excel", "/export_excel", "/export_csv")]
+        assert statuses == [200, 200, 200], f"exports in a row answered {statuses}"
+
+        stop = threading.Event()
+        report_statuses = []
+
+        def storm():
+            opener = logged_in_opener(base_url)
+            while not stop.is_set():
+                status, retry_after = fetch(opener, base_url + "/report")
+                report_statuses.append(status)
+                stop.wait(retry_after)
+
+        threads = [threading.Thread(target=storm) for _ in range(args.storm)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+
+        latencies = []
+        deadline = time.monotonic() + args.seconds
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            urllib.request.urlopen(base_url + "/login", timeout=300).read()
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    served = report_statuses.count(200)
+    rejected = len(report_statuses) - served
+    print(
+        f"admission {mode:>3}: /login p50 {statistics.median(latencies) * 1000:7.0f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.0f} ms, max {latencies[-1] * 1000:7.0f} ms; "
+        f"/report served {served}, rejected {rejected}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--storm", type=int, default=8, help="clients requesting /report in a loop")
+    parser.add_argument("--rows", type=int, default=20_000, help="requests in the database")
+    parser.add_argument("--seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mms-bench-")
+    env = dict(
+        os.environ,
+        DATABASE_URL="sqlite:///" + os.path.join(workdir, "bench.db"),
+        ADMISSION_DB=os.path.join(workdir, "admission.db"),
+        # Measure the concurrency cap; the storm clients share one user, whose bucket would reject most of it.
+        ADMISSION_HEAVY_RATE="0",
+        ADMISSION_HEAVY_RETRY_AFTER="1",
+        SQLITE_CHECKPOINT_INTERVAL="0",
+    )
+    populate(env, args.rows)
+    print(f"{args.workers} gunicorn workers, {args.storm} clients requesting /report, {args.rows:,} requests")
+    for mode in ("off", "on"):
+        run(mode, args, env)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+What a downstream job pays to see recent changes: full /export_csv versus /api/changes deltas.
+
+    python benchmarks/bench_change_feed.py --rows 20000 --edits 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=20000)
+parser.add_argument("--edits", type=int, default=200, help="status changes between two reads")
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+os.environ["CHANGE_FEED_TOKEN"] = "bench"
+os.environ["ADMISSION_CONTROL"] = "0"
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import app, db  # noqa: E402
+
+HEADERS = {"Authorization": "Bearer bench"}
+REQUEST_DATA = {
+    "requester_name": "Requester",
+    "phone_number": "0100",
+    "branch": "Main Branch",
+    "maintenance_type": "Corrective",
+    "equipment_name": "Machine A",
+    "fault_type": "Electrical",
+    "notes": "",
+}
+
+
+def timed(client, path, headers=None):
+    started = time.perf_counter()
+    response = client.get(path, headers=headers)
+    return response, time.perf_counter() - started
+
+
+def main():
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        web_app.ensure_search_index()
+        web_app.seed_data()
+        with app.test_request_context(method="POST"):
+            for start in range(0, ARGS.rows, 1000):
+                web_app.stage_requests([REQUEST_DATA] * min(1000, ARGS.rows - start))
+                db.session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"username": "admin", "password": "pass123"})
+    after = 0
+    while True:
+        response = client.get(f"/api/changes?after={after}", headers=HEADERS)
+        if response.headers["X-Next-After"] == str(after):
+            break
+        after = int(response.headers["X-Next-After"])
+
+    with app.app_context(), app.test_request_context(method="POST"):
+        for request_id in range(1, ARGS.edits + 1):
+            web_app.update_request_status(request_id, "in_progress")
+
+    export, export_seconds = timed(client, "/export_csv")
+    feed, feed_seconds = timed(client, f"/api/changes?after={after}", HEADERS)
+    lines = feed.get_data().count(b"\n")
+    print(f"{ARGS.rows:,} requests, {ARGS.edits} changed since the last read")
+    print(f"  /export_csv:  {len(export.get_data()) / 1024:10,.1f} KiB in {export_seconds * 1000:8,.1f} ms")
+    print(f"  /api/changes: {len(feed.get_data()) / 1024:10,.1f} KiB in {feed_seconds * 1000:8,.1f} ms ({lines} changes)")
+
+    # Long-poll: how soon a waiting consumer hears about a commit made by another thread.
+    after = int(feed.headers["X-Next-After"])
+    committed = {}
+
+    def write_later():
+        time.sleep(0.5)
+        with app.app_context(), app.test_request_context(method="POST"):
+            committed["at"] = time.perf_counter()
+            web_app.add_request(REQUEST_DATA)
+
+    threading.Thread(target=write_later).start()
+    response, _ = timed(client, f"/api/changes?after={after}&wait=10", HEADERS)
+    delay = time.perf_counter() - committed["at"]
+    lines = response.get_data().count(b"\n")
+    print(f"  long-poll woke {delay * 1000:,.1f} ms after the write began, {lines} changes")
+
+
+if __name__ == "__main__":
+    main()
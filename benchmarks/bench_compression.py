@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and server latency of /requests and /report, with and without
+response compression and indentation stripping.
+
+    python benchmarks/bench_compression.py --rows 10000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="mms-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(WORKDIR, "bench.db")
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import MaintenanceRequest, app, db, fragment_cache  # noqa: E402
+
+STATUSES = ["open", "in_progress", "waiting", "closed"]
+LINK_BYTES_PER_SECOND = 1.6e6 / 8  # a slow 3G mobile link
+
+
+def populate(rows):
+    with app.app_context():
+        db.create_all()
+        web_app.seed_data()
+        db.session.execute(
+            MaintenanceRequest.__table__.insert(),
+            [
+                {
+                    "request_date": "2024-01-01 08:00:00",
+                    "requester_name": f"مقدم الطلب {i}",
+                    "phone_number": f"0100{i:07d}",
+                    "branch": "Main Branch" if i % 2 else "Secondary Branch",
+                    "maintenance_type": "Corrective",
+                    "equipment_name": "Machine A",
+                    "fault_type": "Electrical",
+                    "notes": "صوت غير طبيعي في المحرك",
+                    "assigned_technician": "Technician 1" if i % 3 else None,
+                    "status": STATUSES[i % len(STATUSES)],
+                    "version": 1,
+                }
+                for i in range(rows)
+            ],
+        )
+        db.session.commit()
+
+
+def configure(optimized):
+    app.config["COMPRESS_ENABLED"] = optimized
+    app.jinja_env.strip_indent = optimized
+    app.jinja_env.trim_blocks = optimized
+    app.jinja_env.lstrip_blocks = optimized
+    app.jinja_env.cache.clear()
+    fragment_cache._entries.clear()
+
+
+def measure(client, path, encoding, repeat):
+    client.get(path, headers={"Accept-Encoding": encoding})  # warm the row cache
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path, headers={"Accept-Encoding": encoding})
+        body = response.get_data()
+        timings.append(time.perf_counter() - started)
+        size = len(body)
+    return size, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    populate(args.rows)
+    app.config["WTF_CSRF_ENABLED"] = False
+    client = app.test_client()
+    client.post("/login", data={"username": "admin", "password": "pass123"})
+
+    print(f"{args.rows} requests, median of {args.repeat} runs, transfer estimated at 1.6 Mbit/s")
+    print(f"{'page':<10}{'mode':<22}{'bytes':>12}{'server ms':>12}{'transfer ms':>13}")
+    for path in ("/requests", "/report"):
+        for label, optimized, encoding in (
+            ("baseline", False, "identity"),
+            ("trimmed", True, "identity"),
+            ("trimmed + gzip", True, "gzip"),
+            ("trimmed + br", True, "br, gzip"),
+        ):
+            if encoding.startswith("br") and web_app.brotli is None:
+                continue
+            configure(optimized)
+            size, latency = measure(client, path, encoding, args.repeat)
+            print(f"{path:<10}{label:<22}{size:>12,}{latency * 1000:>12.1f}{size / LINK_BYTES_PER_SECOND * 1000:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Throughput of automatic technician dispatch against the workload index.
+
+    python benchmarks/bench_dispatch.py --technicians 5000 --branches 50 --requests 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="mms-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(WORKDIR, "bench.db")
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import Branch, Technician, app, db  # noqa: E402
+
+
+def populate(technicians, branches):
+    db.create_all()
+    web_app.ensure_search_index()
+    db.session.add_all(Branch(branch_name=f"Branch {b}") for b in range(branches))
+    db.session.commit()
+    db.session.execute(
+        Technician.__table__.insert(),
+        [
+            {"technician_name": f"Technician {t}", "phone_number": f"0100{t:07d}", "branch_id": t % branches + 1}
+            for t in range(technicians)
+        ],
+    )
+    db.session.commit()
+    web_app.rebuild_technician_workloads()
+
+
+def bench_decisions(count, branches):
+    started = time.perf_counter()
+    for _ in range(count):
+        technician_id = web_app.least_loaded_technician_id(random.randint(1, branches))
+        web_app.adjust_workload(technician_id, "open", 1)
+    db.session.commit()
+    return time.perf_counter() - started
+
+
+def bench_add_request(count, branches):
+    started = time.perf_counter()
+    for i in range(count):
+        web_app.add_request({
+            "requester_name": f"Requester {i}",
+            "phone_number": "0100",
+            "branch": f"Branch {random.randrange(branches)}",
+            "maintenance_type": "Corrective",
+            "equipment_name": "Machine A",
+            "fault_type": "Electrical",
+            "notes": "",
+        })
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--technicians", type=int, default=5000)
+    parser.add_argument("--branches", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with app.app_context():
+        populate(args.technicians, args.branches)
+
+        elapsed = bench_decisions(args.requests, args.branches)
+        print(f"dispatch decisions (pick + counter update): {args.requests / elapsed:,.0f}/s")
+
+        elapsed = bench_add_request(args.requests, args.branches)
+        print(f"add_request with auto-dispatch, one commit each: {args.requests / elapsed:,.0f}/s")
+
+        loads = [w.active_count for w in web_app.TechnicianWorkload.query.filter_by(branch_id=1)]
+        print(f"branch 1 load spread: min {min(loads)}, max {max(loads)} over {len(loads)} technicians")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Bulk import and CSV export throughput (COPY on PostgreSQL, batched statements elsewhere).
+
+    python benchmarks/bench_export.py --rows 1000000
+    python benchmarks/bench_export.py --rows 1000000 --database-url postgresql://...
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import app, db  # noqa: E402
+
+
+def generate_csv(rows):
+    handle = io.StringIO()
+    handle.write("request_date,requester_name,phone_number,branch,maintenance_type,equipment_name,fault_type,status\n")
+    for i in range(rows):
+        handle.write(f"2024-01-01 08:00:00,Requester {i},0100{i:07d},Main Branch,Corrective,Machine A,Electrical,closed\n")
+    handle.seek(0)
+    return handle
+
+
+def main():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        source = generate_csv(ARGS.rows)
+        started = time.perf_counter()
+        web_app.import_csv("requests", source)
+        elapsed = time.perf_counter() - started
+        print(f"import {ARGS.rows:,} rows: {elapsed:.2f}s ({ARGS.rows / elapsed:,.0f} rows/s)")
+
+        started = time.perf_counter()
+        with web_app.spool_requests_csv() as spool:
+            size = sum(len(chunk) for chunk in iter(lambda: spool.read(1024 * 1024), b""))
+        elapsed = time.perf_counter() - started
+        print(f"CSV export: {elapsed:.2f}s, {size / 1e6:.1f} MB ({ARGS.rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Time compute_kpis() (MTTR, response time, backlog aging, per branch and technician) over a large table.
+
+    python benchmarks/bench_kpi.py --rows 1000000
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=1_000_000)
+parser.add_argument("--chunksize", type=int, default=200_000)
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import app, db  # noqa: E402
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def generate_csv(rows):
+    random.seed(0)
+    origin = datetime(2023, 1, 1)
+    handle = io.StringIO()
+    handle.write("request_date,requester_name,phone_number,branch,maintenance_type,equipment_name,fault_type,"
+                 "assigned_technician,status,start_time,end_time\n")
+    for i in range(rows):
+        requested = origin + timedelta(minutes=random.randrange(1_000_000))
+        status = random.choices(["closed", "open", "in_progress", "waiting"], [80, 8, 8, 4])[0]
+        started = requested + timedelta(minutes=random.randrange(10, 2000)) if status != "open" else None
+        ended = started + timedelta(minutes=random.randrange(10, 5000)) if status == "closed" else None
+        handle.write(
+            f"{requested:{FORMAT}},Requester {i},0100,Branch {i % 50},Corrective,Machine A,Electrical,"
+            f"Technician {i % 500},{status},{started.strftime(FORMAT) if started else ''},"
+            f"{ended.strftime(FORMAT) if ended else ''}\n"
+        )
+    handle.seek(0)
+    return handle
+
+
+def main():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        web_app.import_csv("requests", generate_csv(ARGS.rows))
+
+        started = time.perf_counter()
+        kpis = web_app.compute_kpis(chunksize=ARGS.chunksize)
+        elapsed = time.perf_counter() - started
+
+        overall = kpis["overall"]
+        print(f"compute_kpis over {ARGS.rows:,} requests: {elapsed:.2f}s ({ARGS.rows / elapsed:,.0f} rows/s)")
+        print(f"MTTR {overall['repair_hours']}h, response {overall['response_hours']}h, backlog {overall['backlog']:,}")
+        print(f"{len(kpis['by_branch'])} branches, {len(kpis['by_technician'])} technicians")
+
+
+if __name__ == "__main__":
+    main()
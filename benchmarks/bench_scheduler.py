@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Scheduler tick cost with many preventive maintenance schedules: an idle tick, then a tick with a share due.
+
+    python benchmarks/bench_scheduler.py --schedules 50000 --due 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--schedules", type=int, default=50_000)
+parser.add_argument("--due", type=int, default=2_000, help="schedules due at the timed tick")
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import MaintenanceSchedule, app, db  # noqa: E402
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def populate(now):
+    db.drop_all()
+    db.create_all()
+    web_app.ensure_search_index()
+    web_app.seed_data()
+    rows = []
+    for i in range(ARGS.schedules):
+        # The first --due schedules fall due just before `now`, the rest over the next year.
+        due = now - timedelta(minutes=i + 1) if i < ARGS.due else now + timedelta(minutes=i)
+        rows.append({
+            "equipment_name": f"Machine {i}",
+            "branch": "Main Branch",
+            "maintenance_type": "Preventive",
+            "fault_type": "Preventive",
+            "interval_days": 30,
+            "starts_at": due.strftime(FORMAT),
+            "next_due_at": due.strftime(FORMAT),
+            "occurrence": 0,
+            "active": True,
+        })
+    db.session.execute(web_app.insert(MaintenanceSchedule), rows)
+    db.session.commit()
+
+
+def timed_tick(now):
+    started = time.perf_counter()
+    generated = web_app.run_scheduler_tick(now=now)
+    return generated, time.perf_counter() - started
+
+
+def main():
+    now = datetime(2024, 6, 1, 8)
+    with app.test_request_context(method="POST"):
+        populate(now)
+
+        generated, elapsed = timed_tick(now - timedelta(days=1))
+        print(f"idle tick over {ARGS.schedules:,} schedules: {elapsed * 1000:.1f} ms ({generated} generated)")
+
+        generated, elapsed = timed_tick(now)
+        print(f"tick with {ARGS.due:,} due: {elapsed:.2f}s, {generated:,} requests ({generated / elapsed:,.0f}/s)")
+
+        generated, elapsed = timed_tick(now)
+        assert generated == 0, f"a repeated tick generated {generated} requests"
+        print(f"repeated tick: {elapsed * 1000:.1f} ms, nothing generated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+SLA breach check cost with many open requests: an idle check, then a check with a share of deadlines expired.
+
+    python benchmarks/bench_sla.py --requests 200000 --expired 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--requests", type=int, default=200_000, help="open requests with a pending deadline")
+parser.add_argument("--expired", type=int, default=2_000, help="deadlines expired at the timed check")
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import SlaDeadline, app, db  # noqa: E402
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def populate(now):
+    db.drop_all()
+    db.create_all()
+    rows = [
+        {
+            "request_id": i,
+            "kind": "resolution",
+            # The first --expired deadlines passed just before `now`, the rest spread over the next months.
+            "due_at": (now - timedelta(seconds=i) if i <= ARGS.expired else now + timedelta(seconds=i)).strftime(FORMAT),
+        }
+        for i in range(1, ARGS.requests + 1)
+    ]
+    db.session.execute(web_app.insert(SlaDeadline), rows)
+    db.session.commit()
+
+
+def timed_check(now):
+    started = time.perf_counter()
+    breached = web_app.check_sla_breaches(now=now)
+    return breached, time.perf_counter() - started
+
+
+def main():
+    now = datetime(2024, 6, 1, 8)
+    with app.test_request_context(method="POST"):
+        populate(now)
+
+        breached, elapsed = timed_check(now - timedelta(days=1))
+        print(f"idle check over {ARGS.requests:,} pending deadlines: {elapsed * 1000:.1f} ms ({breached} breached)")
+
+        breached, elapsed = timed_check(now)
+        print(f"check with {ARGS.expired:,} expired: {elapsed * 1000:.0f} ms, {breached:,} breaches notified")
+
+        breached, elapsed = timed_check(now)
+        assert breached == 0, f"a repeated check notified {breached} breaches again"
+        print(f"repeated check: {elapsed * 1000:.1f} ms, nothing notified")
+
+
+if __name__ == "__main__":
+    main()
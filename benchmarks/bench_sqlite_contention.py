@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Multi-process write throughput and "database is locked" rate on SQLite, with and without SQLITE_TUNING.
+
+    python benchmarks/bench_sqlite_contention.py --writers 8 --readers 4 --seconds 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUEST_DATA = {
+    "requester_name": "Requester",
+    "phone_number": "0100",
+    "branch": "Main Branch",
+    "maintenance_type": "Corrective",
+    "equipment_name": "Machine A",
+    "fault_type": "Electrical",
+    "notes": "",
+}
+
+
+def writer(seconds, barrier, results):
+    import web_app
+    from sqlalchemy.exc import OperationalError
+
+    writes = locked = 0
+    with web_app.app.app_context():
+        web_app.db.engine.dispose()
+        barrier.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            # A POST request context, as in create_request/update_status.
+            with web_app.app.test_request_context(method="POST"):
+                try:
+                    request_id = web_app.add_request(REQUEST_DATA)
+                    web_app.update_request_status(request_id, "in_progress")
+                    writes += 2
+                except OperationalError as error:
+                    web_app.db.session.rollback()
+                    if "locked" not in str(error):
+                        raise
+                    locked += 1
+    results.put(("write", writes, locked))
+
+
+def reader(seconds, barrier, results):
+    import web_app
+    from sqlalchemy.exc import OperationalError
+
+    reads = locked = 0
+    with web_app.app.app_context():
+        web_app.db.engine.dispose()
+        barrier.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            with web_app.app.test_request_context(method="GET"):
+                try:
+                    web_app.MaintenanceRequest.query.order_by(
+                        web_app.MaintenanceRequest.request_id.desc()
+                    ).limit(200).all()
+                    web_app.db.session.commit()
+                    reads += 1
+                except OperationalError as error:
+                    web_app.db.session.rollback()
+                    if "locked" not in str(error):
+                        raise
+                    locked += 1
+    results.put(("read", reads, locked))
+
+
+def run_mode(args):
+    """Child process: one configuration against a fresh database file."""
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="mms-bench-"), "bench.db")
+    os.environ["SQLITE_TUNING"] = "1" if args.run == "tuned" else "0"
+    os.environ["SQLITE_CHECKPOINT_INTERVAL"] = "0"
+    sys.path.insert(0, ROOT)
+    import web_app
+
+    with web_app.app.app_context():
+        web_app.db.create_all()
+        web_app.ensure_search_index()
+        web_app.seed_data()
+        web_app.db.session.remove()
+        web_app.db.engine.dispose()
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(args.writers + args.readers)
+    results = context.Queue()
+    processes = [context.Process(target=writer, args=(args.seconds, barrier, results)) for _ in range(args.writers)]
+    processes += [context.Process(target=reader, args=(args.seconds, barrier, results)) for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    totals = {"write": [0, 0], "read": [0, 0]}
+    for _ in processes:
+        kind, done, locked = results.get()
+        totals[kind][0] += done
+        totals[kind][1] += locked
+    for process in processes:
+        process.join()
+    print(json.dumps(totals))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--run", choices=["default", "tuned"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args)
+        return
+
+    print(f"{args.writers} writer and {args.readers} reader processes, {args.seconds:g}s each")
+    for mode in ("default", "tuned"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", mode, "--writers", str(args.writers),
+             "--readers", str(args.readers), "--seconds", str(args.seconds)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        totals = json.loads(output.strip().splitlines()[-1])
+        (writes, write_locked), (reads, read_locked) = totals["write"], totals["read"]
+        attempts = writes / 2 + write_locked
+        print(
+            f"{mode:>8}: {writes / args.seconds:8,.0f} writes/s, "
+            f"{write_locked / attempts if attempts else 0:6.1%} of write attempts locked, "
+            f"{reads / args.seconds:8,.0f} reads/s ({read_locked} locked)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Webhook outbox end to end against local stand-in receivers, one fast and one slow and flaky.
+
+    python benchmarks/bench_webhooks.py --requests 500 --latency-ms 300 --fail-rate 0.3
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--requests", type=int, default=500)
+parser.add_argument("--latency-ms", type=int, default=300, help="response time of the slow receiver")
+parser.add_argument("--fail-rate", type=float, default=0.3, help="share of POSTs the slow receiver fails")
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+os.environ["ADMISSION_CONTROL"] = "0"
+os.environ.setdefault("WEBHOOK_BACKOFF_SECONDS", "0.5")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import web_app  # noqa: E402
+from web_app import WebhookEndpoint, WebhookOutbox, app, db  # noqa: E402
+from webhook_sink import WebhookSink  # noqa: E402
+
+REQUEST_DATA = {
+    "requester_name": "Requester",
+    "phone_number": "0100",
+    "branch": "Main Branch",
+    "maintenance_type": "Corrective",
+    "equipment_name": "Machine A",
+    "fault_type": "Electrical",
+    "notes": "",
+}
+
+
+def write_requests(count):
+    """Create, start and close requests as users would; returns the mean seconds per request."""
+    started = time.perf_counter()
+    with app.test_request_context(method="POST"):
+        for _ in range(count):
+            request_id = web_app.add_request(REQUEST_DATA)
+            web_app.update_request_status(request_id, "in_progress")
+            web_app.update_request_status(request_id, "closed")
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    fast = WebhookSink(secret="fast-secret").start()
+    slow = WebhookSink(latency_ms=ARGS.latency_ms, fail_rate=ARGS.fail_rate).start()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        web_app.ensure_search_index()
+        web_app.seed_data()
+
+        baseline = write_requests(50)
+        db.session.add_all([
+            WebhookEndpoint(url=fast.url, events="*", secret="fast-secret"),
+            WebhookEndpoint(url=slow.url, events="created,closed"),
+        ])
+        db.session.commit()
+        with_outbox = write_requests(ARGS.requests)
+        events = WebhookOutbox.query.count()
+        print(f"{ARGS.requests} requests created, assigned and closed: {events:,} outbox events")
+        print(f"user-facing write time per request: {baseline * 1000:.1f} ms without endpoints, "
+              f"{with_outbox * 1000:.1f} ms with the outbox; "
+              f"an inline call to the slow receiver would add {ARGS.latency_ms * 2} ms or more")
+
+    started = time.perf_counter()
+    rounds = 0
+    with ThreadPoolExecutor(max_workers=app.config["WEBHOOK_CONCURRENCY"]) as executor:
+        while True:
+            with app.app_context():
+                web_app.dispatch_webhooks(executor)
+                rounds += 1
+                pending = WebhookOutbox.query.filter(
+                    WebhookOutbox.delivered_at.is_(None), WebhookOutbox.failed_at.is_(None)
+                ).count()
+                db.session.remove()
+            if not pending:
+                break
+            time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        for sink, endpoint_id in ((fast, 1), (slow, 2)):
+            expected = {row.outbox_id for row in WebhookOutbox.query.filter_by(endpoint_id=endpoint_id)}
+            received = set(sink.event_ids)
+            assert expected <= received, f"endpoint {endpoint_id} missed {len(expected - received)} events"
+            assert not sink.bad_signatures, f"endpoint {endpoint_id} saw bad signatures"
+            print(f"endpoint {endpoint_id}: {len(expected):,} events in {sink.posts} POSTs "
+                  f"({sink.failures} failed and retried, {len(sink.event_ids) - len(received)} duplicates)")
+        for row in web_app.webhook_stats():
+            print(f"  #{row['endpoint_id']}: latency p50 {row['latency_ms_p50']} ms, p95 {row['latency_ms_p95']} ms, "
+                  f"lag p95 {row['lag_seconds_p95']} s")
+    print(f"drained in {elapsed:.1f}s over {rounds} dispatcher rounds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Failures and repairs replayed in time order through add_request and closing; fails if a rebuild counts differently.
+
+    python benchmarks/check_failure_index.py --requests 2000 --keys 200
+    python benchmarks/check_failure_index.py --database-url postgresql://...
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--requests", type=int, default=2000)
+parser.add_argument("--keys", type=int, default=200, help="distinct equipment names")
+parser.add_argument("--days", type=int, default=365, help="span the requests are spread over")
+parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+ARGS = parser.parse_args()
+
+os.environ["DATABASE_URL"] = ARGS.database_url or "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="mms-bench-"), "bench.db"
+)
+os.environ["ADMISSION_CONTROL"] = "0"
+os.environ["AUTO_DISPATCH"] = "0"
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from web_app import EquipmentFailureIndex, app, db  # noqa: E402
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def timeline(count):
+    """(time, kind, number) events: every request fails once, most are started and closed later."""
+    random.seed(0)
+    origin = datetime(2024, 1, 1)
+    events = []
+    for number in range(count):
+        requested = origin + timedelta(minutes=random.randrange(ARGS.days * 24 * 60))
+        events.append((requested, 0, number))
+        if random.random() < 0.8:
+            started = requested + timedelta(minutes=random.randrange(10, 2000))
+            ended = started + timedelta(minutes=random.randrange(10, 20000))
+            events.append((started, 1, number))
+            events.append((ended, 2, number))
+    return sorted(events)
+
+
+def main():
+    with app.app_context(), app.test_request_context(method="POST"):
+        db.drop_all()
+        db.create_all()
+        web_app.ensure_search_index()
+        web_app.seed_data()
+
+        request_ids = {}
+        for at, kind, number in timeline(ARGS.requests):
+            if kind == 0:
+                request_ids[number] = web_app.add_request({
+                    "request_date": at.strftime(FORMAT),
+                    "requester_name": f"Requester {number}",
+                    "phone_number": "0100",
+                    "branch": "Main Branch",
+                    "maintenance_type": "Corrective",
+                    "equipment_name": f"Machine {number % ARGS.keys}",
+                    "fault_type": "Electrical",
+                    "notes": "",
+                })
+            elif kind == 1:
+                web_app.update_request_status(request_ids[number], "in_progress", start_time=at.strftime(FORMAT))
+            else:
+                web_app.update_request_status(request_ids[number], "closed", end_time=at.strftime(FORMAT))
+
+        repeats = db.session.scalar(db.select(db.func.sum(EquipmentFailureIndex.repeat_count)))
+        started = time.perf_counter()
+        differences = web_app.check_failure_index()
+        elapsed = time.perf_counter() - started
+        print(f"{ARGS.requests:,} requests over {ARGS.keys} keys, {repeats:,} repeat failures counted incrementally")
+        print(f"rebuild and compare: {elapsed * 1000:,.1f} ms, {len(differences)} differences")
+        for key, column, stored, rebuilt in differences[:20]:
+            print(f"  {' / '.join(key)}: {column} is {stored}, a rebuild gives {rebuilt}")
+        if differences:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
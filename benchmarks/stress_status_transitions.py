@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Concurrent status transitions racing on the same requests; checks for lost updates.
+
+    python benchmarks/stress_status_transitions.py --workers 8 --requests 200 --rounds 20
+    python benchmarks/stress_status_transitions.py --database-url postgresql://...
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20, help="transition attempts per worker and request")
+    parser.add_argument("--database-url", help="defaults to a throw-away SQLite file")
+    return parser.parse_args()
+
+
+ARGS = parse_args() if __name__ == "__main__" else None
+if ARGS is not None and not ARGS.database_url:
+    ARGS.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="mms-stress-"), "stress.db")
+if ARGS is not None:
+    os.environ["DATABASE_URL"] = ARGS.database_url
+sys.path.insert(0, ROOT)
+
+import web_app  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from web_app import MaintenanceRequest, RequestConflictError, TechnicianWorkload, app, db  # noqa: E402
+
+NEXT_STATUS = {"open": "in_progress", "in_progress": "waiting", "waiting": "in_progress"}
+
+
+def populate(count):
+    db.drop_all()
+    db.create_all()
+    web_app.ensure_search_index()
+    web_app.seed_data()
+    for i in range(count):
+        web_app.add_request({
+            "requester_name": f"Requester {i}",
+            "phone_number": "0100",
+            "branch": "Main Branch",
+            "maintenance_type": "Corrective",
+            "equipment_name": "Machine A",
+            "fault_type": "Electrical",
+            "notes": "",
+        })
+
+
+def attempt(request_id, status, expected_version=None):
+    """One transition; returns True for a win, False for a lost race."""
+    while True:
+        try:
+            return bool(web_app.update_request_status(request_id, status, expected_version=expected_version))
+        except RequestConflictError:
+            return False
+        except OperationalError:
+            # SQLite "database is locked": nothing was written, try again.
+            db.session.rollback()
+            time.sleep(random.random() / 100)
+
+
+def worker(ids, rounds, seed, barrier, results):
+    random.seed(seed)
+    with app.app_context():
+        db.engine.dispose()
+        barrier.wait()
+        # Phase 1: every worker starts every request; exactly one may win each.
+        starts = {request_id: attempt(request_id, "in_progress") for request_id in ids}
+        # waiting -> in_progress is also legal, so nobody moves on until all starts are in.
+        barrier.wait()
+
+        # Phase 2: versioned transitions from whatever state the worker last saw.
+        wins = 0
+        for _ in range(rounds):
+            request_id = random.choice(ids)
+            row = db.session.get(MaintenanceRequest, request_id)
+            status, version = row.status, row.version
+            db.session.rollback()
+            wins += attempt(request_id, NEXT_STATUS[status], expected_version=version)
+        results.put((starts, wins))
+
+
+def main():
+    with app.app_context():
+        populate(ARGS.requests)
+        ids = [r.request_id for r in MaintenanceRequest.query.order_by(MaintenanceRequest.request_id)]
+        initial_versions = sum(r.version for r in MaintenanceRequest.query)
+        db.session.remove()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(ARGS.workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(ids, ARGS.rounds * len(ids) // ARGS.workers, seed, barrier, results))
+        for seed in range(ARGS.workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    start_wins = {request_id: 0 for request_id in ids}
+    transition_wins = 0
+    for starts, wins in outcomes:
+        for request_id, won in starts.items():
+            start_wins[request_id] += won
+        transition_wins += wins
+    successes = sum(start_wins.values()) + transition_wins
+    attempts = ARGS.workers * len(ids) + sum(ARGS.rounds * len(ids) // ARGS.workers for _ in processes)
+
+    with app.app_context():
+        final_versions = sum(r.version for r in MaintenanceRequest.query)
+        counters = {w.technician_id: (w.open_count, w.in_progress_count) for w in TechnicianWorkload.query}
+        web_app.rebuild_technician_workloads()
+        rebuilt = {w.technician_id: (w.open_count, w.in_progress_count) for w in TechnicianWorkload.query}
+
+    print(f"{attempts:,} attempts by {ARGS.workers} workers in {elapsed:.2f}s ({attempts / elapsed:,.0f}/s)")
+    print(f"successful transitions: {successes:,}, rejected: {attempts - successes:,}")
+
+    duplicates = [request_id for request_id, won in start_wins.items() if won != 1]
+    assert not duplicates, f"requests started by more or less than one worker: {duplicates[:10]}"
+    assert final_versions == initial_versions + successes, (
+        f"lost updates: versions advanced by {final_versions - initial_versions}, {successes} transitions won"
+    )
+    assert counters == rebuilt, f"workload counters drifted: {counters} != {rebuilt}"
+    print("ok: one winner per start, no lost updates, workload counters consistent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Two desktop databases syncing through the web app's test client: payload sizes and convergence.
+
+    python benchmarks/sync_roundtrip.py --rows 5000 --edits 50
+
+Needs the desktop app's dependencies (flet) to import it.
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--rows", type=int, default=5000, help="requests created on the first desktop")
+parser.add_argument("--edits", type=int, default=50, help="rows changed on each side between syncs")
+ARGS = parser.parse_args()
+
+WORKDIR = tempfile.mkdtemp(prefix="mms-sync-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(WORKDIR, "web.db")
+os.environ["SYNC_TOKEN"] = "roundtrip"
+os.environ["ADMISSION_CONTROL"] = "0"
+os.environ["AUTO_DISPATCH"] = "0"
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "backup"))
+
+import desktop_app_backup as desktop  # noqa: E402
+import web_app  # noqa: E402
+from web_app import MaintenanceRequest, app, db  # noqa: E402
+
+REQUEST_DATA = {
+    "requester_name": "Requester",
+    "phone_number": "0100",
+    "branch": "Main Branch",
+    "maintenance_type": "Corrective",
+    "equipment_name": "Machine A",
+    "fault_type": "Electrical",
+    "notes": "",
+}
+
+
+class Desktop:
+    """One desktop client: its own SQLite file and a SyncEngine talking to the test client."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.path = os.path.join(WORKDIR, f"{name}.db")
+        self.client = client
+        self.traffic = 0
+        self.use()
+        desktop.init_db()
+        self.engine = desktop.SyncEngine("", "roundtrip", transport=self.transport)
+
+    def use(self):
+        desktop.DB_PATH = self.path
+
+    def transport(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body, headers={"Authorization": "Bearer roundtrip"})
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path}: {response.status_code} {response.get_data(as_text=True)}")
+        self.traffic += len(response.data) + (len(json.dumps(body)) if body is not None else 0)
+        return response.get_json()
+
+    def sync(self):
+        self.use()
+        self.traffic = 0
+        started = time.perf_counter()
+        pushed, pulled = self.engine.sync()
+        elapsed = time.perf_counter() - started
+        print(f"{self.name}: pushed {pushed:,}, pulled {pulled:,} rows, "
+              f"{self.traffic / 1024:,.1f} KiB in {elapsed * 1000:,.0f} ms")
+
+    def requests(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute(
+                "SELECT sync_uuid, status, assigned_technician, assigned_technician_id FROM MaintenanceRequests ORDER BY sync_uuid"
+            ).fetchall()
+
+    def local_ids(self, status):
+        with sqlite3.connect(self.path) as conn:
+            return [row[0] for row in conn.execute("SELECT request_id FROM MaintenanceRequests WHERE status = ?", (status,))]
+
+
+def server_requests():
+    with app.app_context():
+        return [
+            tuple(row) for row in db.session.execute(
+                db.select(
+                    MaintenanceRequest.sync_uuid, MaintenanceRequest.status,
+                    MaintenanceRequest.assigned_technician, MaintenanceRequest.assigned_technician_id,
+                )
+                .order_by(MaintenanceRequest.sync_uuid)
+            )
+        ]
+
+
+def main():
+    random.seed(0)
+    with app.app_context():
+        db.create_all()
+        web_app.ensure_search_index()
+        web_app.seed_data()
+    client = app.test_client()
+    first, second = Desktop("desktop-a", client), Desktop("desktop-b", client)
+
+    first.use()
+    for _ in range(ARGS.rows):
+        desktop.add_request(REQUEST_DATA)
+    print(f"{ARGS.rows:,} requests created on {first.name}")
+    first.sync()
+    second.sync()
+
+    print(f"{ARGS.edits} edits on each desktop and on the server")
+    first.use()
+    for request_id in random.sample(first.local_ids("open"), ARGS.edits):
+        desktop.assign_technician(request_id, "Technician 1")
+        desktop.update_request_status(request_id, "in_progress")
+    second.use()
+    second_edits = random.sample(second.local_ids("open"), ARGS.edits)
+    for request_id in second_edits:
+        desktop.update_request_status(request_id, "in_progress")
+    with app.app_context():
+        # The server also starts and then closes some of the rows desktop-b is starting: conflicts.
+        with sqlite3.connect(second.path) as conn:
+            contested = [row[0] for row in conn.execute(
+                f"SELECT sync_uuid FROM MaintenanceRequests WHERE request_id IN ({', '.join('?' * len(second_edits))}) "
+                "LIMIT 10", second_edits,
+            )]
+        for sync_uuid in contested:
+            request_id = db.session.scalar(db.select(MaintenanceRequest.request_id).filter_by(sync_uuid=sync_uuid))
+            with app.test_request_context(method="POST"):
+                web_app.update_request_status(request_id, "in_progress")
+                web_app.update_request_status(request_id, "closed")
+
+    for side in (first, second, first):
+        side.sync()
+
+    server = server_requests()
+    assert first.requests() == server, "desktop-a differs from the server"
+    assert second.requests() == server, "desktop-b differs from the server"
+    closed = sum(1 for _, status, _, _ in server if status == "closed")
+    print(f"ok: both desktops match the server ({len(server):,} requests, {closed} closed by the server kept closed)")
+
+
+if __name__ == "__main__":
+    main()
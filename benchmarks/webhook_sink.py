@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for a webhook receiver: logs what it gets, optionally slow or flaky.
+
+    python benchmarks/webhook_sink.py --port 8099 --latency-ms 200 --fail-rate 0.2
+    flask --app web_app.py add-webhook --url http://127.0.0.1:8099/ --secret s3cret
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookSink:
+    """Accepts webhook POSTs on 127.0.0.1 and keeps the event ids it acknowledged."""
+
+    def __init__(self, port=0, latency_ms=0, fail_rate=0.0, secret=None, verbose=False):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.secret = secret
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.posts = self.failures = self.bad_signatures = 0
+        self.event_ids = []
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(sink.latency_ms / 1000)
+                status = sink.receive(body, self.headers.get("X-Webhook-Signature"))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def receive(self, body, signature):
+        with self.lock:
+            self.posts += 1
+            if self.secret:
+                expected = "sha256=" + hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+                if not hmac.compare_digest(signature or "", expected):
+                    self.bad_signatures += 1
+                    return 401
+            if random.random() < self.fail_rate:
+                self.failures += 1
+                return 503
+            deliveries = json.loads(body)["deliveries"]
+            for entry in deliveries:
+                self.event_ids.extend(event["id"] for event in entry["events"])
+            if self.verbose:
+                for entry in deliveries:
+                    print(entry["request_id"], [event["type"] for event in entry["events"]], entry["request"])
+            return 204
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="webhook-sink").start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of POSTs answered with 503")
+    parser.add_argument("--secret", help="reject bodies without a matching X-Webhook-Signature")
+    args = parser.parse_args()
+    sink = WebhookSink(args.port, args.latency_ms, args.fail_rate, args.secret, verbose=True)
+    print(f"listening on {sink.url}")
+    try:
+        sink.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
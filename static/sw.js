@@ -1,30 +1,478 @@
-const CACHE_NAME = 'maintenance-app-v1';
+const BUILD_HASH = new URL(self.location).searchParams.get('v') || 'dev';
+const PRECACHE_NAME = `maintenance-precache-${BUILD_HASH}`;
+
 const urlsToCache = [
-  '/',
   '/static/manifest.json',
+  '/static/icon-192x192.png'
+];
+
+// Fingerprinted assets listed by `flask build-assets`; the CDN copies are only
+// precached when the assets have not been built.
+const ASSET_MANIFEST_URL = '/static/dist/manifest.json';
+const fallbackAssetUrls = [
   'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
   'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css',
   'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'
 ];
 
+// Read endpoints served from cache immediately and refreshed in the background.
+// They belong to the logged-in user, so they go in a cache named after that
+// user; logging in or out deletes it (Cache Storage is shared by everyone using
+// the browser and outlives the session).
+const staleWhileRevalidatePaths = ['/api/stats', '/requests', '/report'];
+const USER_CACHE_PREFIX = `maintenance-user-${BUILD_HASH}-`;
+// Set by each page load ({type: 'session'}); null until then or when nobody is logged in.
+let currentUser = null;
+// Bumped on every change of user, so a response fetched for the previous one is not cached.
+let userGeneration = 0;
+
+// Form posts that are queued in IndexedDB when the network is unavailable.
+const outboxPaths = ['/update_status', '/create_request'];
+const OUTBOX_DB = 'maintenance-outbox';
+const OUTBOX_STORE = 'requests';
+const OUTBOX_SYNC_TAG = 'outbox-replay';
+const OUTBOX_BATCH_SIZE = 10;
+
 self.addEventListener('install', function(event) {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(function(cache) {
-        return cache.addAll(urlsToCache);
+    Promise.all([caches.open(PRECACHE_NAME), assetUrls()])
+      .then(function(results) {
+        return results[0].addAll(urlsToCache.concat(results[1]));
+      })
+      .then(function() {
+        return self.skipWaiting();
+      })
+  );
+});
+
+self.addEventListener('activate', function(event) {
+  event.waitUntil(
+    caches.keys()
+      .then(function(names) {
+        return Promise.all(names
+          .filter(function(name) { return name !== PRECACHE_NAME; })
+          .map(function(name) { return caches.delete(name); }));
+      })
+      .then(function() {
+        return self.clients.claim();
       })
   );
 });
 
 self.addEventListener('fetch', function(event) {
+  const request = event.request;
+  const url = new URL(request.url);
+  const sameOrigin = url.origin === self.location.origin;
+
+  if (request.method === 'POST' && sameOrigin && outboxPaths.includes(url.pathname)) {
+    event.respondWith(sendOrQueue(request));
+    return;
+  }
+  if (request.method === 'POST' && sameOrigin && url.pathname === '/login') {
+    event.respondWith(setUser(null).then(function() { return fetch(request); }));
+    return;
+  }
+  if (request.method !== 'GET') {
+    return;
+  }
+  if (sameOrigin && url.pathname === '/logout') {
+    event.respondWith(logout(request));
+    return;
+  }
+  if (sameOrigin && staleWhileRevalidatePaths.includes(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event));
+    return;
+  }
+  if (request.mode === 'navigate') {
+    event.respondWith(fetch(request).catch(offlinePage));
+    return;
+  }
   event.respondWith(
-    caches.match(event.request)
+    caches.match(request)
       .then(function(response) {
         if (response) {
           return response;
         }
-        return fetch(event.request);
+        return fetch(request);
       }
     )
   );
-});
\ No newline at end of file
+});
+
+self.addEventListener('sync', function(event) {
+  if (event.tag === OUTBOX_SYNC_TAG) {
+    event.waitUntil(replayOutbox());
+  }
+});
+
+self.addEventListener('message', function(event) {
+  if (event.data === 'replay-outbox') {
+    event.waitUntil(replayOutbox());
+  } else if (event.data === 'retry-rejected') {
+    event.waitUntil(resolveRejected('retry').then(replayOutbox));
+  } else if (event.data === 'discard-rejected') {
+    event.waitUntil(resolveRejected('discard'));
+  } else if (event.data && event.data.type === 'session') {
+    event.waitUntil(setUser(event.data.user));
+  }
+});
+
+// ---------- caching strategies ----------
+function assetUrls() {
+  return fetch(ASSET_MANIFEST_URL, { cache: 'no-cache' })
+    .then(function(response) {
+      if (!response.ok) {
+        throw new Error('assets not built');
+      }
+      return response.json();
+    })
+    .then(function(manifest) {
+      return Object.keys(manifest).map(function(name) { return '/assets/' + manifest[name]; });
+    })
+    .catch(function() {
+      return fallbackAssetUrls;
+    });
+}
+
+function isCacheable(response) {
+  return response && response.ok && !response.redirected && response.type === 'basic';
+}
+
+// The cache of the user the pages last reported. After the worker restarts it
+// is the one user cache left, since every change of user deletes the others.
+function userCacheName() {
+  if (currentUser) {
+    return Promise.resolve(USER_CACHE_PREFIX + encodeURIComponent(currentUser));
+  }
+  return caches.keys().then(function(names) {
+    const userCaches = names.filter(function(name) { return name.indexOf(USER_CACHE_PREFIX) === 0; });
+    return userCaches.length === 1 ? userCaches[0] : null;
+  });
+}
+
+function setUser(user) {
+  if ((user || null) !== currentUser) {
+    userGeneration += 1;
+  }
+  currentUser = user || null;
+  const keep = currentUser ? USER_CACHE_PREFIX + encodeURIComponent(currentUser) : null;
+  return caches.keys().then(function(names) {
+    return Promise.all(names
+      .filter(function(name) { return name.indexOf('maintenance-user-') === 0 && name !== keep; })
+      .map(function(name) { return caches.delete(name); }));
+  });
+}
+
+function staleWhileRevalidate(event) {
+  const request = event.request;
+  const generation = userGeneration;
+  return userCacheName().then(function(cacheName) {
+    const network = fetch(request);
+    if (!cacheName) {
+      return network.catch(function() {
+        return request.mode === 'navigate' ? offlinePage() : Response.error();
+      });
+    }
+    return caches.open(cacheName).then(function(cache) {
+      return cache.match(request).then(function(cached) {
+        const refreshed = network.then(function(response) {
+          // Skip the write if the user changed while the request was out.
+          if (isCacheable(response) && generation === userGeneration) {
+            return cache.put(request, response.clone())
+              .catch(function() {})
+              .then(function() { return response; });
+          }
+          return response;
+        });
+        if (cached) {
+          event.waitUntil(refreshed.catch(function() {}));
+          return cached;
+        }
+        return refreshed.catch(function() {
+          return request.mode === 'navigate' ? offlinePage() : Response.error();
+        });
+      });
+    });
+  });
+}
+
+function offlinePage() {
+  return new Response(
+    '<!DOCTYPE html><html lang="ar" dir="rtl"><meta charset="UTF-8">' +
+    '<meta name="viewport" content="width=device-width, initial-scale=1.0">' +
+    '<body style="font-family: Tahoma, sans-serif; text-align: center; padding: 40px;">' +
+    '<p>لا يوجد اتصال بالشبكة. يرجى المحاولة مرة أخرى عند عودة الاتصال.</p>' +
+    '<a href="">إعادة المحاولة</a></body></html>',
+    { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+  );
+}
+
+// Send what is still queued while the session is valid, then drop the rest
+// once the server has ended the session: entries left in the outbox must not
+// be replayed under the next user's login.
+function logout(request) {
+  return replayOutbox()
+    .then(function() { return fetch(request); })
+    .then(function(response) {
+      return clearUserData().then(function() { return response; });
+    })
+    .catch(offlinePage);
+}
+
+function clearUserData() {
+  currentUser = null;
+  userGeneration += 1;
+  return Promise.all([
+    caches.keys().then(function(names) {
+      return Promise.all(names
+        .filter(function(name) { return name !== PRECACHE_NAME; })
+        .map(function(name) { return caches.delete(name); }));
+    }),
+    outboxTransaction('readwrite', function(store) {
+      store.clear();
+      return {};
+    })
+  ]);
+}
+
+// ---------- outbox ----------
+function openOutbox() {
+  return new Promise(function(resolve, reject) {
+    const open = indexedDB.open(OUTBOX_DB, 1);
+    open.onupgradeneeded = function() {
+      open.result.createObjectStore(OUTBOX_STORE, { keyPath: 'id', autoIncrement: true });
+    };
+    open.onsuccess = function() { resolve(open.result); };
+    open.onerror = function() { reject(open.error); };
+  });
+}
+
+function outboxTransaction(mode, work) {
+  return openOutbox().then(function(db) {
+    return new Promise(function(resolve, reject) {
+      const tx = db.transaction(OUTBOX_STORE, mode);
+      const result = work(tx.objectStore(OUTBOX_STORE));
+      tx.oncomplete = function() { resolve(result.value); };
+      tx.onerror = function() { reject(tx.error); };
+    });
+  });
+}
+
+function queueRequest(entry) {
+  return outboxTransaction('readwrite', function(store) {
+    store.add(entry);
+    return {};
+  });
+}
+
+// Entries the server rejected stay in the outbox for the user to retry or
+// discard; automatic replays skip them.
+function readOutboxBatch(limit) {
+  return outboxTransaction('readonly', function(store) {
+    const result = { value: [] };
+    store.openCursor().onsuccess = function(event) {
+      const cursor = event.target.result;
+      if (cursor && result.value.length < limit) {
+        if (!cursor.value.rejected) {
+          result.value.push(cursor.value);
+        }
+        cursor.continue();
+      }
+    };
+    return result;
+  });
+}
+
+function settleOutbox(sentIds, rejectedEntries) {
+  return outboxTransaction('readwrite', function(store) {
+    sentIds.forEach(function(id) { store.delete(id); });
+    rejectedEntries.forEach(function(entry) { store.put(entry); });
+    return {};
+  });
+}
+
+function countRejected() {
+  return outboxTransaction('readonly', function(store) {
+    const result = { value: 0 };
+    store.openCursor().onsuccess = function(event) {
+      const cursor = event.target.result;
+      if (cursor) {
+        result.value += cursor.value.rejected ? 1 : 0;
+        cursor.continue();
+      }
+    };
+    return result;
+  });
+}
+
+// 'retry' clears the rejection so the entries go out with the next replay;
+// 'discard' drops them.
+function resolveRejected(action) {
+  return outboxTransaction('readwrite', function(store) {
+    store.openCursor().onsuccess = function(event) {
+      const cursor = event.target.result;
+      if (!cursor) {
+        return;
+      }
+      if (cursor.value.rejected) {
+        if (action === 'discard') {
+          cursor.delete();
+        } else {
+          const entry = cursor.value;
+          delete entry.rejected;
+          cursor.update(entry);
+        }
+      }
+      cursor.continue();
+    };
+    return {};
+  });
+}
+
+function newIdempotencyKey() {
+  if (self.crypto && self.crypto.randomUUID) {
+    return self.crypto.randomUUID();
+  }
+  return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+function sendOrQueue(request) {
+  const queued = request.clone();
+  return fetch(request).catch(function() {
+    return queued.text().then(function(body) {
+      return queueRequest({
+        url: queued.url,
+        body: body,
+        contentType: queued.headers.get('Content-Type'),
+        idempotencyKey: queued.headers.get('Idempotency-Key') || newIdempotencyKey(),
+        queuedAt: Date.now()
+      });
+    }).then(function() {
+      if (self.registration.sync) {
+        self.registration.sync.register(OUTBOX_SYNC_TAG).catch(function() {});
+      }
+      return new Response(
+        '<!DOCTYPE html><html lang="ar" dir="rtl"><meta charset="UTF-8">' +
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0">' +
+        '<body style="font-family: Tahoma, sans-serif; text-align: center; padding: 40px;">' +
+        '<p>لا يوجد اتصال بالشبكة. تم حفظ الطلب وسيتم إرساله تلقائياً عند عودة الاتصال.</p>' +
+        '<a href="/">العودة إلى الرئيسية</a></body></html>',
+        { status: 202, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+      );
+    });
+  });
+}
+
+function freshCsrfToken() {
+  // A queued form carries the CSRF token of the page it came from, which may
+  // have expired; ask for the current one. null means nobody is logged in.
+  return fetch('/api/v1/session', { credentials: 'same-origin', cache: 'no-store' })
+    .then(function(response) {
+      if (response.status === 401) {
+        return null;
+      }
+      if (!response.ok) {
+        throw new Error('session check failed: ' + response.status);
+      }
+      return response.json().then(function(session) { return session.csrf_token; });
+    });
+}
+
+function replayBody(entry, csrfToken) {
+  if (!entry.contentType || entry.contentType.indexOf('application/x-www-form-urlencoded') !== 0) {
+    return entry.body;
+  }
+  const params = new URLSearchParams(entry.body);
+  params.set('csrf_token', csrfToken);
+  return params.toString();
+}
+
+// Resolves to 'sent' (the server applied it), 'retry' (try again later, keep
+// the rest of the queue waiting) or 'rejected' (the server refused this entry).
+function replayEntry(entry, csrfToken) {
+  const headers = {
+    'Idempotency-Key': entry.idempotencyKey,
+    'X-CSRFToken': csrfToken,
+    'X-Outbox-Replay': '1'
+  };
+  if (entry.contentType) {
+    headers['Content-Type'] = entry.contentType;
+  }
+  return fetch(entry.url, {
+    method: 'POST',
+    body: replayBody(entry, csrfToken),
+    headers: headers,
+    credentials: 'same-origin',
+    redirect: 'manual'
+  }).then(function(response) {
+    // The idempotency key makes a retry of an already applied entry harmless.
+    if (response.ok) {
+      return 'sent';
+    }
+    // Replays are answered with JSON; a redirect means the session ended
+    // (the login page) and a 401 the same, so wait for the next login.
+    if (response.type === 'opaqueredirect' || response.status === 401 ||
+        response.status === 429 || response.status >= 500) {
+      return 'retry';
+    }
+    return response.json()
+      .catch(function() { return {}; })
+      .then(function(body) {
+        entry.rejected = { status: response.status, error: body.error || '', at: Date.now() };
+        return 'rejected';
+      });
+  });
+}
+
+function notifyRejected(count) {
+  if (!count) {
+    return Promise.resolve();
+  }
+  return self.clients.matchAll({ includeUncontrolled: true, type: 'window' }).then(function(clients) {
+    clients.forEach(function(client) {
+      client.postMessage({ type: 'outbox-rejected', count: count });
+    });
+  });
+}
+
+function replayOutbox() {
+  return freshCsrfToken().then(function(csrfToken) {
+    if (!csrfToken) {
+      return;
+    }
+    return replayBatches(csrfToken).then(countRejected).then(notifyRejected);
+  }).catch(function() {});
+}
+
+function replayBatches(csrfToken) {
+  return readOutboxBatch(OUTBOX_BATCH_SIZE).then(function(entries) {
+    if (!entries.length) {
+      return;
+    }
+    const sent = [];
+    const rejected = [];
+    return entries.reduce(function(chain, entry) {
+      return chain.then(function(keepGoing) {
+        if (!keepGoing) {
+          return false;
+        }
+        return replayEntry(entry, csrfToken).then(function(outcome) {
+          if (outcome === 'sent') {
+            sent.push(entry.id);
+          } else if (outcome === 'rejected') {
+            rejected.push(entry);
+          }
+          return outcome !== 'retry';
+        });
+      });
+    }, Promise.resolve(true))
+      .catch(function() { return false; })
+      .then(function(finished) {
+        return settleOutbox(sent, rejected).then(function() {
+          if (finished && entries.length === OUTBOX_BATCH_SIZE) {
+            return replayBatches(csrfToken);
+          }
+        });
+      });
+  });
+}
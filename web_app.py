@@ -4,30 +4,211 @@ Mobile-Friendly Web Application for Maintenance Management System
 Based on the original 14-9.py Flet application
 """
 
-from datetime import datetime
-from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import csv
+from datetime import datetime, timedelta
+import functools
+import gzip
+import hashlib
+import hmac
+from io import BytesIO, TextIOWrapper
+import json
+import mimetypes
 import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+import click
+from flask import (
+    Flask,
+    Response,
+    current_app,
+    flash,
+    g,
+    get_flashed_messages,
+    has_app_context,
+    has_request_context,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    send_from_directory,
+    session,
+    stream_with_context,
+    url_for,
+)
 from flask_migrate import Migrate
 from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
-from flask_wtf.csrf import CSRFProtect
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from jinja2.ext import Extension
+from markupsafe import Markup
 import pandas as pd
+from sqlalchemy import bindparam, case, delete, event, func, insert, inspect, literal, select, text, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import check_password_hash, generate_password_hash
 
-db = SQLAlchemy()
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are produced without it
+    brotli = None
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Sends SELECTs to the "replica" bind while replica reads are enabled.
+
+    Replica reads are enabled per view with @use_replica or per block with
+    replica_reads(). Writes, raw SQL, and any read after a write in the same
+    request (or shortly after one by the same user) go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if getattr(clause, "is_select", False):
+                replica = self._db.engines.get("replica")
+                if replica is not None and g.get("use_replica") and not g.get("pin_primary"):
+                    return replica
+            elif clause is None or getattr(clause, "is_dml", False):
+                # ORM flushes (no clause) and INSERT/UPDATE/DELETE statements.
+                g.pin_primary = g.db_wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 csrf = CSRFProtect()
 
 
-def get_database_url():
-    database_url = os.environ.get("DATABASE_URL", "sqlite:///maintenance.db")
+def normalize_database_url(database_url):
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
     return database_url
 
 
+def get_database_url():
+    return normalize_database_url(os.environ.get("DATABASE_URL", "sqlite:///maintenance.db"))
+
+
+def compute_build_hash(app):
+    digest = hashlib.sha256()
+    for folder in (app.static_folder, os.path.join(app.root_path, app.template_folder)):
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, app.root_path).encode("utf-8"))
+                with open(path, "rb") as handle:
+                    digest.update(handle.read())
+    return digest.hexdigest()[:12]
+
+
+# ---------- SQLite tuning ----------
+def apply_sqlite_pragmas(dbapi_connection, config):
+    """Per-connection settings for SQLite with several worker processes."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+    cursor.close()
+    # Let SQLAlchemy's "begin" event choose the BEGIN statement instead of pysqlite.
+    dbapi_connection.isolation_level = None
+
+
+def begin_sqlite_transaction(connection):
+    """Start writing requests with BEGIN IMMEDIATE.
+
+    A deferred transaction that reads before it writes cannot wait for the write
+    lock and fails with "database is locked" straight away; taking the lock up
+    front makes busy_timeout apply instead. Reads keep a plain BEGIN, which in
+    WAL mode never blocks on writers.
+    """
+    immediate = g.get("sqlite_immediate") if has_app_context() else False
+    if immediate is None and has_request_context():
+        immediate = request.method not in ("GET", "HEAD", "OPTIONS")
+    connection.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+
+class SqliteCheckpointer:
+    """Background PASSIVE checkpoints, so the WAL file does not keep growing under steady reads.
+
+    Started lazily on the first request of each worker process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def ensure_started(self):
+        app = current_app._get_current_object()
+        interval = app.config["SQLITE_CHECKPOINT_INTERVAL"]
+        if not interval or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, args=(app, interval), daemon=True, name="sqlite-checkpoint").start()
+
+    def run(self, app, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                checkpoint_sqlite("PASSIVE")
+
+
+sqlite_checkpointer = SqliteCheckpointer()
+
+
+def checkpoint_sqlite(mode="PASSIVE"):
+    """Run a WAL checkpoint on every SQLite engine; returns (busy, wal pages, checkpointed pages) per engine."""
+    results = {}
+    for key, engine in db.engines.items():
+        if engine.dialect.name == "sqlite":
+            # On the raw connection, so the checkpoint does not run inside a BEGIN.
+            connection = engine.raw_connection()
+            try:
+                results[key] = tuple(connection.driver_connection.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+            finally:
+                connection.close()
+    return results
+
+
+def configure_sqlite(app):
+    if not app.config["SQLITE_TUNING"]:
+        return
+    with app.app_context():
+        engines = [engine for engine in db.engines.values() if engine.dialect.name == "sqlite"]
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, app.config)
+
+    for engine in engines:
+        if engine.url.database in (None, "", ":memory:"):
+            continue
+        event.listen(engine, "connect", on_connect)
+        event.listen(engine, "begin", begin_sqlite_transaction)
+    if engines:
+        app.before_request(sqlite_checkpointer.ensure_started)
+
+
 def create_app():
     app = Flask(__name__)
 
@@ -47,17 +228,71 @@ def create_app():
         SESSION_TYPE=os.environ.get("SESSION_TYPE", "filesystem"),
         SESSION_FILE_DIR=os.path.join(app.instance_path, "sessions"),
         SESSION_PERMANENT=False,
+        FRAGMENT_CACHE_SIZE=int(os.environ.get("FRAGMENT_CACHE_SIZE", 50000)),
+        FRAGMENT_CACHE_DIR=os.environ.get("FRAGMENT_CACHE_DIR"),
+        COMPRESS_ENABLED=os.environ.get("COMPRESS_ENABLED", "1") == "1",
+        COMPRESS_MIN_SIZE=int(os.environ.get("COMPRESS_MIN_SIZE", 1024)),
+        COMPRESS_GZIP_LEVEL=int(os.environ.get("COMPRESS_GZIP_LEVEL", 6)),
+        COMPRESS_BR_LEVEL=int(os.environ.get("COMPRESS_BR_LEVEL", 4)),
+        HTML_STRIP_INDENT=os.environ.get("HTML_STRIP_INDENT", "1") == "1",
+        STREAM_ROWS_THRESHOLD=int(os.environ.get("STREAM_ROWS_THRESHOLD", 500)),
+        STREAM_YIELD_PER=int(os.environ.get("STREAM_YIELD_PER", 500)),
+        AUTO_DISPATCH=os.environ.get("AUTO_DISPATCH", "1") == "1",
+        SCHEDULER_THREAD=os.environ.get("SCHEDULER_THREAD", "0") == "1",
+        SCHEDULER_INTERVAL=int(os.environ.get("SCHEDULER_INTERVAL", 60)),
+        REPEAT_FAILURE_DAYS=int(os.environ.get("REPEAT_FAILURE_DAYS", 30)),
+        ANALYTICS_SETTLE_SECONDS=int(os.environ.get("ANALYTICS_SETTLE_SECONDS", 5)),
+        REPLICA_MAX_LAG_SECONDS=float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 10)),
+        SYNC_TOKEN=os.environ.get("SYNC_TOKEN"),
+        CHANGE_FEED_TOKEN=os.environ.get("CHANGE_FEED_TOKEN"),
+        WEBHOOK_BATCH_SIZE=int(os.environ.get("WEBHOOK_BATCH_SIZE", 100)),
+        WEBHOOK_TIMEOUT=float(os.environ.get("WEBHOOK_TIMEOUT", 10)),
+        WEBHOOK_CONCURRENCY=int(os.environ.get("WEBHOOK_CONCURRENCY", 8)),
+        WEBHOOK_MAX_ATTEMPTS=int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", 12)),
+        WEBHOOK_BACKOFF_SECONDS=float(os.environ.get("WEBHOOK_BACKOFF_SECONDS", 10)),
+        WEBHOOK_POLL_SECONDS=float(os.environ.get("WEBHOOK_POLL_SECONDS", 1)),
+        ADMISSION_CONTROL=os.environ.get("ADMISSION_CONTROL", "1") == "1",
+        ADMISSION_DB=os.environ.get("ADMISSION_DB") or os.path.join(app.instance_path, "admission.db"),
+        ADMISSION_CLASSES=admission_classes(),
+        ADMISSION_LEASE_SECONDS=int(os.environ.get("ADMISSION_LEASE_SECONDS", 600)),
+        # Proxies in front of the app whose X-Forwarded-For/-Proto are trusted; Heroku's router is one.
+        PROXY_FIX_HOPS=int(os.environ.get("PROXY_FIX_HOPS", 1 if "DYNO" in os.environ else 0)),
+        SQLITE_TUNING=os.environ.get("SQLITE_TUNING", "1") == "1",
+        SQLITE_BUSY_TIMEOUT_MS=int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 15000)),
+        SQLITE_SYNCHRONOUS=os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        SQLITE_MMAP_SIZE=int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        SQLITE_CACHE_SIZE_KB=int(os.environ.get("SQLITE_CACHE_SIZE_KB", 20000)),
+        SQLITE_CHECKPOINT_INTERVAL=int(os.environ.get("SQLITE_CHECKPOINT_INTERVAL", 300)),
     )
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url:
+        app.config["SQLALCHEMY_BINDS"] = {"replica": normalize_database_url(replica_url)}
+    app.config["BUILD_HASH"] = os.environ.get("BUILD_HASH") or compute_build_hash(app)
+    app.config["ASSET_MANIFEST"] = load_asset_manifest(app)
+
+    app.jinja_env.add_extension(StripIndentExtension)
+    app.jinja_env.strip_indent = app.config["HTML_STRIP_INDENT"]
+    app.jinja_env.trim_blocks = app.config["HTML_STRIP_INDENT"]
+    app.jinja_env.lstrip_blocks = app.config["HTML_STRIP_INDENT"]
 
     os.makedirs(app.instance_path, exist_ok=True)
     os.makedirs(app.config["SESSION_FILE_DIR"], exist_ok=True)
 
     Session(app)
     db.init_app(app)
+    configure_sqlite(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
+    fragment_cache.init_app(app)
+    admission_control.init_app(app)
+
+    if app.config["PROXY_FIX_HOPS"]:
+        # remote_addr keys the per-client rate limits before login; behind a proxy it would be the proxy's.
+        hops = app.config["PROXY_FIX_HOPS"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
 
     register_routes(app)
+    register_api(app)
     register_cli(app)
 
     return app
@@ -107,6 +342,39 @@ class Technician(db.Model):
     branch_id = db.Column(db.Integer, db.ForeignKey("Branches.branch_id"), nullable=False)
 
 
+class TechnicianWorkload(db.Model):
+    __tablename__ = "TechnicianWorkloads"
+    __table_args__ = (
+        db.Index("ix_TechnicianWorkloads_branch_load", "branch_id", "active_count", "technician_id"),
+    )
+
+    technician_id = db.Column(db.Integer, db.ForeignKey("Technicians.technician_id"), primary_key=True)
+    branch_id = db.Column(db.Integer, nullable=False)
+    open_count = db.Column(db.Integer, nullable=False, default=0)
+    in_progress_count = db.Column(db.Integer, nullable=False, default=0)
+    active_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EquipmentFailureIndex(db.Model):
+    """Running failure statistics per (equipment, fault, branch), kept up to date by add_request and closing."""
+
+    __tablename__ = "EquipmentFailureIndex"
+
+    equipment_name = db.Column(db.String(255), primary_key=True)
+    fault_type = db.Column(db.String(255), primary_key=True)
+    branch = db.Column(db.String(255), primary_key=True)
+    failure_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+    repeat_count = db.Column(db.Integer, nullable=False, default=0)
+    closed_count = db.Column(db.Integer, nullable=False, default=0)
+    repair_seconds = db.Column(db.Integer, nullable=False, default=0)
+    repaired_count = db.Column(db.Integer, nullable=False, default=0)
+    first_failure_at = db.Column(db.String(50))
+    last_failure_at = db.Column(db.String(50))
+    last_repaired_at = db.Column(db.String(50))
+    # A new failure before this time counts as a repeat of the last repair.
+    repeat_window_until = db.Column(db.String(50))
+
+
 class MaintenanceRequest(db.Model):
     __tablename__ = "MaintenanceRequests"
 
@@ -120,13 +388,56 @@ class MaintenanceRequest(db.Model):
     fault_type = db.Column(db.String(255), nullable=False)
     notes = db.Column(db.Text)
     assigned_technician = db.Column(db.String(255))
+    assigned_technician_id = db.Column(db.Integer, db.ForeignKey("Technicians.technician_id"), index=True)
     status = db.Column(db.String(50), nullable=False, default="open")
     start_time = db.Column(db.String(50))
     end_time = db.Column(db.String(50))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # Identity shared with desktop clients, and the position of the row's latest change in the sync feed.
+    sync_uuid = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
+    sync_seq = db.Column(db.Integer, index=True)
+    # The desktop client whose push made the latest change, if any; its own pulls skip the row.
+    sync_origin = db.Column(db.String(36))
+
+
+class SyncCounter(db.Model):
+    """Named sequences (request sync_seq, change feed); a row stays locked until the writing transaction commits."""
+
+    __tablename__ = "SyncCounters"
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChangeLog(db.Model):
+    """One row per write to a request, notification, purchase order or spare-part request, in commit order."""
+
+    __tablename__ = "ChangeLog"
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(20), nullable=False)
+    changed_at = db.Column(db.String(50), nullable=False, index=True)
+    # The columns written, as JSON; all of them for an insert.
+    data = db.Column(db.Text)
 
 
 class Notification(db.Model):
+    """Stored once per audience (all engineers, one technician); read state lives in NotificationReceipts."""
+
     __tablename__ = "Notifications"
+    __table_args__ = (
+        # Only unresolved notifications are ever listed, so the index stays small as history grows.
+        db.Index(
+            "ix_Notifications_unresolved",
+            "recipient_type",
+            "recipient_id",
+            "notification_id",
+            sqlite_where=db.text("resolved_at IS NULL"),
+            postgresql_where=db.text("resolved_at IS NULL"),
+        ),
+    )
 
     notification_id = db.Column(db.Integer, primary_key=True)
     request_id = db.Column(db.Integer, nullable=False)
@@ -135,6 +446,17 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.String(50), nullable=False)
     is_read = db.Column(db.Boolean, nullable=False, default=False)
+    resolved_at = db.Column(db.String(50))
+
+
+class NotificationReceipt(db.Model):
+    """A user has read a notification; deleted when the notification is resolved."""
+
+    __tablename__ = "NotificationReceipts"
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, primary_key=True)
+    read_at = db.Column(db.String(50), nullable=False)
 
 
 class SparePartsRequest(db.Model):
@@ -157,346 +479,3323 @@ class PurchaseOrder(db.Model):
     status = db.Column(db.String(50), nullable=False, default="pending")
 
 
-class User(db.Model):
-    __tablename__ = "Users"
+class MaintenanceSchedule(db.Model):
+    """A recurring preventive job: every interval_days, or every interval_months on the day of starts_at."""
 
-    user_id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(255), unique=True, nullable=False)
-    password = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(50), nullable=False)
-    technician_id = db.Column(db.Integer)
+    __tablename__ = "MaintenanceSchedules"
+    __table_args__ = (
+        # The scheduler's queue: active schedules ordered by due time.
+        db.Index("ix_MaintenanceSchedules_due", "active", "next_due_at"),
+    )
 
+    schedule_id = db.Column(db.Integer, primary_key=True)
+    equipment_name = db.Column(db.String(255), nullable=False)
+    branch = db.Column(db.String(255), nullable=False)
+    maintenance_type = db.Column(db.String(255), nullable=False, default="Preventive")
+    fault_type = db.Column(db.String(255), nullable=False, default="Preventive")
+    notes = db.Column(db.Text)
+    interval_days = db.Column(db.Integer)
+    interval_months = db.Column(db.Integer)
+    starts_at = db.Column(db.String(50), nullable=False)
+    occurrence = db.Column(db.Integer, nullable=False, default=0)
+    next_due_at = db.Column(db.String(50), nullable=False)
+    last_request_id = db.Column(db.Integer)
+    active = db.Column(db.Boolean, nullable=False, default=True)
 
-def seed_data():
-    if Branch.query.first():
-        return
 
-    branches = [
-        Branch(branch_name="Main Branch"),
-        Branch(branch_name="Secondary Branch"),
-    ]
-    technicians = [
-        Technician(technician_name="Technician 1", phone_number="123456789", branch_id=1),
-        Technician(technician_name="Technician 2", phone_number="987654321", branch_id=2),
-    ]
-    maintenance_types = [
-        MaintenanceType(type_name="Preventive"),
-        MaintenanceType(type_name="Corrective"),
-    ]
-    equipment_names = [
-        EquipmentName(equipment_name="Machine A"),
-        EquipmentName(equipment_name="Machine B"),
-    ]
-    fault_types = [
-        FaultType(fault_name="Electrical"),
-        FaultType(fault_name="Mechanical"),
-    ]
-    spare_parts = [
-        SparePart(part_name="Motor"),
-        SparePart(part_name="Gearbox"),
-    ]
+class SlaPolicy(db.Model):
+    """Response and resolution targets; empty maintenance_type or branch means any."""
 
-    users = [
-        User(username="engineer", password=generate_password_hash("pass123"), role="engineer"),
-        User(username="technician", password=generate_password_hash("pass123"), role="technician", technician_id=1),
-        User(username="store", password=generate_password_hash("pass123"), role="store"),
-        User(username="branch", password=generate_password_hash("pass123"), role="branch"),
-        User(username="admin", password=generate_password_hash("pass123"), role="admin"),
-    ]
+    __tablename__ = "SlaPolicies"
 
-    db.session.add_all(branches + technicians + maintenance_types + equipment_names + fault_types + spare_parts + users)
-    db.session.commit()
+    policy_id = db.Column(db.Integer, primary_key=True)
+    maintenance_type = db.Column(db.String(255))
+    branch = db.Column(db.String(255))
+    response_hours = db.Column(db.Float)
+    resolution_hours = db.Column(db.Float)
 
 
-def authenticate_user(username, password):
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        return None
+class SlaDeadline(db.Model):
+    """A pending or breached SLA deadline of a request; deleted when it is met in time."""
 
-    if check_password_hash(user.password, password):
-        return user.role, user.technician_id
+    __tablename__ = "SlaDeadlines"
+    __table_args__ = (
+        # The breach detector's queue: pending deadlines ordered by due time.
+        db.Index(
+            "ix_SlaDeadlines_pending",
+            "due_at",
+            sqlite_where=db.text("breached_at IS NULL"),
+            postgresql_where=db.text("breached_at IS NULL"),
+        ),
+    )
 
-    if user.password == password:
-        user.password = generate_password_hash(password)
-        db.session.commit()
-        return user.role, user.technician_id
+    request_id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    due_at = db.Column(db.String(50), nullable=False)
+    breached_at = db.Column(db.String(50))
 
-    return None
 
+class WebhookEndpoint(db.Model):
+    """An external system told about request events; events is a comma-separated list, or "*" for all."""
 
-def add_request(data):
-    request_item = MaintenanceRequest(
-        request_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        requester_name=data["requester_name"],
-        phone_number=data["phone_number"],
-        branch=data["branch"],
-        maintenance_type=data["maintenance_type"],
-        equipment_name=data["equipment_name"],
-        fault_type=data["fault_type"],
-        notes=data["notes"],
-        status="open",
-    )
-    db.session.add(request_item)
-    db.session.flush()
+    __tablename__ = "WebhookEndpoints"
 
-    notification = Notification(
-        request_id=request_item.request_id,
-        recipient_type="engineer",
-        message=f"طلب صيانة جديد #{request_item.request_id} تم إنشاؤه",
-        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        is_read=False,
-    )
-    db.session.add(notification)
-    db.session.commit()
-    return request_item.request_id
+    endpoint_id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False)
+    events = db.Column(db.String(200), nullable=False, default="*")
+    # Signs each body as X-Webhook-Signature: sha256=<hmac>.
+    secret = db.Column(db.String(200))
+    active = db.Column(db.Boolean, nullable=False, default=True)
 
 
-def get_notifications(recipient_type, recipient_id=None):
-    query = Notification.query.filter_by(recipient_type=recipient_type, is_read=False)
-    if recipient_type == "technician" and recipient_id is not None:
-        query = query.filter_by(recipient_id=recipient_id)
-    return query.order_by(Notification.created_at.desc()).all()
+class WebhookOutbox(db.Model):
+    """One event for one endpoint, written in the same commit as the change it reports."""
 
+    __tablename__ = "WebhookOutbox"
+    __table_args__ = (
+        # The dispatcher's queue: undelivered events per endpoint, oldest first.
+        db.Index(
+            "ix_WebhookOutbox_pending",
+            "endpoint_id",
+            "outbox_id",
+            sqlite_where=db.text("delivered_at IS NULL AND failed_at IS NULL"),
+            postgresql_where=db.text("delivered_at IS NULL AND failed_at IS NULL"),
+        ),
+    )
 
-def assign_technician(request_id, technician_name):
-    technician = Technician.query.filter_by(technician_name=technician_name).first()
-    request_item = db.session.get(MaintenanceRequest, request_id)
-    if not technician or not request_item:
-        return False
+    outbox_id = db.Column(db.Integer, primary_key=True)
+    endpoint_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(20), nullable=False)
+    request_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.String(50), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.String(50), nullable=False)
+    delivered_at = db.Column(db.String(50))
+    # Set after WEBHOOK_MAX_ATTEMPTS failed attempts; the event is not retried again.
+    failed_at = db.Column(db.String(50))
 
-    request_item.assigned_technician = technician.technician_name
-    notification = Notification(
-        request_id=request_item.request_id,
-        recipient_type="technician",
-        recipient_id=technician.technician_id,
-        message=f"تم تعيينك لطلب صيانة رقم #{request_item.request_id}",
-        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        is_read=False,
-    )
-    Notification.query.filter_by(
-        request_id=request_item.request_id,
-        recipient_type="engineer",
-    ).update({"is_read": True})
-
-    db.session.add(notification)
-    db.session.commit()
-    return True
 
+class WebhookDelivery(db.Model):
+    """One POST to an endpoint: how many events it carried, how it went and how long it took."""
 
-def update_request_status(request_id, status, start_time=None, end_time=None):
-    request_item = db.session.get(MaintenanceRequest, request_id)
-    if not request_item:
-        return False
+    __tablename__ = "WebhookDeliveries"
 
-    if status == "in_progress":
-        request_item.status = status
-        request_item.start_time = start_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    elif status == "closed":
-        request_item.status = status
-        request_item.end_time = end_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        db.session.add(
-            Notification(
-                request_id=request_item.request_id,
-                recipient_type="requester",
-                message=f"تم إغلاق طلب الصيانة #{request_item.request_id}",
-                created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                is_read=False,
-            )
-        )
-        db.session.add(
-            Notification(
-                request_id=request_item.request_id,
-                recipient_type="engineer",
-                message=f"تم إغلاق طلب الصيانة #{request_item.request_id}",
-                created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                is_read=False,
-            )
-        )
-    else:
-        request_item.status = status
+    delivery_id = db.Column(db.Integer, primary_key=True)
+    endpoint_id = db.Column(db.Integer, nullable=False, index=True)
+    started_at = db.Column(db.String(50), nullable=False)
+    events = db.Column(db.Integer, nullable=False)
+    status_code = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    succeeded = db.Column(db.Boolean, nullable=False)
+    latency_ms = db.Column(db.Integer, nullable=False)
+    # From the oldest event in the batch being committed to this attempt finishing.
+    lag_seconds = db.Column(db.Integer, nullable=False)
 
-    db.session.commit()
-    return True
 
+class IdempotencyKey(db.Model):
+    __tablename__ = "IdempotencyKeys"
 
-def register_cli(app):
-    @app.cli.command("init-db")
-    def init_db_command():
-        db.create_all()
-        print("Database tables created.")
+    key = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(50), nullable=False)
+    request_id = db.Column(db.Integer)
+    created_at = db.Column(db.String(50), nullable=False)
 
-    @app.cli.command("seed-db")
-    def seed_db_command():
-        seed_data()
-        print("Seed data inserted.")
 
+class RequestEvent(db.Model):
+    """Append-only history of a request; rows are never updated or deleted."""
 
-def register_routes(app):
-    @app.route('/')
-    def index():
-        if 'user_role' not in session:
-            return redirect(url_for('login'))
-        return render_template('dashboard.html', role=session['user_role'])
+    __tablename__ = "RequestEvents"
+    __table_args__ = (
+        db.Index("ix_RequestEvents_request_event", "request_id", "event_id"),
+    )
 
-    @app.route('/login', methods=['GET', 'POST'])
-    def login():
-        if request.method == 'POST':
-            username = request.form['username']
-            password = request.form['password']
+    event_id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    from_status = db.Column(db.String(50))
+    to_status = db.Column(db.String(50))
+    technician_id = db.Column(db.Integer)
+    version = db.Column(db.Integer)
+    occurred_at = db.Column(db.String(50), nullable=False)
 
-            auth_result = authenticate_user(username, password)
-            if auth_result:
-                role, technician_id = auth_result
-                session['user_role'] = role
-                session['username'] = username
-                if role == "technician" and technician_id:
-                    session['technician_id'] = technician_id
-                flash('تم تسجيل الدخول بنجاح', 'success')
-                return redirect(url_for('index'))
-            flash('اسم المستخدم أو كلمة المرور غير صحيحة', 'error')
 
-        return render_template('login.html')
+class RequestStatusDuration(db.Model):
+    """Seconds each request has spent in each status, up to its last status change."""
 
-    @app.route('/logout')
-    def logout():
-        session.clear()
-        flash('تم تسجيل الخروج بنجاح', 'success')
-        return redirect(url_for('login'))
+    __tablename__ = "RequestStatusDurations"
 
-    @app.route('/create_request', methods=['GET', 'POST'])
-    def create_request():
-        if 'user_role' not in session or session['user_role'] not in ['engineer', 'branch', 'admin']:
-            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
-            return redirect(url_for('index'))
+    request_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    seconds = db.Column(db.Integer, nullable=False, default=0)
 
-        if request.method == 'POST':
-            data = {
-                'requester_name': request.form['requester_name'],
-                'phone_number': request.form['phone_number'],
-                'branch': request.form['branch'],
-                'maintenance_type': request.form['maintenance_type'],
-                'equipment_name': request.form['equipment_name'],
-                'fault_type': request.form['fault_type'],
-                'notes': request.form.get('notes', '')
-            }
 
-            request_id = add_request(data)
-            if request_id:
-                flash(f'تم إنشاء الطلب #{request_id} بنجاح', 'success')
-                return redirect(url_for('index'))
-            flash('حدث خطأ في إنشاء الطلب', 'error')
+class RequestStatusCursor(db.Model):
+    """The status each request entered last, and when, as seen by the duration analytics."""
 
-        return render_template(
-            'create_request.html',
-            branches=Branch.query.order_by(Branch.branch_name.asc()).all(),
-            maintenance_types=MaintenanceType.query.order_by(MaintenanceType.type_name.asc()).all(),
-            equipment_names=EquipmentName.query.order_by(EquipmentName.equipment_name.asc()).all(),
-            fault_types=FaultType.query.order_by(FaultType.fault_name.asc()).all(),
-        )
+    __tablename__ = "RequestStatusCursors"
 
-    @app.route('/requests')
-    def view_requests():
-        if 'user_role' not in session:
-            return redirect(url_for('login'))
+    request_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(50), nullable=False)
+    since = db.Column(db.String(50), nullable=False)
 
-        requests = MaintenanceRequest.query.order_by(MaintenanceRequest.request_id.desc()).all()
-        return render_template('requests.html', requests=requests)
 
-    @app.route('/engineer')
-    def engineer_dashboard():
-        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
-            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
-            return redirect(url_for('index'))
+class AnalyticsWatermark(db.Model):
+    __tablename__ = "AnalyticsWatermarks"
 
-        notifications = get_notifications("engineer")
-        technicians = Technician.query.order_by(Technician.technician_name.asc()).all()
-        return render_template('engineer.html', notifications=notifications, technicians=technicians)
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
 
-    @app.route('/technician')
-    def technician_dashboard():
-        if 'user_role' not in session or session['user_role'] not in ['technician', 'admin']:
-            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
-            return redirect(url_for('index'))
 
-        technician_id = session.get('technician_id')
-        notifications = get_notifications("technician", technician_id)
-        return render_template('technician.html', notifications=notifications)
+class User(db.Model):
+    __tablename__ = "Users"
 
-    @app.route('/assign_technician', methods=['POST'])
-    def assign_technician_route():
-        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
-            return jsonify({'error': 'غير مصرح'}), 403
+    user_id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(255), unique=True, nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    role = db.Column(db.String(50), nullable=False)
+    technician_id = db.Column(db.Integer)
 
-        try:
-            request_id = int(request.form['request_id'])
-        except (TypeError, ValueError):
-            flash('رقم الطلب غير صالح', 'error')
-            return redirect(url_for('engineer_dashboard'))
-        technician_name = request.form['technician_name']
 
-        if assign_technician(request_id, technician_name):
-            flash(f'تم تعيين الفني لطلب #{request_id}', 'success')
-        else:
-            flash('تعذر تعيين الفني', 'error')
-        return redirect(url_for('engineer_dashboard'))
+class ArchiveRun(db.Model):
+    """One `flask archive-requests` run; closed requests that ended before `cutoff` live in the archive tables."""
 
-    @app.route('/update_status', methods=['POST'])
-    def update_status():
-        if 'user_role' not in session:
-            return jsonify({'error': 'غير مصرح'}), 403
+    __tablename__ = "ArchiveRuns"
 
-        try:
-            request_id = int(request.form['request_id'])
-        except (TypeError, ValueError):
-            flash('رقم الطلب غير صالح', 'error')
-            return redirect(url_for('technician_dashboard'))
-        status = request.form['status']
+    run_id = db.Column(db.Integer, primary_key=True)
+    cutoff = db.Column(db.String(50), nullable=False)
+    archived_requests = db.Column(db.Integer, nullable=False, default=0)
+    archived_notifications = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.String(50), nullable=False)
 
-        if update_request_status(request_id, status):
-            flash(f'تم تحديث حالة الطلب #{request_id}', 'success')
-        else:
-            flash('تعذر تحديث حالة الطلب', 'error')
 
-        if session['user_role'] == 'technician':
-            return redirect(url_for('technician_dashboard'))
-        return redirect(url_for('engineer_dashboard'))
+def archive_table(name, source):
+    """A cold copy of `source` with the same columns plus archived_at."""
+    return db.Table(
+        name,
+        *[column._copy() for column in source.columns],
+        db.Column("archived_at", db.String(50), nullable=False),
+    )
+
+
+archived_requests_table = archive_table("ArchivedMaintenanceRequests", MaintenanceRequest.__table__)
+archived_notifications_table = archive_table("ArchivedNotifications", Notification.__table__)
+
+
+class RowFragmentCache:
+    """Rendered HTML for a single request row, keyed by (template, request_id, version).
+
+    Rows are kept in a per-process LRU of requests, each holding its rendered
+    kinds, so invalidating a request is one lookup. When a directory is
+    configured the fragments are also written to disk so that every worker (and
+    every user) can reuse a row rendered by another one.
+
+    Everything is stored under a generation derived from the build hash and the
+    row templates, so a deploy that changes how rows look never serves old HTML.
+    A full /requests render can be larger than the cache: once it is full, new
+    requests go in at the cold end and only a second hit makes them stay, so
+    one long render does not flush the rows everybody keeps looking at.
+    """
+
+    templates = {
+        "requests_row": "partials/requests_row.html",
+        "requests_card": "partials/requests_card.html",
+        "report_row": "partials/report_row.html",
+    }
+
+    def __init__(self, max_entries=50000, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.generation = "dev"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._jinja_env = None
+
+    def init_app(self, app):
+        self.max_entries = app.config["FRAGMENT_CACHE_SIZE"]
+        self._jinja_env = app.jinja_env
+        self.generation = self._generation(app)
+        self.directory = app.config["FRAGMENT_CACHE_DIR"]
+        if self.directory:
+            os.makedirs(os.path.join(self.directory, self.generation), exist_ok=True)
+            for name in os.listdir(self.directory):
+                if name != self.generation:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        app.jinja_env.globals["cached_row"] = self.render
+
+    def _generation(self, app):
+        digest = hashlib.sha256(app.config["BUILD_HASH"].encode("utf-8"))
+        digest.update(str(app.config["HTML_STRIP_INDENT"]).encode("utf-8"))
+        for name in sorted(self.templates.values()):
+            digest.update(self._jinja_env.loader.get_source(self._jinja_env, name)[0].encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    def _path(self, kind, request_id, version):
+        return os.path.join(self.directory, self.generation, str(request_id), kind, f"{version}.html")
+
+    def get(self, key):
+        kind, request_id, version = key
+        with self._lock:
+            fragments = self._entries.get(request_id)
+            html = fragments and fragments.get(kind)
+            if html is not None and html[0] == version:
+                self._entries.move_to_end(request_id)
+                return html[1]
+
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(*key), encoding="utf-8") as handle:
+                html = handle.read()
+        except OSError:
+            return None
+        self._remember(key, html)
+        return html
+
+    def set(self, key, html):
+        self._remember(key, html)
+        if not self.directory:
+            return
+
+        path = self._path(*key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(html)
+        os.replace(tmp_path, path)
+
+    def _remember(self, key, html):
+        kind, request_id, version = key
+        with self._lock:
+            fragments = self._entries.get(request_id)
+            if fragments is not None:
+                fragments[kind] = (version, html)
+                return
+            self._entries[request_id] = {kind: (version, html)}
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._entries.move_to_end(request_id, last=False)
+
+    def invalidate(self, request_id):
+        with self._lock:
+            self._entries.pop(request_id, None)
+
+        if self.directory:
+            shutil.rmtree(os.path.join(self.directory, self.generation, str(request_id)), ignore_errors=True)
+
+    def render(self, kind, request_item):
+        key = (kind, request_item.request_id, request_item.version or 1)
+        html = self.get(key)
+        if html is None:
+            html = self._jinja_env.get_template(self.templates[kind]).render(request=request_item)
+            self.set(key, html)
+        return Markup(html)
+
+
+fragment_cache = RowFragmentCache()
+
+
+# ---------- admission control ----------
+# Endpoints that never go through admission control.
+ADMISSION_EXEMPT_ENDPOINTS = {"static", "asset", "service_worker"}
+ADMISSION_HEAVY_ENDPOINTS = {
+    "report",
+    "equipment_report",
+    "export_excel",
+    "export_csv",
+    "api_kpis",
+    "api_status_durations",
+}
+# Endpoints whose ?wait= holds a worker until something happens; they get the
+# "long_poll" class while waiting and answer at once when no slot is free.
+ADMISSION_LONG_POLL_ENDPOINTS = {"api_changes"}
+ADMISSION_MESSAGES = {
+    429: "طلبات كثيرة، يرجى المحاولة بعد قليل",
+    503: "الخادم مشغول، يرجى المحاولة بعد قليل",
+}
+
+
+class AdmissionControl:
+    """Per-route-class concurrency caps and per-user token buckets, shared by all workers on the host.
+
+    Requests are either "heavy" (reports and exports), "long_poll" (a change feed
+    read that may wait for new changes) or "interactive" (everything else). Each
+    class has a cap on requests running at once, a queue timeout for
+    waiting on a free slot, and a token bucket per user (or client address before
+    login). A request that cannot be admitted is rejected immediately with 429
+    (rate) or 503 (no slot) and a Retry-After header, so a report storm cannot
+    tie up every sync worker while logins and status updates wait behind it.
+
+    Slots and buckets live in a small SQLite file, updated in BEGIN IMMEDIATE
+    transactions. A slot is a lease row owned by a process; leases of processes
+    that died are reclaimed on the next acquire.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.classes = {}
+        self.local = threading.local()
+
+    def init_app(self, app):
+        if not app.config["ADMISSION_CONTROL"]:
+            return
+        self.path = app.config["ADMISSION_DB"]
+        self.classes = app.config["ADMISSION_CLASSES"]
+        self.lease_seconds = app.config["ADMISSION_LEASE_SECONDS"]
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(lease_id INTEGER PRIMARY KEY, route_class TEXT NOT NULL, pid INTEGER NOT NULL, acquired_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        app.before_request(self.admit)
+        app.after_request(self.release_on_close)
+        app.teardown_request(self.release_at_teardown)
+
+    def connection(self):
+        # One connection per thread and process; a forked worker opens its own.
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def take_token(self, key, rate, burst):
+        """Take one token from key's bucket; returns 0, or the seconds until a token is available."""
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens - 1, now),
+            )
+        return 0
+
+    def try_acquire(self, route_class, limit):
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM leases WHERE acquired_at < ?", (now - self.lease_seconds,))
+            for (pid,) in connection.execute("SELECT DISTINCT pid FROM leases").fetchall():
+                if not process_alive(pid):
+                    connection.execute("DELETE FROM leases WHERE pid = ?", (pid,))
+            (running,) = connection.execute(
+                "SELECT COUNT(*) FROM leases WHERE route_class = ?", (route_class,)
+            ).fetchone()
+            if running >= limit:
+                return None
+            return connection.execute(
+                "INSERT INTO leases (route_class, pid, acquired_at) VALUES (?, ?, ?)", (route_class, os.getpid(), now)
+            ).lastrowid
+
+    def acquire(self, route_class, limit, queue_seconds):
+        """A lease id, waiting up to queue_seconds for a free slot; None if none freed up."""
+        deadline = time.monotonic() + queue_seconds
+        while True:
+            lease_id = self.try_acquire(route_class, limit)
+            if lease_id is not None or time.monotonic() >= deadline:
+                return lease_id
+            time.sleep(0.05)
+
+    def release(self, lease_id):
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM leases WHERE lease_id = ?", (lease_id,))
+
+    def reject(self, status, retry_after):
+        retry_after = max(1, int(retry_after + 0.999))
+        if request.path.startswith("/api/") or is_outbox_replay() or request.accept_mimetypes.best == "application/json":
+            response = jsonify({"error": ADMISSION_MESSAGES[status]})
+        else:
+            response = Response(
+                render_template("busy.html", message=ADMISSION_MESSAGES[status], retry_after=retry_after),
+                mimetype="text/html",
+            )
+        response.status_code = status
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
+    def admit(self):
+        if request.endpoint is None or request.endpoint in ADMISSION_EXEMPT_ENDPOINTS:
+            return None
+        if request.endpoint in ADMISSION_LONG_POLL_ENDPOINTS and request.args.get("wait", "0") not in ("", "0"):
+            # A waiting request holds a sync worker for up to CHANGE_FEED_MAX_WAIT; without a
+            # free long-poll slot (or with none configured) it is served without waiting.
+            settings = self.classes["long_poll"]
+            lease_id = None
+            if settings["concurrency"]:
+                lease_id = self.acquire("long_poll", settings["concurrency"], settings["queue_seconds"])
+            if lease_id is not None:
+                g.admission_lease = lease_id
+                return None
+            g.long_poll_refused = True
+        route_class = "heavy" if request.endpoint in ADMISSION_HEAVY_ENDPOINTS else "interactive"
+        settings = self.classes[route_class]
+
+        if settings["rate"]:
+            key = f"{route_class}:{session.get('user_id') or request.remote_addr}"
+            wait = self.take_token(key, settings["rate"], settings["burst"])
+            if wait:
+                return self.reject(429, wait)
+        if settings["concurrency"]:
+            lease_id = self.acquire(route_class, settings["concurrency"], settings["queue_seconds"])
+            if lease_id is None:
+                return self.reject(503, settings["retry_after"])
+            g.admission_lease = lease_id
+        return None
+
+    def release_on_close(self, response):
+        # Streamed responses keep their slot until the last chunk is sent. Werkzeug
+        # never closes direct_passthrough responses (send_file), so those leave the
+        # lease to release_at_teardown.
+        if response.direct_passthrough:
+            return response
+        lease_id = g.pop("admission_lease", None)
+        if lease_id is not None:
+            response.call_on_close(lambda: self.release(lease_id))
+        return response
+
+    def release_at_teardown(self, error=None):
+        lease_id = g.pop("admission_lease", None)
+        if lease_id is not None:
+            self.release(lease_id)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def admission_classes():
+    """Concurrency cap, queue timeout, Retry-After and token bucket of each route class.
+
+    A cap of 0 means none, except for long-polls, which then never wait. Long-polls
+    and reports together may use all workers but one (WEB_CONCURRENCY is gunicorn's
+    worker count), so one is always left for logins and status updates; with two
+    workers or fewer long-polls do not wait at all. A report waits briefly for a
+    slot, since the waiting request holds its worker too.
+    """
+    workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+    long_poll = int(os.environ.get("ADMISSION_LONG_POLL_CONCURRENCY", 1 if workers > 2 else 0))
+    classes = {}
+    for route_class, concurrency, queue_seconds, rate, burst in (
+        ("heavy", max(1, workers - 1 - long_poll), 3, 1, 10),
+        ("long_poll", long_poll, 0, 0, 0),
+        ("interactive", 0, 2, 10, 30),
+    ):
+        prefix = f"ADMISSION_{route_class.upper()}_"
+        classes[route_class] = {
+            "concurrency": int(os.environ.get(prefix + "CONCURRENCY", concurrency)),
+            "queue_seconds": float(os.environ.get(prefix + "QUEUE_SECONDS", queue_seconds)),
+            "retry_after": float(os.environ.get(prefix + "RETRY_AFTER", 5)),
+            "rate": float(os.environ.get(prefix + "RATE", rate)),
+            "burst": float(os.environ.get(prefix + "BURST", burst)),
+        }
+    return classes
+
+
+admission_control = AdmissionControl()
+
+
+# ---------- static asset pipeline ----------
+VENDOR_ASSETS = {
+    "bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css",
+    "bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js",
+    "fontawesome.min.css": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css",
+    "webfonts/fa-solid-900.woff2": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/fa-solid-900.woff2",
+}
+ASSET_MAX_AGE = 365 * 24 * 3600
+PRECOMPRESSED_TYPES = (".css", ".js", ".svg", ".json")
+
+
+def load_asset_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, "dist", "manifest.json"), encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    """URL of a vendored asset: fingerprinted build, then plain vendor copy, then the CDN."""
+    hashed = current_app.config["ASSET_MANIFEST"].get(name)
+    if hashed:
+        return url_for("asset", filename=hashed)
+    if os.path.exists(os.path.join(current_app.static_folder, "vendor", name)):
+        return url_for("static", filename=f"vendor/{name}")
+    return VENDOR_ASSETS[name]
+
+
+def vendor_assets(static_folder):
+    for name, source_url in VENDOR_ASSETS.items():
+        path = os.path.join(static_folder, "vendor", name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(source_url, timeout=30) as response, open(path, "wb") as handle:
+            shutil.copyfileobj(response, handle)
+        print(f"Vendored {name}")
+
+
+def find_used_icons(template_folder):
+    icons = set()
+    for root, _, files in os.walk(template_folder):
+        for name in files:
+            with open(os.path.join(root, name), encoding="utf-8") as handle:
+                icons.update(re.findall(r"\bfa-([a-z0-9-]+)", handle.read()))
+    return icons
+
+
+def split_css_rules(css):
+    rules, depth, start = [], 0, 0
+    for index, char in enumerate(css):
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                rules.append(css[start:index + 1].strip())
+                start = index + 1
+    return rules
+
+
+def subset_icon_css(css, icons, available_fonts):
+    """Drop glyph rules for icons the templates never use and @font-face sources that were not vendored.
+
+    Returns the reduced stylesheet and the code points that are still referenced.
+    """
+    kept, codepoints = [], set()
+    for rule in split_css_rules(css):
+        selectors, _, body = rule.partition("{")
+        body = body.rstrip("}")
+        glyph = re.fullmatch(r'content:"\\([0-9a-f]+)"', body)
+        if glyph and all(re.fullmatch(r"\.fa-[a-z0-9-]+:(before|after)", sel) for sel in selectors.split(",")):
+            used = [sel for sel in selectors.split(",") if sel[4:].split(":")[0] in icons]
+            if used:
+                kept.append(",".join(used) + "{" + body + "}")
+                codepoints.add(int(glyph.group(1), 16))
+            continue
+        if selectors.startswith("@font-face"):
+            sources = [
+                src for src in re.findall(r"url\([^)]*\)[^,;}]*", body)
+                if re.search(r"webfonts/([^)?#]+)", src)
+                and re.search(r"webfonts/([^)?#]+)", src).group(1) in available_fonts
+            ]
+            if not sources:
+                continue
+            rule = "@font-face{" + re.sub(r"src:[^;}]*", "src:" + ",".join(sources), body) + "}"
+        kept.append(rule)
+    return "".join(kept), codepoints
+
+
+def subset_font(source, codepoints):
+    try:
+        from fontTools import subset
+    except ImportError:
+        subset = None
+    if subset is None or brotli is None:  # woff2 output needs both
+        with open(source, "rb") as handle:
+            return handle.read()
+
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    output = BytesIO()
+    subset.save_font(font, output, options)
+    return output.getvalue()
+
+
+def write_fingerprinted(dist_folder, name, content):
+    stem, ext = os.path.splitext(os.path.basename(name))
+    hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+    path = os.path.join(dist_folder, hashed)
+    with open(path, "wb") as handle:
+        handle.write(content)
+    if ext in PRECOMPRESSED_TYPES:
+        with open(path + ".gz", "wb") as handle:
+            handle.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as handle:
+                handle.write(brotli.compress(content, quality=11))
+    return hashed
+
+
+def build_assets(static_folder, template_folder):
+    vendor_folder = os.path.join(static_folder, "vendor")
+    dist_folder = os.path.join(static_folder, "dist")
+    shutil.rmtree(dist_folder, ignore_errors=True)
+    os.makedirs(dist_folder)
+
+    with open(os.path.join(vendor_folder, "fontawesome.min.css"), encoding="utf-8") as handle:
+        icon_css = handle.read()
+    fonts = {name[len("webfonts/"):] for name in VENDOR_ASSETS if name.startswith("webfonts/")}
+    icon_css, codepoints = subset_icon_css(icon_css, find_used_icons(template_folder), fonts)
+
+    manifest = {}
+    for font in sorted(fonts):
+        content = subset_font(os.path.join(vendor_folder, "webfonts", font), codepoints)
+        manifest[f"webfonts/{font}"] = write_fingerprinted(dist_folder, font, content)
+        icon_css = re.sub(r"url\(\.\./webfonts/" + re.escape(font) + r"\)", f"url({manifest[f'webfonts/{font}']})", icon_css)
+    manifest["fontawesome.min.css"] = write_fingerprinted(dist_folder, "fontawesome.min.css", icon_css.encode("utf-8"))
+
+    for name in ("bootstrap.min.css", "bootstrap.bundle.min.js"):
+        with open(os.path.join(vendor_folder, name), "rb") as handle:
+            manifest[name] = write_fingerprinted(dist_folder, name, handle.read())
+
+    with open(os.path.join(dist_folder, "manifest.json"), "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
+
+
+# ---------- response compression ----------
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+}
+
+
+class StripIndentExtension(Extension):
+    """Remove line indentation from template sources when they are compiled.
+
+    The work is done once per template load, not per render. Templates must not
+    rely on leading whitespace (e.g. inside <pre> or multi-line <textarea>).
+    """
+
+    def preprocess(self, source, name, filename=None):
+        if not getattr(self.environment, "strip_indent", False):
+            return source
+        return re.sub(r"^[ \t]+", "", source, flags=re.MULTILINE)
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def make_compressor(encoding, config):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config["COMPRESS_BR_LEVEL"])
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(config["COMPRESS_GZIP_LEVEL"], zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress_stream(chunks, encoding, config):
+    compress, flush, finish = make_compressor(encoding, config)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            # Flush every chunk so a streamed page still reaches the client progressively.
+            yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    config = current_app.config
+    if (
+        not config["COMPRESS_ENABLED"]
+        or response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    response.vary.add("Accept-Encoding")
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, config)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        compress, _, finish = make_compressor(encoding, config)
+        response.set_data(compress(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+# ---------- database dialect ----------
+def database_dialect():
+    """Name of the primary database's dialect: "postgresql" or "sqlite"."""
+    return db.engine.dialect.name
+
+
+def dialect_insert(table):
+    """The dialect's INSERT construct for table, which supports ON CONFLICT."""
+    return (postgresql_insert if database_dialect() == "postgresql" else sqlite_insert)(table)
+
+
+def upsert(table, values, index_elements, set_, returning=()):
+    """INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL, so concurrent first writes cannot collide."""
+    statement = dialect_insert(table).values(values)
+    statement = statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    if returning:
+        statement = statement.returning(*returning)
+    return db.session.execute(statement)
+
+
+def next_sequence(name, count=1):
+    """Reserve count numbers of sequence name for the current transaction and return the last one.
+
+    The counter row stays locked until commit, so sequence order is commit order
+    and a reader that has seen everything up to N never misses a later commit below N.
+    """
+    counter = SyncCounter.__table__
+    return upsert(
+        counter, {"name": name, "value": count}, ["name"], {"value": counter.c.value + count},
+        returning=(counter.c.value,),
+    ).scalar_one()
+
+
+def next_sync_seq(count=1):
+    return next_sequence("requests", count)
+
+
+# ---------- full-text search ----------
+SEARCH_FIELDS = ("requester_name", "phone_number", "equipment_name", "fault_type", "branch", "notes")
+ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ARABIC_LETTER_FORMS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4", "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+
+def normalize_search_text(value):
+    """Fold Arabic spelling variants (hamza forms, taa marbuta, tashkeel, Arabic digits) and case."""
+    return ARABIC_DIACRITICS.sub("", value or "").translate(ARABIC_LETTER_FORMS).casefold()
+
+
+def ensure_search_index():
+    if database_dialect() == "postgresql":
+        db.session.execute(text(
+            'CREATE TABLE IF NOT EXISTS "RequestSearch" ('
+            'request_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)'
+        ))
+        db.session.execute(text(
+            'CREATE INDEX IF NOT EXISTS "ix_RequestSearch_document" ON "RequestSearch" USING GIN (document)'
+        ))
+    else:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS RequestSearch USING fts5("
+            + ", ".join(SEARCH_FIELDS)
+            + ", tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    db.session.commit()
+
+
+def search_index_rows(request_items):
+    return [
+        {"request_id": item.request_id, **{field: normalize_search_text(getattr(item, field)) for field in SEARCH_FIELDS}}
+        for item in request_items
+    ]
+
+
+def index_requests_for_search(request_items):
+    """Add or replace the index entries of the given requests in the current transaction."""
+    rows = search_index_rows(request_items)
+    if not rows:
+        return
+    remove_from_search_index([row["request_id"] for row in rows])
+    if database_dialect() == "postgresql":
+        db.session.execute(text(
+            'INSERT INTO "RequestSearch" (request_id, document) VALUES (:request_id, '
+            "setweight(to_tsvector('simple', concat_ws(' ', :requester_name, :phone_number)), 'A') || "
+            "setweight(to_tsvector('simple', concat_ws(' ', :equipment_name, :fault_type, :branch)), 'B') || "
+            "setweight(to_tsvector('simple', :notes), 'C'))"
+        ), rows)
+    else:
+        db.session.execute(text(
+            f"INSERT INTO RequestSearch (rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"VALUES (:request_id, {', '.join(':' + field for field in SEARCH_FIELDS)})"
+        ), rows)
+
+
+def remove_from_search_index(request_ids):
+    if not request_ids:
+        return
+    if database_dialect() == "postgresql":
+        db.session.execute(text('DELETE FROM "RequestSearch" WHERE request_id = ANY(:ids)'), {"ids": list(request_ids)})
+    else:
+        db.session.execute(
+            text("DELETE FROM RequestSearch WHERE rowid = :request_id"),
+            [{"request_id": request_id} for request_id in request_ids],
+        )
+
+
+def rebuild_search_index(batch_size=1000):
+    ensure_search_index()
+    if database_dialect() == "postgresql":
+        db.session.execute(text('TRUNCATE "RequestSearch"'))
+    else:
+        db.session.execute(text("DELETE FROM RequestSearch"))
+
+    total, batch = 0, []
+    query = MaintenanceRequest.query.order_by(MaintenanceRequest.request_id).yield_per(batch_size)
+    for request_item in query:
+        batch.append(request_item)
+        if len(batch) == batch_size:
+            index_requests_for_search(batch)
+            total += len(batch)
+            batch = []
+    index_requests_for_search(batch)
+    db.session.commit()
+    return total + len(batch)
+
+
+def search_requests(query_text, limit=200):
+    """Return matching request ids ordered by relevance (best first)."""
+    terms = re.findall(r"\w+", normalize_search_text(query_text))
+    if not terms:
+        return []
+
+    if database_dialect() == "postgresql":
+        rows = db.session.execute(text(
+            'SELECT request_id FROM "RequestSearch", '
+            "to_tsquery('simple', :query) AS query "
+            "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, request_id DESC LIMIT :limit"
+        ), {"query": " & ".join(f"{term}:*" for term in terms), "limit": limit})
+    else:
+        rows = db.session.execute(text(
+            "SELECT rowid FROM RequestSearch WHERE RequestSearch MATCH :query "
+            "ORDER BY bm25(RequestSearch, 10.0, 10.0, 2.0, 2.0, 1.0, 1.0), rowid DESC LIMIT :limit"
+        ), {"query": " ".join(f'"{term}"*' for term in terms), "limit": limit})
+    return [row[0] for row in rows]
+
+
+# ---------- equipment reliability ----------
+def repeat_window_end(repaired_at):
+    days = current_app.config["REPEAT_FAILURE_DAYS"]
+    return (datetime.fromisoformat(repaired_at) + timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def record_failure(equipment_name, fault_type, branch, failed_at):
+    """Count a new request in the failure index, in the current transaction.
+
+    A failure is a repeat when the latest repair of the same key that ended at or
+    before it ended at most REPEAT_FAILURE_DAYS earlier; failure_history_query
+    applies the same rule when the index is rebuilt.
+    """
+    index = EquipmentFailureIndex.__table__
+    repeat = (index.c.last_repaired_at <= failed_at) & (index.c.repeat_window_until >= failed_at)
+    upsert(
+        index,
+        {
+            "equipment_name": equipment_name,
+            "fault_type": fault_type,
+            "branch": branch,
+            "failure_count": 1,
+            "repeat_count": 0,
+            "closed_count": 0,
+            "repair_seconds": 0,
+            "repaired_count": 0,
+            "first_failure_at": failed_at,
+            "last_failure_at": failed_at,
+        },
+        ["equipment_name", "fault_type", "branch"],
+        {
+            "failure_count": index.c.failure_count + 1,
+            "repeat_count": index.c.repeat_count + case((repeat, 1), else_=0),
+            "last_failure_at": failed_at,
+        },
+    )
+
+
+def record_repair(equipment_name, fault_type, branch, start_time, end_time):
+    """Count a closed request in the failure index, in the current transaction."""
+    index = EquipmentFailureIndex.__table__
+    repair_seconds = elapsed_seconds(start_time, end_time) if start_time and end_time else None
+    newer = index.c.last_repaired_at.is_(None) | (index.c.last_repaired_at < end_time)
+    upsert(
+        index,
+        {
+            "equipment_name": equipment_name,
+            "fault_type": fault_type,
+            "branch": branch,
+            "failure_count": 0,
+            "repeat_count": 0,
+            "closed_count": 1,
+            "repair_seconds": repair_seconds or 0,
+            "repaired_count": 1 if repair_seconds is not None else 0,
+            "last_repaired_at": end_time,
+            "repeat_window_until": repeat_window_end(end_time),
+        },
+        ["equipment_name", "fault_type", "branch"],
+        {
+            "closed_count": index.c.closed_count + 1,
+            "repair_seconds": index.c.repair_seconds + (repair_seconds or 0),
+            "repaired_count": index.c.repaired_count + (1 if repair_seconds is not None else 0),
+            "last_repaired_at": case((newer, end_time), else_=index.c.last_repaired_at),
+            "repeat_window_until": case((newer, repeat_window_end(end_time)), else_=index.c.repeat_window_until),
+        },
+    )
+
+
+# ---------- SLA deadlines ----------
+SLA_BATCH_SIZE = 500
+SLA_MESSAGES = {
+    "response": "تجاوز طلب الصيانة #{request_id} مهلة الاستجابة",
+    "resolution": "تجاوز طلب الصيانة #{request_id} مهلة الإصلاح",
+}
+# Deadlines met by moving a request into a status.
+SLA_MET_BY = {"in_progress": ("response",), "closed": ("response", "resolution")}
+
+
+def load_sla_policies():
+    return {(policy.maintenance_type, policy.branch): policy for policy in SlaPolicy.query}
+
+
+def sla_policy_for(policies, maintenance_type, branch):
+    """Most specific policy: type and branch, then type, then branch, then the default."""
+    for key in ((maintenance_type, branch), (maintenance_type, None), (None, branch), (None, None)):
+        if key in policies:
+            return policies[key]
+    return None
+
+
+def sla_deadline_rows(request_item, policies, kinds=("response", "resolution")):
+    policy = sla_policy_for(policies, request_item.maintenance_type, request_item.branch)
+    if policy is None:
+        return []
+    try:
+        requested_at = datetime.fromisoformat(request_item.request_date)
+    except (TypeError, ValueError):
+        return []
+    rows = []
+    for kind in kinds:
+        hours = getattr(policy, f"{kind}_hours")
+        if hours is not None:
+            due_at = (requested_at + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append({"request_id": request_item.request_id, "kind": kind, "due_at": due_at})
+    return rows
+
+
+def stage_sla_deadlines(request_items):
+    """Add the deadlines of new requests to the current transaction."""
+    policies = load_sla_policies()
+    rows = [row for request_item in request_items for row in sla_deadline_rows(request_item, policies)]
+    if rows:
+        db.session.execute(insert(SlaDeadline), rows)
+
+
+def clear_sla_deadlines(request_id, status):
+    """Drop the pending deadlines a status change meets; breached ones stay on record."""
+    kinds = SLA_MET_BY.get(status)
+    if kinds:
+        db.session.execute(
+            delete(SlaDeadline).where(
+                SlaDeadline.request_id == request_id,
+                SlaDeadline.kind.in_(kinds),
+                SlaDeadline.breached_at.is_(None),
+            )
+        )
+
+
+def check_sla_breaches(now=None, batch_size=SLA_BATCH_SIZE):
+    """Mark every pending deadline that has passed as breached and notify the engineers; returns the count.
+
+    Expired deadlines come off the front of ix_SlaDeadlines_pending, so a check
+    costs in proportion to what has expired, not to the number of open requests.
+    Marking is a compare-and-swap on breached_at, so each breach is notified
+    exactly once even with several detectors running.
+    """
+    now_text = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    g.sqlite_immediate = True
+    breached = 0
+    while True:
+        query = (
+            select(SlaDeadline.request_id, SlaDeadline.kind)
+            .where(SlaDeadline.breached_at.is_(None), SlaDeadline.due_at <= now_text)
+            .order_by(SlaDeadline.due_at)
+            .limit(batch_size)
+        )
+        if database_dialect() == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        expired = db.session.execute(query).all()
+        if not expired:
+            db.session.rollback()
+            return breached
+
+        marked = db.session.execute(
+            update(SlaDeadline)
+            .where(
+                tuple_(SlaDeadline.request_id, SlaDeadline.kind).in_([tuple(row) for row in expired]),
+                SlaDeadline.breached_at.is_(None),
+            )
+            .values(breached_at=now_text)
+            .returning(SlaDeadline.request_id, SlaDeadline.kind)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.add_all(
+            Notification(
+                request_id=request_id,
+                recipient_type="engineer",
+                message=SLA_MESSAGES[kind].format(request_id=request_id),
+                created_at=now_text,
+                is_read=False,
+            )
+            for request_id, kind in marked
+        )
+        db.session.commit()
+        breached += len(marked)
+        if len(expired) < batch_size:
+            return breached
+
+
+def next_sla_deadline():
+    """Earliest pending deadline, read from the front of ix_SlaDeadlines_pending."""
+    return db.session.query(func.min(SlaDeadline.due_at)).filter(SlaDeadline.breached_at.is_(None)).scalar()
+
+
+def rebuild_sla_deadlines(batch_size=1000):
+    """Recompute pending deadlines of unfinished requests, e.g. after changing policies or importing rows.
+
+    Breached deadlines are kept, and not re-created.
+    """
+    policies = load_sla_policies()
+    db.session.execute(delete(SlaDeadline).where(SlaDeadline.breached_at.is_(None)))
+    breached = set(db.session.execute(select(SlaDeadline.request_id, SlaDeadline.kind)).tuples())
+    rows = []
+    count = 0
+    unfinished = (
+        select(
+            MaintenanceRequest.request_id,
+            MaintenanceRequest.request_date,
+            MaintenanceRequest.maintenance_type,
+            MaintenanceRequest.branch,
+            MaintenanceRequest.status,
+        )
+        .where(MaintenanceRequest.status != "closed")
+        .execution_options(yield_per=batch_size)
+    )
+    for request_item in db.session.execute(unfinished):
+        kinds = ("response", "resolution") if request_item.status == "open" else ("resolution",)
+        rows += [
+            row for row in sla_deadline_rows(request_item, policies, kinds)
+            if (row["request_id"], row["kind"]) not in breached
+        ]
+        if len(rows) >= batch_size:
+            db.session.execute(insert(SlaDeadline), rows)
+            count += len(rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(SlaDeadline), rows)
+        count += len(rows)
+    db.session.commit()
+    return count
+
+
+# ---------- technician dispatch ----------
+# Which workload counter a request in a given status counts towards.
+WORKLOAD_BUCKETS = {"open": "open_count", "in_progress": "in_progress_count", "waiting": "in_progress_count"}
+
+
+def adjust_workload(technician_id, status, delta):
+    """Add delta to the technician's counter for status, in the current transaction."""
+    bucket = WORKLOAD_BUCKETS.get(status)
+    if technician_id is None or bucket is None:
+        return
+
+    column = getattr(TechnicianWorkload, bucket)
+    result = db.session.execute(
+        update(TechnicianWorkload)
+        .where(TechnicianWorkload.technician_id == technician_id)
+        .values({column: column + delta, TechnicianWorkload.active_count: TechnicianWorkload.active_count + delta})
+    )
+    if result.rowcount == 0:
+        technician = db.session.get(Technician, technician_id)
+        workload = TechnicianWorkload(
+            technician_id=technician_id,
+            branch_id=technician.branch_id,
+            open_count=0,
+            in_progress_count=0,
+            active_count=max(delta, 0),
+        )
+        setattr(workload, bucket, max(delta, 0))
+        db.session.add(workload)
+
+
+def least_loaded_technician_id(branch_id):
+    """Technician with the fewest open and in-progress requests in the branch.
+
+    Reads the first entry of the (branch_id, active_count, technician_id) index,
+    so the cost does not depend on the number of technicians or requests.
+    """
+    row = (
+        db.session.query(TechnicianWorkload.technician_id)
+        .filter(TechnicianWorkload.branch_id == branch_id)
+        .order_by(TechnicianWorkload.active_count, TechnicianWorkload.technician_id)
+        .first()
+    )
+    return row[0] if row else None
+
+
+def rebuild_technician_workloads():
+    """Recompute every workload counter from MaintenanceRequests."""
+    technicians = Technician.query.all()
+    technicians_by_name = {}
+    for technician in technicians:
+        technicians_by_name.setdefault(technician.technician_name, []).append(technician.technician_id)
+    for name, ids in technicians_by_name.items():
+        if len(ids) == 1:
+            MaintenanceRequest.query.filter(
+                MaintenanceRequest.assigned_technician_id.is_(None),
+                MaintenanceRequest.assigned_technician == name,
+            ).update({"assigned_technician_id": ids[0]}, synchronize_session=False)
+
+    workloads = {
+        technician.technician_id: TechnicianWorkload(
+            technician_id=technician.technician_id,
+            branch_id=technician.branch_id,
+            open_count=0,
+            in_progress_count=0,
+            active_count=0,
+        )
+        for technician in technicians
+    }
+    counts = (
+        db.session.query(MaintenanceRequest.assigned_technician_id, MaintenanceRequest.status, db.func.count())
+        .filter(MaintenanceRequest.assigned_technician_id.isnot(None))
+        .group_by(MaintenanceRequest.assigned_technician_id, MaintenanceRequest.status)
+    )
+    for technician_id, status, count in counts:
+        bucket = WORKLOAD_BUCKETS.get(status)
+        if bucket and technician_id in workloads:
+            workload = workloads[technician_id]
+            setattr(workload, bucket, getattr(workload, bucket) + count)
+            workload.active_count += count
+
+    TechnicianWorkload.query.delete()
+    db.session.add_all(workloads.values())
+    db.session.commit()
+    return len(workloads)
+
+
+def seed_data():
+    if Branch.query.first():
+        return
+
+    branches = [
+        Branch(branch_name="Main Branch"),
+        Branch(branch_name="Secondary Branch"),
+    ]
+    technicians = [
+        Technician(technician_name="Technician 1", phone_number="123456789", branch_id=1),
+        Technician(technician_name="Technician 2", phone_number="987654321", branch_id=2),
+    ]
+    maintenance_types = [
+        MaintenanceType(type_name="Preventive"),
+        MaintenanceType(type_name="Corrective"),
+    ]
+    equipment_names = [
+        EquipmentName(equipment_name="Machine A"),
+        EquipmentName(equipment_name="Machine B"),
+    ]
+    fault_types = [
+        FaultType(fault_name="Electrical"),
+        FaultType(fault_name="Mechanical"),
+    ]
+    spare_parts = [
+        SparePart(part_name="Motor"),
+        SparePart(part_name="Gearbox"),
+    ]
+
+    users = [
+        User(username="engineer", password=generate_password_hash("pass123"), role="engineer"),
+        User(username="technician", password=generate_password_hash("pass123"), role="technician", technician_id=1),
+        User(username="store", password=generate_password_hash("pass123"), role="store"),
+        User(username="branch", password=generate_password_hash("pass123"), role="branch"),
+        User(username="admin", password=generate_password_hash("pass123"), role="admin"),
+    ]
+
+    db.session.add_all(branches + technicians + maintenance_types + equipment_names + fault_types + spare_parts + users)
+    db.session.commit()
+    rebuild_technician_workloads()
+
+
+def authenticate_user(username, password):
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return None
+
+    if check_password_hash(user.password, password):
+        return user.role, user.technician_id, user.user_id
+
+    if user.password == password:
+        user.password = generate_password_hash(password)
+        db.session.commit()
+        return user.role, user.technician_id, user.user_id
+
+    return None
+
+
+def get_idempotent_result(idempotency_key):
+    if not idempotency_key:
+        return None
+    return db.session.get(IdempotencyKey, idempotency_key[:64])
+
+
+def commit_idempotent(idempotency_key, endpoint, request_id):
+    """Commit the pending changes together with the idempotency key.
+
+    Returns False when a concurrent submission with the same key committed first;
+    the pending changes are rolled back in that case.
+    """
+    if idempotency_key:
+        db.session.add(
+            IdempotencyKey(
+                key=idempotency_key[:64],
+                endpoint=endpoint,
+                request_id=request_id,
+                created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            )
+        )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        if get_idempotent_result(idempotency_key) is None:
+            raise
+        return False
+    return True
+
+
+def record_event(request_id, event_type, occurred_at=None, **fields):
+    """Append a RequestEvent to the current transaction; it commits or rolls back with the change it records."""
+    db.session.add(
+        RequestEvent(
+            request_id=request_id,
+            event_type=event_type,
+            occurred_at=occurred_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **fields,
+        )
+    )
+
+
+def stage_requests(data_items, dispatch=True):
+    """Add new requests to the current transaction with everything that goes with them.
+
+    One flush inserts all rows; search entries, history events, engineer
+    notifications, failure statistics and automatic dispatch follow per request.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    first_seq = next_sync_seq(len(data_items)) - len(data_items) + 1
+    request_items = [
+        MaintenanceRequest(
+            request_date=data.get("request_date") or now,
+            requester_name=data["requester_name"],
+            phone_number=data["phone_number"],
+            branch=data["branch"],
+            maintenance_type=data["maintenance_type"],
+            equipment_name=data["equipment_name"],
+            fault_type=data["fault_type"],
+            notes=data["notes"],
+            status="open",
+            sync_uuid=data.get("sync_uuid") or str(uuid.uuid4()),
+            sync_seq=first_seq + position,
+        )
+        for position, data in enumerate(data_items)
+    ]
+    db.session.add_all(request_items)
+    db.session.flush()
+    index_requests_for_search(request_items)
+    stage_sla_deadlines(request_items)
+
+    branch_ids = {}
+    for request_item in request_items:
+        record_event(
+            request_item.request_id, "created", request_item.request_date, to_status="open", version=request_item.version
+        )
+        enqueue_webhooks(
+            "created", request_item.request_id,
+            **{name: getattr(request_item, name) for name in WEBHOOK_REQUEST_FIELDS},
+        )
+        db.session.add(
+            Notification(
+                request_id=request_item.request_id,
+                recipient_type="engineer",
+                message=f"طلب صيانة جديد #{request_item.request_id} تم إنشاؤه",
+                created_at=now,
+                is_read=False,
+            )
+        )
+        record_failure(
+            request_item.equipment_name, request_item.fault_type, request_item.branch, request_item.request_date
+        )
+
+        if dispatch and current_app.config["AUTO_DISPATCH"]:
+            if request_item.branch not in branch_ids:
+                branch = Branch.query.filter_by(branch_name=request_item.branch).first()
+                branch_ids[request_item.branch] = branch.branch_id if branch else None
+            branch_id = branch_ids[request_item.branch]
+            technician_id = least_loaded_technician_id(branch_id) if branch_id is not None else None
+            if technician_id is not None:
+                assign_request(request_item, db.session.get(Technician, technician_id))
+    return request_items
+
+
+REQUIRED_REQUEST_FIELDS = ("requester_name", "phone_number", "branch", "maintenance_type", "equipment_name", "fault_type")
+
+
+def request_data_from(source):
+    """The fields of a new request from a form or a JSON object; raises ValueError naming the missing ones."""
+    missing = [name for name in REQUIRED_REQUEST_FIELDS if not str(source.get(name) or "").strip()]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    data = {name: str(source[name]) for name in REQUIRED_REQUEST_FIELDS}
+    data["notes"] = str(source.get("notes") or "")
+    return data
+
+
+def add_request(data, idempotency_key=None):
+    previous = get_idempotent_result(idempotency_key)
+    if previous:
+        return previous.request_id
+
+    request_item = stage_requests([data])[0]
+    if not commit_idempotent(idempotency_key, "create_request", request_item.request_id):
+        return get_idempotent_result(idempotency_key).request_id
+    return request_item.request_id
+
+
+def unread_notifications_query(recipient_type, recipient_id=None, user_id=None):
+    """Unresolved notifications for an audience that user_id has not read; served by ix_Notifications_unresolved."""
+    query = Notification.query.filter(
+        Notification.recipient_type == recipient_type,
+        Notification.resolved_at.is_(None),
+    )
+    if recipient_type == "technician" and recipient_id is not None:
+        query = query.filter(Notification.recipient_id == recipient_id)
+    if user_id is not None:
+        query = query.filter(
+            ~select(NotificationReceipt.notification_id)
+            .where(
+                NotificationReceipt.user_id == user_id,
+                NotificationReceipt.notification_id == Notification.notification_id,
+            )
+            .exists()
+        )
+    return query
+
+
+def get_notifications(recipient_type, recipient_id=None, user_id=None):
+    query = unread_notifications_query(recipient_type, recipient_id, user_id)
+    return query.order_by(Notification.notification_id.desc()).all()
+
+
+def count_unread_notifications(recipient_type, recipient_id=None, user_id=None):
+    return unread_notifications_query(recipient_type, recipient_id, user_id).order_by(None).count()
+
+
+def mark_notifications_read(user_id, notification_ids):
+    """Add read receipts for user_id; notifications already read are skipped."""
+    if not notification_ids:
+        return 0
+    already_read = set(
+        db.session.execute(
+            select(NotificationReceipt.notification_id).where(
+                NotificationReceipt.user_id == user_id,
+                NotificationReceipt.notification_id.in_(notification_ids),
+            )
+        ).scalars()
+    )
+    read_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    receipts = [
+        NotificationReceipt(user_id=user_id, notification_id=notification_id, read_at=read_at)
+        for notification_id in set(notification_ids) - already_read
+    ]
+    db.session.add_all(receipts)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same user read them from another tab at the same moment.
+        db.session.rollback()
+        return 0
+    return len(receipts)
+
+
+def resolve_notifications(request_id, recipient_type, recipient_id=None):
+    """Mark a request's notifications for an audience as no longer actionable, for every user at once.
+
+    Their read receipts are dropped in the same transaction, so the receipts table
+    only ever holds rows for live notifications.
+    """
+    condition = [
+        Notification.request_id == request_id,
+        Notification.recipient_type == recipient_type,
+        Notification.resolved_at.is_(None),
+    ]
+    if recipient_id is not None:
+        condition.append(Notification.recipient_id == recipient_id)
+    db.session.execute(
+        delete(NotificationReceipt)
+        .where(NotificationReceipt.notification_id.in_(select(Notification.notification_id).where(*condition)))
+        .execution_options(synchronize_session=False)
+    )
+    resolved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    resolved = db.session.execute(
+        update(Notification)
+        .where(*condition)
+        .values(resolved_at=resolved_at)
+        .returning(Notification.notification_id)
+        .execution_options(synchronize_session=False)
+    ).scalars()
+    for notification_id in resolved:
+        record_change("notification", notification_id, "update", resolved_at=resolved_at)
+
+
+def backfill_notification_resolution():
+    """Resolve notifications from before resolved_at existed; returns the count. Safe to run again.
+
+    The old shared is_read flag meant somebody had dealt with the notification,
+    and notifications about a closed request that predate its closing are no
+    longer actionable. Both would otherwise stay in ix_Notifications_unresolved.
+    """
+    table = Notification.__table__
+    requests = MaintenanceRequest.__table__
+    read = db.session.execute(
+        table.update()
+        .where(table.c.resolved_at.is_(None), table.c.is_read.is_(True))
+        .values(resolved_at=table.c.created_at)
+    ).rowcount
+    closed_before = (
+        select(requests.c.end_time)
+        .where(requests.c.request_id == table.c.request_id, requests.c.status == "closed")
+        .scalar_subquery()
+    )
+    superseded = db.session.execute(
+        table.update()
+        .where(
+            table.c.resolved_at.is_(None),
+            table.c.recipient_type.in_(("engineer", "technician")),
+            table.c.created_at < closed_before,
+        )
+        .values(resolved_at=closed_before)
+    ).rowcount
+    db.session.execute(
+        delete(NotificationReceipt).where(
+            NotificationReceipt.notification_id.in_(
+                select(table.c.notification_id).where(table.c.resolved_at.is_not(None))
+            )
+        )
+    )
+    db.session.commit()
+    return read + superseded
+
+
+# Allowed previous statuses for each target status: open -> in_progress -> waiting -> closed,
+# with waiting -> in_progress when the parts arrive.
+STATUS_TRANSITIONS = {
+    "in_progress": ("open", "waiting"),
+    "waiting": ("in_progress",),
+    "closed": ("in_progress", "waiting"),
+}
+
+
+class RequestConflictError(Exception):
+    """The request was changed concurrently, or its status does not allow the change."""
+
+    def __init__(self, request_id, current_status=None, current_version=None):
+        super().__init__(f"request #{request_id} is {current_status} (version {current_version})")
+        self.request_id = request_id
+        self.current_status = current_status
+        self.current_version = current_version
+
+
+def conflict_or_missing(request_id):
+    current = db.session.execute(
+        select(MaintenanceRequest.status, MaintenanceRequest.version).where(MaintenanceRequest.request_id == request_id)
+    ).first()
+    db.session.rollback()
+    if current is None:
+        return False
+    raise RequestConflictError(request_id, current.status, current.version)
+
+
+def notify_assignment(request_id, technician, previous_technician_id=None):
+    resolve_notifications(request_id, "engineer")
+    if previous_technician_id is not None:
+        resolve_notifications(request_id, "technician", previous_technician_id)
+    db.session.add(
+        Notification(
+            request_id=request_id,
+            recipient_type="technician",
+            recipient_id=technician.technician_id,
+            message=f"تم تعيينك لطلب صيانة رقم #{request_id}",
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            is_read=False,
+        )
+    )
+
+
+def assign_request(request_item, technician):
+    """Assign a request that is still pending in the current session (e.g. from add_request)."""
+    adjust_workload(technician.technician_id, request_item.status, 1)
+    request_item.assigned_technician = technician.technician_name
+    request_item.assigned_technician_id = technician.technician_id
+    record_event(
+        request_item.request_id, "assigned", technician_id=technician.technician_id, version=request_item.version
+    )
+    enqueue_webhooks(
+        "assigned", request_item.request_id,
+        assigned_technician=technician.technician_name, assigned_technician_id=technician.technician_id,
+    )
+    notify_assignment(request_item.request_id, technician)
+
+
+def assign_technician(request_id, technician_id, expected_version=None):
+    """Assign or reassign a request, guarded by its version.
+
+    Raises RequestConflictError when the request is closed, or when its version is
+    not expected_version (or changed between the read and the update).
+    """
+    if not stage_assignment(request_id, technician_id, expected_version):
+        return False
+    db.session.commit()
+    fragment_cache.invalidate(request_id)
+    return True
+
+
+def stage_assignment(request_id, technician_id, expected_version=None):
+    """The work of assign_technician, left uncommitted in the current transaction."""
+    technician = db.session.get(Technician, technician_id)
+    current = db.session.execute(
+        select(MaintenanceRequest.status, MaintenanceRequest.assigned_technician_id, MaintenanceRequest.version)
+        .where(MaintenanceRequest.request_id == request_id)
+    ).first()
+    if not technician or not current:
+        return False
+    if current.status == "closed" or (expected_version is not None and current.version != expected_version):
+        raise RequestConflictError(request_id, current.status, current.version)
+    if current.assigned_technician_id == technician.technician_id:
+        return True
+
+    result = db.session.execute(
+        update(MaintenanceRequest)
+        .where(MaintenanceRequest.request_id == request_id, MaintenanceRequest.version == current.version)
+        .values(
+            assigned_technician=technician.technician_name,
+            assigned_technician_id=technician.technician_id,
+            version=MaintenanceRequest.version + 1,
+            sync_seq=next_sync_seq(),
+            sync_origin=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        return conflict_or_missing(request_id)
+
+    adjust_workload(current.assigned_technician_id, current.status, -1)
+    adjust_workload(technician.technician_id, current.status, 1)
+    record_event(request_id, "assigned", technician_id=technician.technician_id, version=current.version + 1)
+    record_change(
+        "request", request_id, "update",
+        assigned_technician=technician.technician_name,
+        assigned_technician_id=technician.technician_id,
+        version=current.version + 1,
+    )
+    enqueue_webhooks(
+        "assigned", request_id,
+        assigned_technician=technician.technician_name,
+        assigned_technician_id=technician.technician_id,
+        version=current.version + 1,
+    )
+    notify_assignment(request_id, technician, current.assigned_technician_id)
+    return True
+
+
+def transition_status(
+    request_id, status, from_status, expected_version=None, start_time=None, end_time=None, sync_seq=None
+):
+    """Compare-and-swap the status in a single UPDATE.
+
+    Returns the assigned technician id and the new version, or None if nothing matched.
+    """
+    values = {"status": status, "version": MaintenanceRequest.version + 1, "sync_seq": sync_seq, "sync_origin": None}
+    if status == "in_progress":
+        values["start_time"] = start_time or func.coalesce(
+            MaintenanceRequest.start_time, datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+    elif status == "closed":
+        values["end_time"] = end_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    statement = update(MaintenanceRequest).where(
+        MaintenanceRequest.request_id == request_id,
+        MaintenanceRequest.status == from_status,
+    )
+    if expected_version is not None:
+        statement = statement.where(MaintenanceRequest.version == expected_version)
+    row = db.session.execute(
+        statement.values(values)
+        .returning(
+            MaintenanceRequest.assigned_technician_id,
+            MaintenanceRequest.version,
+            MaintenanceRequest.equipment_name,
+            MaintenanceRequest.fault_type,
+            MaintenanceRequest.branch,
+            MaintenanceRequest.start_time,
+            MaintenanceRequest.end_time,
+        )
+        .execution_options(synchronize_session=False)
+    ).first()
+    return row
+
+
+def update_request_status(request_id, status, start_time=None, end_time=None, expected_version=None, idempotency_key=None):
+    """Move a request along the status state machine without reading it first.
+
+    Returns False if the request does not exist and raises RequestConflictError if
+    its current status (or version, when expected_version is given) does not allow
+    the transition.
+    """
+    if get_idempotent_result(idempotency_key):
+        return True
+    if not stage_status_change(request_id, status, start_time, end_time, expected_version):
+        return False
+    if commit_idempotent(idempotency_key, "update_status", request_id):
+        fragment_cache.invalidate(request_id)
+    return True
+
+
+def stage_status_change(request_id, status, start_time=None, end_time=None, expected_version=None):
+    """The work of update_request_status, left uncommitted in the current transaction."""
+    if status not in STATUS_TRANSITIONS:
+        raise ValueError(f"unknown status: {status}")
+
+    # One statement per allowed previous status, so the previous status is known without a read.
+    sync_seq = next_sync_seq()
+    for from_status in STATUS_TRANSITIONS[status]:
+        row = transition_status(request_id, status, from_status, expected_version, start_time, end_time, sync_seq)
+        if row is not None:
+            break
+    else:
+        return conflict_or_missing(request_id)
+
+    adjust_workload(row.assigned_technician_id, from_status, -1)
+    adjust_workload(row.assigned_technician_id, status, 1)
+    record_event(
+        request_id,
+        "status_changed",
+        from_status=from_status,
+        to_status=status,
+        technician_id=row.assigned_technician_id,
+        version=row.version,
+    )
+    record_change(
+        "request", request_id, "update",
+        status=status, version=row.version, start_time=row.start_time, end_time=row.end_time,
+    )
+    clear_sla_deadlines(request_id, status)
+
+    if status == "closed":
+        enqueue_webhooks(
+            "closed", request_id,
+            status=status, version=row.version, start_time=row.start_time, end_time=row.end_time,
+            assigned_technician_id=row.assigned_technician_id,
+        )
+        record_repair(row.equipment_name, row.fault_type, row.branch, row.start_time, row.end_time)
+        # Assignment requests and SLA breach alerts are settled once the request is closed.
+        resolve_notifications(request_id, "technician")
+        resolve_notifications(request_id, "engineer")
+        for recipient_type in ("requester", "engineer"):
+            db.session.add(
+                Notification(
+                    request_id=request_id,
+                    recipient_type=recipient_type,
+                    message=f"تم إغلاق طلب الصيانة #{request_id}",
+                    created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    is_read=False,
+                )
+            )
+    return True
+
+
+# ---------- request history ----------
+def event_as_dict(event):
+    return {
+        "event_id": event.event_id,
+        "event_type": event.event_type,
+        "from_status": event.from_status,
+        "to_status": event.to_status,
+        "technician_id": event.technician_id,
+        "version": event.version,
+        "occurred_at": event.occurred_at,
+    }
+
+
+def request_timeline(request_id, until=None):
+    """Events of one request in the order they were written, optionally only those up to `until`."""
+    query = RequestEvent.query.filter(RequestEvent.request_id == request_id)
+    if until:
+        query = query.filter(RequestEvent.occurred_at <= until)
+    return query.order_by(RequestEvent.event_id).all()
+
+
+def replay_events(events):
+    """Fold a timeline into the request state it describes; None for an empty timeline."""
+    state = None
+    for event in events:
+        if state is None:
+            state = {"status": None, "assigned_technician_id": None, "version": None, "created_at": event.occurred_at}
+        if event.to_status:
+            state["status"] = event.to_status
+        if event.event_type == "assigned":
+            state["assigned_technician_id"] = event.technician_id
+        state["version"] = event.version or state["version"]
+        state["updated_at"] = event.occurred_at
+    return state
+
+
+def elapsed_seconds(since, until):
+    return max(int((datetime.fromisoformat(until) - datetime.fromisoformat(since)).total_seconds()), 0)
+
+
+def durations_from_events(events, now=None):
+    """Seconds spent in each status, counting the current status up to now unless it is closed."""
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    durations = {}
+    current = None
+    for event in events:
+        if not event.to_status:
+            continue
+        if current:
+            durations[current[0]] = durations.get(current[0], 0) + elapsed_seconds(current[1], event.occurred_at)
+        current = (event.to_status, event.occurred_at)
+    if current and current[0] != "closed":
+        durations[current[0]] = durations.get(current[0], 0) + elapsed_seconds(current[1], now)
+    return durations
+
+
+def update_status_durations(batch_size=1000, settle_seconds=None):
+    """Fold events past the high-water mark into RequestStatusDurations.
+
+    Only events newer than the last run are read, so the cost follows the number
+    of new status changes rather than the size of the history. Events younger than
+    settle_seconds are left for the next run, so a transaction that committed a
+    lower event id slightly later is not skipped. Returns the number of events read.
+    """
+    if settle_seconds is None:
+        settle_seconds = current_app.config["ANALYTICS_SETTLE_SECONDS"]
+    cutoff = (datetime.now() - timedelta(seconds=settle_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    g.sqlite_immediate = True
+    watermark = db.session.get(AnalyticsWatermark, "status_durations")
+    if watermark is None:
+        watermark = AnalyticsWatermark(name="status_durations", last_event_id=0)
+        db.session.add(watermark)
+        db.session.commit()
+
+    processed = 0
+    while True:
+        last_event_id = watermark.last_event_id
+        events = (
+            RequestEvent.query.filter(RequestEvent.event_id > last_event_id, RequestEvent.occurred_at <= cutoff)
+            .order_by(RequestEvent.event_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not events:
+            return processed
+
+        request_ids = {event.request_id for event in events if event.to_status}
+        cursors = {
+            cursor.request_id: cursor
+            for cursor in RequestStatusCursor.query.filter(RequestStatusCursor.request_id.in_(request_ids))
+        } if request_ids else {}
+        durations = {
+            (duration.request_id, duration.status): duration
+            for duration in RequestStatusDuration.query.filter(RequestStatusDuration.request_id.in_(request_ids))
+        } if request_ids else {}
+
+        for event in events:
+            if not event.to_status:
+                continue
+            cursor = cursors.get(event.request_id)
+            if cursor is None:
+                cursor = cursors[event.request_id] = RequestStatusCursor(request_id=event.request_id)
+                db.session.add(cursor)
+            else:
+                duration = durations.get((event.request_id, cursor.status))
+                if duration is None:
+                    duration = durations[(event.request_id, cursor.status)] = RequestStatusDuration(
+                        request_id=event.request_id, status=cursor.status, seconds=0
+                    )
+                    db.session.add(duration)
+                duration.seconds += elapsed_seconds(cursor.since, event.occurred_at)
+            cursor.status = event.to_status
+            cursor.since = event.occurred_at
+
+        # Advance the mark only if no concurrent run has moved it; the losing run discards its batch.
+        result = db.session.execute(
+            update(AnalyticsWatermark)
+            .where(AnalyticsWatermark.name == "status_durations", AnalyticsWatermark.last_event_id == last_event_id)
+            .values(last_event_id=events[-1].event_id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            return processed
+        db.session.commit()
+        watermark.last_event_id = events[-1].event_id
+        processed += len(events)
+
+
+def status_duration_summary():
+    """Total and average seconds per status over all completed status intervals."""
+    rows = db.session.query(
+        RequestStatusDuration.status,
+        func.count(),
+        func.sum(RequestStatusDuration.seconds),
+    ).group_by(RequestStatusDuration.status)
+    return {
+        status: {"requests": count, "total_seconds": total or 0, "average_seconds": round((total or 0) / count)}
+        for status, count, total in rows
+    }
+
+
+def backfill_request_events(batch_size=1000):
+    """Write events for requests created before the event log existed, from their timestamps.
+
+    Time spent waiting for parts was never recorded, so a request that is waiting
+    now is treated as having entered that status when it was started.
+    """
+    has_events = select(RequestEvent.event_id).where(RequestEvent.request_id == MaintenanceRequest.request_id).exists()
+    query = MaintenanceRequest.query.filter(~has_events).order_by(MaintenanceRequest.request_id)
+    written = 0
+    for item in query.yield_per(batch_size):
+        record_event(item.request_id, "created", item.request_date, to_status="open")
+        if item.assigned_technician_id:
+            record_event(item.request_id, "assigned", item.request_date, technician_id=item.assigned_technician_id)
+        if item.start_time and item.status != "open":
+            record_event(item.request_id, "status_changed", item.start_time, from_status="open", to_status="in_progress")
+            if item.status == "waiting":
+                record_event(item.request_id, "status_changed", item.start_time, from_status="in_progress", to_status="waiting")
+        if item.status == "closed":
+            record_event(
+                item.request_id,
+                "status_changed",
+                item.end_time or item.start_time or item.request_date,
+                from_status="in_progress" if item.start_time else "open",
+                to_status="closed",
+                version=item.version,
+            )
+        written += 1
+    db.session.commit()
+    return written
+
+
+# ---------- bulk export / import ----------
+# Exported columns and their headers in the Excel/CSV files.
+EXPORT_COLUMNS = {
+    "request_id": "رقم الطلب",
+    "request_date": "التاريخ",
+    "requester_name": "الطالب",
+    "phone_number": "الهاتف",
+    "branch": "الفرع",
+    "maintenance_type": "نوع الصيانة",
+    "equipment_name": "المعدة",
+    "fault_type": "العطل",
+    "status": "الحالة",
+}
+EXPORT_BATCH_SIZE = 5000
+IMPORT_BATCH_SIZE = 5000
+IMPORT_TABLES = {"requests": MaintenanceRequest.__table__, "notifications": Notification.__table__}
+
+
+def write_requests_csv(out, date_from=None, date_to=None):
+    """Write the requests as CSV rows (no header) to the binary file `out`.
+
+    PostgreSQL streams the rows with COPY ... TO STDOUT without building a Python
+    object per row; other databases fetch plain tuples in batches.
+    """
+    query = requests_query(date_from, date_to, columns=list(EXPORT_COLUMNS))
+    # Passing the query lets the routing session pick the replica for export views.
+    connection = db.session.connection(bind_arguments={"clause": query})
+    if connection.dialect.name == "postgresql":
+        sql = str(query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", out)
+        return
+
+    text_out = TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text_out)
+    for rows in db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE)).partitions():
+        writer.writerows(rows)
+    text_out.flush()
+    text_out.detach()
+
+
+def spool_requests_csv(date_from=None, date_to=None):
+    """The export as a rewound temporary file; kept in memory up to 32 MB."""
+    spool = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    write_requests_csv(spool, date_from, date_to)
+    spool.seek(0)
+    return spool
+
+
+def iter_file(handle, chunk_size=64 * 1024):
+    try:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
+
+
+def coerce_csv_value(column, value):
+    if value == "":
+        return None
+    python_type = column.type.python_type
+    if python_type is bool:
+        return value.strip().lower() in ("1", "t", "true", "yes")
+    if python_type is int:
+        return int(value)
+    return value
+
+
+def record_imported_rows(table, rows):
+    """Queue change-feed inserts for rows written by import_csv, which bypasses the ORM."""
+    entity, key = next(
+        (entity, key) for model, (entity, key) in CHANGE_FEED_ENTITIES.items() if model.__table__ is table
+    )
+    for row in rows:
+        data = row._asdict()
+        record_change(entity, data[key], "insert", **data)
+
+
+def import_csv(kind, handle):
+    """Bulk-load a CSV file with a header row into MaintenanceRequests or Notifications.
+
+    PostgreSQL uses COPY ... FROM STDIN; other databases insert batches of
+    IMPORT_BATCH_SIZE rows. Every row is added to the change feed in the same
+    transaction. Returns the number of rows loaded.
+    """
+    table = IMPORT_TABLES[kind]
+    header = next(csv.reader([handle.readline()]))
+    unknown = [name for name in header if name not in table.c]
+    if unknown:
+        raise ValueError(f"unknown columns for {table.name}: {', '.join(unknown)}")
+    required = [
+        column.name
+        for column in table.columns
+        if not column.nullable and column.server_default is None and not column.primary_key
+    ]
+    missing = [name for name in required if name not in header]
+    if missing:
+        raise ValueError(f"missing columns for {table.name}: {', '.join(missing)}")
+
+    connection = db.session.connection()
+    if connection.dialect.name == "postgresql":
+        columns = ", ".join(f'"{name}"' for name in header)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv)', handle)
+            count = cursor.rowcount
+            primary_key = table.primary_key.columns.values()[0].name
+            if primary_key in header:
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{primary_key}'), "
+                    f'COALESCE(MAX("{primary_key}"), 1)) FROM "{table.name}"'
+                )
+        # COPY returns no ids; the rows this transaction inserted are the imported ones.
+        inserted = db.session.execute(
+            select(table)
+            .where(text("xmin = (txid_current() % 4294967296)::text::xid"))
+            .execution_options(yield_per=IMPORT_BATCH_SIZE)
+        )
+        for rows in inserted.partitions():
+            record_imported_rows(table, rows)
+            write_change_log(db.session)
+        db.session.commit()
+        return count
+
+    columns = [table.c[name] for name in header]
+    count = 0
+    batch = []
+    for row in csv.reader(handle):
+        batch.append({column.name: coerce_csv_value(column, value) for column, value in zip(columns, row)})
+        if len(batch) == IMPORT_BATCH_SIZE:
+            record_imported_rows(table, db.session.execute(table.insert().returning(*table.c), batch))
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        record_imported_rows(table, db.session.execute(table.insert().returning(*table.c), batch))
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+# ---------- archive ----------
+ARCHIVE_BATCH_SIZE = 500
+
+
+def archive_cutoff():
+    """Newest cutoff of any archive run, or None if nothing was archived."""
+    return db.session.query(func.max(ArchiveRun.cutoff)).scalar()
+
+
+def archive_closed_requests(older_than_days, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move closed requests that ended more than older_than_days ago, with their notifications, to the archive.
+
+    Each batch is copied and deleted in its own short transaction, so writers are
+    never blocked for long. Returns (requests, notifications) moved.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    hot_requests, hot_notifications = MaintenanceRequest.__table__, Notification.__table__
+    ended_at = func.coalesce(hot_requests.c.end_time, hot_requests.c.request_date)
+
+    moved_requests = moved_notifications = 0
+    while True:
+        ids = db.session.execute(
+            select(hot_requests.c.request_id)
+            .where(hot_requests.c.status == "closed", ended_at < cutoff)
+            .order_by(hot_requests.c.request_id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        for hot, cold in ((hot_requests, archived_requests_table), (hot_notifications, archived_notifications_table)):
+            db.session.execute(
+                insert(cold).from_select(
+                    [column.name for column in cold.columns],
+                    select(*hot.columns, literal(now)).where(hot.c.request_id.in_(ids)),
+                )
+            )
+        db.session.execute(
+            delete(NotificationReceipt).where(
+                NotificationReceipt.notification_id.in_(
+                    select(hot_notifications.c.notification_id).where(hot_notifications.c.request_id.in_(ids))
+                )
+            )
+        )
+        notification_ids = db.session.execute(
+            delete(hot_notifications)
+            .where(hot_notifications.c.request_id.in_(ids))
+            .returning(hot_notifications.c.notification_id)
+        ).scalars().all()
+        moved_notifications += len(notification_ids)
+        db.session.execute(delete(SlaDeadline).where(SlaDeadline.request_id.in_(ids)))
+        moved_requests += db.session.execute(delete(hot_requests).where(hot_requests.c.request_id.in_(ids))).rowcount
+        for entity, entity_ids in (("notification", notification_ids), ("request", ids)):
+            for entity_id in entity_ids:
+                record_change(entity, entity_id, "archive")
+        remove_from_search_index(ids)
+        db.session.commit()
+        for request_id in ids:
+            fragment_cache.invalidate(request_id)
+
+    db.session.add(
+        ArchiveRun(
+            cutoff=cutoff,
+            archived_requests=moved_requests,
+            archived_notifications=moved_notifications,
+            finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    )
+    db.session.commit()
+    return moved_requests, moved_notifications
+
+
+def requests_query(date_from=None, date_to=None, columns=None, ordered=True):
+    """Requests as plain rows, newest first unless ordered is False, optionally limited to [date_from, date_to].
+
+    Archived requests are included with UNION ALL whenever the range can reach
+    them: without date_from, or with one before the archive cutoff. Only a range
+    that starts after the cutoff reads the hot table alone.
+    """
+    tables = [MaintenanceRequest.__table__]
+    cutoff = archive_cutoff()
+    if cutoff and (not date_from or date_from < cutoff):
+        tables.append(archived_requests_table)
+
+    selects = []
+    for table in tables:
+        query = select(*[table.c[name] for name in (columns or MaintenanceRequest.__table__.c.keys())])
+        if date_from:
+            query = query.where(table.c.request_date >= date_from)
+        if date_to:
+            query = query.where(table.c.request_date <= f"{date_to} 23:59:59")
+        selects.append(query)
+    if len(selects) == 1:
+        return selects[0].order_by(tables[0].c.request_id.desc()) if ordered else selects[0]
+    combined = union_all(*selects).subquery()
+    return select(combined).order_by(combined.c.request_id.desc()) if ordered else select(combined)
+
+
+# ---------- KPIs ----------
+KPI_COLUMNS = ["request_date", "branch", "assigned_technician", "status", "start_time", "end_time"]
+KPI_CHUNK_SIZE = 200_000
+BACKLOG_AGE_BINS = [0, 1, 3, 7, 30, float("inf")]
+BACKLOG_AGE_LABELS = ["0-1d", "1-3d", "3-7d", "7-30d", "30d+"]
+UNASSIGNED_LABEL = "غير معين"
+DURATION_METRICS = ("repair", "response", "resolution")
+
+
+def parse_timestamps(values):
+    return pd.to_datetime(values, format="%Y-%m-%d %H:%M:%S", errors="coerce")
+
+
+def kpi_chunk_aggregates(chunk, now):
+    """Per-branch and per-technician partial sums for one chunk; combined later by kpi_results."""
+    requested = parse_timestamps(chunk["request_date"])
+    started = parse_timestamps(chunk["start_time"])
+    ended = parse_timestamps(chunk["end_time"])
+    closed = chunk["status"] == "closed"
+    backlog_age_days = ((now - requested).dt.total_seconds() / 86400).where(~closed)
+
+    frame = pd.DataFrame({
+        "branch": chunk["branch"].fillna(UNASSIGNED_LABEL),
+        "technician": chunk["assigned_technician"].fillna(UNASSIGNED_LABEL),
+        "closed": closed,
+        "backlog": ~closed,
+        # Time to repair from the start of work, time to first response, and request-to-close.
+        "repair": (ended - started).dt.total_seconds().where(closed),
+        "response": (started - requested).dt.total_seconds(),
+        "resolution": (ended - requested).dt.total_seconds().where(closed),
+        "age_bucket": pd.cut(backlog_age_days, BACKLOG_AGE_BINS, labels=BACKLOG_AGE_LABELS, right=False),
+    })
+    for metric in DURATION_METRICS:
+        # Clock skew and hand-edited rows: negative durations are dropped, not averaged.
+        frame[metric] = frame[metric].where(frame[metric] >= 0)
+
+    aggregations = {
+        "requests": ("closed", "size"),
+        "closed": ("closed", "sum"),
+        "backlog": ("backlog", "sum"),
+    }
+    for metric in DURATION_METRICS:
+        aggregations[f"{metric}_sum"] = (metric, "sum")
+        aggregations[f"{metric}_count"] = (metric, "count")
+
+    partials = {}
+    for key in ("branch", "technician"):
+        totals = frame.groupby(key).agg(**aggregations)
+        ages = frame.groupby([key, "age_bucket"], observed=False).size().unstack(fill_value=0)
+        partials[key] = totals.join(ages.reindex(columns=BACKLOG_AGE_LABELS, fill_value=0), how="left").fillna(0)
+    return partials
+
+
+def kpi_rows(totals):
+    """Turn summed partials into JSON-ready rows with averages in hours."""
+    result = pd.DataFrame(index=totals.index)
+    for column in ("requests", "closed", "backlog"):
+        result[column] = totals[column].astype(int)
+    for metric in DURATION_METRICS:
+        count = totals[f"{metric}_count"]
+        result[f"{metric}_hours"] = (totals[f"{metric}_sum"] / count.where(count > 0) / 3600).round(2)
+    result["backlog_age"] = totals[BACKLOG_AGE_LABELS].astype(int).to_dict("records")
+    result = result.astype(object).where(result.notna(), None)
+    return result
+
+
+def read_sql_chunks(query, chunksize):
+    """pd.read_sql over the session's connection for query, chunksize rows per DataFrame."""
+    connection = db.session.connection(bind_arguments={"clause": query})
+    source = connection
+    if connection.dialect.name == "sqlite":
+        # pandas reads sqlite3 directly, skipping SQLAlchemy's per-row result processing.
+        query = str(query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        source = connection.connection.driver_connection
+    return pd.read_sql(query, source, chunksize=chunksize)
+
+
+def compute_kpis(date_from=None, date_to=None, chunksize=KPI_CHUNK_SIZE, now=None):
+    """Mean time to repair, response time and backlog aging, overall and per branch and technician.
+
+    Reads only KPI_COLUMNS, chunksize rows at a time, and computes each chunk with
+    vectorized pandas operations; only the small per-group partial sums are kept.
+    """
+    now = pd.Timestamp(now or datetime.now())
+    query = requests_query(date_from, date_to, columns=KPI_COLUMNS, ordered=False)
+    partials = {"branch": [], "technician": []}
+    for chunk in read_sql_chunks(query, chunksize):
+        for key, frame in kpi_chunk_aggregates(chunk, now).items():
+            partials[key].append(frame)
+
+    result = {"generated_at": now.strftime("%Y-%m-%d %H:%M:%S"), "date_from": date_from, "date_to": date_to}
+    if not partials["branch"]:
+        result.update(overall=None, by_branch=[], by_technician=[])
+        return result
+
+    by_key = {key: pd.concat(frames).groupby(level=0).sum() for key, frames in partials.items()}
+    overall = kpi_rows(by_key["branch"].sum().to_frame("all").T).iloc[0].to_dict()
+    result["overall"] = overall
+    for key, name in (("branch", "by_branch"), ("technician", "by_technician")):
+        rows = kpi_rows(by_key[key]).sort_values("requests", ascending=False)
+        result[name] = [{key: label, **row} for label, row in zip(rows.index, rows.to_dict("records"))]
+    return result
+
+
+# ---------- equipment failure index ----------
+FAILURE_KEYS = ["equipment_name", "fault_type", "branch"]
+FAILURE_AGGREGATIONS = {
+    "failure_count": "sum",
+    "repeat_count": "sum",
+    "closed_count": "sum",
+    "repair_seconds": "sum",
+    "repaired_count": "sum",
+    "first_failure_at": "min",
+    "last_failure_at": "max",
+    "last_repaired_at": "max",
+}
+
+
+def failure_history_query():
+    """Every request, hot and archived, with the latest repair of the same key that ended at or before it.
+
+    Failures (request_date) and repairs (end_time of closed requests) are merged
+    into one stream per key; a repair sorts before a failure at the same moment,
+    as record_failure counts it.
+    """
+    columns = FAILURE_KEYS + ["request_date", "start_time", "end_time", "status"]
+    tables = (MaintenanceRequest.__table__, archived_requests_table)
+    events = union_all(
+        *[
+            select(*[table.c[name] for name in columns], table.c.request_date.label("event_at"), literal(1).label("is_failure"))
+            for table in tables
+        ],
+        *[
+            select(*[table.c[name] for name in columns], table.c.end_time.label("event_at"), literal(0).label("is_failure"))
+            .where(table.c.status == "closed", table.c.end_time.is_not(None))
+            for table in tables
+        ],
+    ).subquery()
+    previous_repair = func.max(case((events.c.is_failure == 0, events.c.event_at))).over(
+        partition_by=[events.c[name] for name in FAILURE_KEYS],
+        order_by=(events.c.event_at, events.c.is_failure),
+        rows=(None, 0),
+    )
+    stream = select(*[events.c[name] for name in columns], events.c.is_failure, previous_repair.label("previous_repair_at")).subquery()
+    return select(*[stream.c[name] for name in columns], stream.c.previous_repair_at).where(stream.c.is_failure == 1)
+
+
+def failure_chunk_aggregates(chunk, repeat_days):
+    requested = parse_timestamps(chunk["request_date"])
+    started = parse_timestamps(chunk["start_time"])
+    ended = parse_timestamps(chunk["end_time"]).where(chunk["status"] == "closed")
+    days_since_repair = (requested - parse_timestamps(chunk["previous_repair_at"])).dt.total_seconds() / 86400
+    # Clamped at zero like elapsed_seconds, which record_repair uses.
+    repair_seconds = (ended - started).dt.total_seconds().clip(lower=0)
+
+    frame = chunk[FAILURE_KEYS].assign(
+        failure_count=1,
+        repeat_count=days_since_repair.between(0, repeat_days),
+        closed_count=ended.notna(),
+        repair_seconds=repair_seconds,
+        repaired_count=repair_seconds.notna(),
+        first_failure_at=requested,
+        last_failure_at=requested,
+        last_repaired_at=ended,
+    )
+    return frame.groupby(FAILURE_KEYS).agg(FAILURE_AGGREGATIONS)
+
+
+def failure_index_records(chunksize=KPI_CHUNK_SIZE):
+    """EquipmentFailureIndex rows computed from the full request history, hot and archived.
+
+    The database supplies each request's previous repair through a window
+    function; pandas turns chunks into per-key partial aggregates.
+    """
+    repeat_days = current_app.config["REPEAT_FAILURE_DAYS"]
+    partials = [
+        failure_chunk_aggregates(chunk, repeat_days)
+        for chunk in read_sql_chunks(failure_history_query(), chunksize)
+    ]
+    if not partials:
+        return []
+    totals = pd.concat(partials).groupby(level=FAILURE_KEYS).agg(FAILURE_AGGREGATIONS).reset_index()
+    window = timedelta(days=repeat_days)
+    totals["repeat_window_until"] = totals["last_repaired_at"] + window
+    for column in ("first_failure_at", "last_failure_at", "last_repaired_at", "repeat_window_until"):
+        totals[column] = totals[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+    for column in ("failure_count", "repeat_count", "closed_count", "repair_seconds", "repaired_count"):
+        totals[column] = totals[column].astype(int)
+    return totals.astype(object).where(totals.notna(), None).to_dict("records")
+
+
+def rebuild_failure_index(chunksize=KPI_CHUNK_SIZE):
+    """Recompute EquipmentFailureIndex from the full request history, hot and archived."""
+    records = failure_index_records(chunksize)
+    EquipmentFailureIndex.query.delete()
+    if records:
+        db.session.execute(EquipmentFailureIndex.__table__.insert(), records)
+    db.session.commit()
+    return len(records)
+
+
+def check_failure_index(chunksize=KPI_CHUNK_SIZE):
+    """Compare the incrementally kept EquipmentFailureIndex with a rebuild; returns the differing keys.
+
+    Each difference is (key, column, stored, rebuilt). Requests that arrive out of
+    time order (offline edits synced later) can make the running counts drift;
+    rebuild_failure_index puts them right.
+    """
+    index = EquipmentFailureIndex.__table__
+    stored = {
+        tuple(row[name] for name in FAILURE_KEYS): row
+        for row in db.session.execute(select(index)).mappings()
+    }
+    rebuilt = {tuple(record[name] for name in FAILURE_KEYS): record for record in failure_index_records(chunksize)}
+    differences = []
+    for key in sorted(stored.keys() | rebuilt.keys()):
+        for column in index.columns.keys():
+            if column in FAILURE_KEYS:
+                continue
+            have = stored[key][column] if key in stored else None
+            want = rebuilt[key][column] if key in rebuilt else None
+            if have != want:
+                differences.append((key, column, have, want))
+    return differences
+
+
+def equipment_reliability(limit=200):
+    """The index rows with the most failures, with MTBF and mean repair time; reads only the index."""
+    rows = EquipmentFailureIndex.query.order_by(EquipmentFailureIndex.failure_count.desc()).limit(limit).all()
+    result = []
+    for row in rows:
+        mtbf_days = None
+        if row.failure_count > 1 and row.first_failure_at and row.last_failure_at:
+            span_days = elapsed_seconds(row.first_failure_at, row.last_failure_at) / 86400
+            mtbf_days = round(span_days / (row.failure_count - 1), 2)
+        result.append({
+            "equipment_name": row.equipment_name,
+            "fault_type": row.fault_type,
+            "branch": row.branch,
+            "failures": row.failure_count,
+            "repeats": row.repeat_count,
+            "closed": row.closed_count,
+            "mtbf_days": mtbf_days,
+            "repair_hours": round(row.repair_seconds / row.repaired_count / 3600, 2) if row.repaired_count else None,
+            "last_failure_at": row.last_failure_at,
+        })
+    return result
+
+
+# ---------- preventive maintenance scheduler ----------
+SCHEDULER_BATCH_SIZE = 500
+
+
+def add_months(moment, months):
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    days_in_month = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return moment.replace(year=year, month=month, day=min(moment.day, days_in_month))
+
+
+def schedule_occurrence(schedule, occurrence):
+    """Due time of the schedule's n-th occurrence, counted from starts_at so monthly dates do not drift."""
+    starts_at = datetime.fromisoformat(schedule.starts_at)
+    if schedule.interval_months:
+        return add_months(starts_at, occurrence * schedule.interval_months)
+    return starts_at + timedelta(days=occurrence * schedule.interval_days)
+
+
+def next_occurrence_after(schedule, now):
+    """The first occurrence after `now`; a schedule that fell behind skips its missed occurrences."""
+    occurrence = schedule.occurrence + 1
+    if schedule.interval_days:
+        elapsed_days = (now - datetime.fromisoformat(schedule.starts_at)).total_seconds() / 86400
+        occurrence = max(occurrence, int(elapsed_days // schedule.interval_days) + 1)
+    while schedule_occurrence(schedule, occurrence) <= now:
+        occurrence += 1
+    return occurrence, schedule_occurrence(schedule, occurrence)
+
+
+def create_schedule(equipment_name, branch, starts_at, interval_days=None, interval_months=None, **fields):
+    if (interval_days is None) == (interval_months is None):
+        raise ValueError("give exactly one of interval_days and interval_months")
+    if (interval_days or interval_months) <= 0:
+        raise ValueError("the interval must be a positive number of days or months")
+    try:
+        starts_at = datetime.fromisoformat(starts_at).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"invalid start time {starts_at!r}; use YYYY-MM-DD HH:MM:SS")
+    schedule = MaintenanceSchedule(
+        equipment_name=equipment_name,
+        branch=branch,
+        interval_days=interval_days,
+        interval_months=interval_months,
+        starts_at=starts_at,
+        next_due_at=starts_at,
+        occurrence=0,
+        **fields,
+    )
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule
+
+
+def schedule_request_data(schedule):
+    return {
+        "requester_name": f"صيانة وقائية مجدولة #{schedule.schedule_id}",
+        "phone_number": "-",
+        "branch": schedule.branch,
+        "maintenance_type": schedule.maintenance_type,
+        "equipment_name": schedule.equipment_name,
+        "fault_type": schedule.fault_type,
+        "notes": f"{schedule.notes or ''} (موعد {schedule.next_due_at})".strip(),
+    }
+
+
+def run_scheduler_tick(now=None, batch_size=SCHEDULER_BATCH_SIZE):
+    """Generate requests for every schedule that is due; returns the number generated.
+
+    Due schedules come off the (active, next_due_at) index a batch at a time, so
+    a tick costs in proportion to what is due, not to the number of schedules.
+    Each batch is one transaction. A schedule is advanced with a compare-and-swap
+    on its next_due_at, so a schedule taken by a concurrent worker (or retried
+    after a crash) never produces a second request for the same occurrence.
+    """
+    now = now or datetime.now()
+    now_text = now.strftime("%Y-%m-%d %H:%M:%S")
+    g.sqlite_immediate = True
+    generated = 0
+    while True:
+        query = (
+            select(MaintenanceSchedule)
+            .where(MaintenanceSchedule.active.is_(True), MaintenanceSchedule.next_due_at <= now_text)
+            .order_by(MaintenanceSchedule.next_due_at)
+            .limit(batch_size)
+        )
+        if database_dialect() == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        schedules = db.session.execute(query).scalars().all()
+        if not schedules:
+            db.session.rollback()
+            return generated
+
+        claimed = []
+        for schedule in schedules:
+            occurrence, next_due = next_occurrence_after(schedule, now)
+            result = db.session.execute(
+                update(MaintenanceSchedule)
+                .where(
+                    MaintenanceSchedule.schedule_id == schedule.schedule_id,
+                    MaintenanceSchedule.next_due_at == schedule.next_due_at,
+                )
+                .values(occurrence=occurrence, next_due_at=next_due.strftime("%Y-%m-%d %H:%M:%S"))
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(schedule)
+
+        request_items = stage_requests([schedule_request_data(schedule) for schedule in claimed])
+        for schedule, request_item in zip(claimed, request_items):
+            db.session.execute(
+                update(MaintenanceSchedule)
+                .where(MaintenanceSchedule.schedule_id == schedule.schedule_id)
+                .values(last_request_id=request_item.request_id)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        db.session.expire_all()
+        generated += len(request_items)
+        if len(schedules) < batch_size:
+            return generated
+
+
+def next_schedule_due():
+    """Earliest next_due_at of any active schedule, read from the front of the due index."""
+    return db.session.query(func.min(MaintenanceSchedule.next_due_at)).filter(
+        MaintenanceSchedule.active.is_(True)
+    ).scalar()
+
+
+def run_scheduler(app, max_sleep):
+    """Generate due requests and flag SLA breaches, then sleep until the next schedule or
+    deadline is due (at most max_sleep seconds); runs forever."""
+    while True:
+        with app.app_context():
+            for job in (run_scheduler_tick, check_sla_breaches):
+                try:
+                    job()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("%s failed", job.__name__)
+            next_due = min(filter(None, (next_schedule_due(), next_sla_deadline())), default=None)
+            db.session.remove()
+        delay = max_sleep
+        if next_due:
+            delay = min(max_sleep, max((datetime.fromisoformat(next_due) - datetime.now()).total_seconds(), 1))
+        time.sleep(delay)
+
+
+class SchedulerThread:
+    """Runs the scheduler in a daemon thread of each worker when SCHEDULER_THREAD=1; started on the first request."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def ensure_started(self):
+        app = current_app._get_current_object()
+        if not app.config["SCHEDULER_THREAD"] or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(
+                target=run_scheduler, args=(app, app.config["SCHEDULER_INTERVAL"]), daemon=True, name="scheduler"
+            ).start()
+
+
+scheduler_thread = SchedulerThread()
+
+
+# ---------- schema upgrades ----------
+def upgrade_schema():
+    """Add the columns and indexes that tables created by an older version lack; returns the columns added.
+
+    create_all only creates missing tables. Columns added to a model since are
+    added here with ALTER TABLE, which needs them to be nullable or to have a
+    server default; their values are filled in by backfill_upgraded_rows.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise click.ClickException(f"{table.name}.{column.name} is NOT NULL without a server default")
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{CreateColumn(column).compile(dialect=engine.dialect)}"
+                ))
+                if column.unique:
+                    # SQLite cannot add a UNIQUE column; a unique index enforces the same.
+                    connection.execute(text(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS {preparer.quote(f'uq_{table.name}_{column.name}')} "
+                        f"ON {preparer.format_table(table)} ({preparer.quote(column.name)})"
+                    ))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    return added
+
+
+def backfill_upgraded_rows():
+    """Fill the columns upgrade_schema added to existing rows. Safe to run again.
+
+    version gets its server default of 1. assigned_technician_id is resolved from
+    the technician's name where exactly one technician has it (and the workload
+    counters are recomputed from that). Requests get sync uuids and sequence
+    numbers, and notifications from before resolved_at are resolved. Returns the
+    number of assigned requests whose technician name matches none or several
+    technicians, which need assigning again by hand.
+    """
+    rebuild_technician_workloads()
+    backfill_sync_columns()
+    backfill_notification_resolution()
+    return db.session.scalar(
+        select(func.count())
+        .select_from(MaintenanceRequest)
+        .where(MaintenanceRequest.assigned_technician.is_not(None), MaintenanceRequest.assigned_technician_id.is_(None))
+    )
+
+
+def register_cli(app):
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create missing tables, add columns new since the database was created, and backfill them."""
+        db.create_all()
+        added = upgrade_schema()
+        ensure_search_index()
+        print("Database tables created.")
+        if added:
+            print(f"Added columns: {', '.join(added)}.")
+        unresolved = backfill_upgraded_rows()
+        if unresolved:
+            print(f"{unresolved} requests name a technician that matches none or several technicians; assign them again.")
+
+    @app.cli.command("backfill-notifications")
+    def backfill_notifications_command():
+        print(f"Resolved {backfill_notification_resolution()} old notifications.")
+
+    @app.cli.command("rebuild-workloads")
+    def rebuild_workloads_command():
+        print(f"Rebuilt workload counters for {rebuild_technician_workloads()} technicians.")
+
+    @app.cli.command("reindex-search")
+    def reindex_search_command():
+        print(f"Indexed {rebuild_search_index()} requests for search.")
+
+    @app.cli.command("backfill-events")
+    def backfill_events_command():
+        print(f"Wrote history for {backfill_request_events()} requests.")
+
+    @app.cli.command("update-durations")
+    def update_durations_command():
+        print(f"Processed {update_status_durations()} request events.")
+
+    @app.cli.command("sync-replica")
+    def sync_replica_command():
+        if "replica" not in db.engines:
+            raise click.ClickException("DATABASE_REPLICA_URL is not set")
+        try:
+            sync_sqlite_replica()
+        except RuntimeError as error:
+            raise click.ClickException(str(error))
+        print("Replica updated from the primary database.")
+
+    @app.cli.command("sqlite-checkpoint")
+    def sqlite_checkpoint_command():
+        for key, (busy, wal_pages, checkpointed) in checkpoint_sqlite("TRUNCATE").items():
+            print(f"{key or 'primary'}: {checkpointed}/{wal_pages} WAL pages checkpointed{' (busy)' if busy else ''}")
+
+    @app.cli.command("import-csv")
+    @click.argument("kind", type=click.Choice(sorted(IMPORT_TABLES)))
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def import_csv_command(kind, path):
+        with open(path, encoding="utf-8-sig", newline="") as handle:
+            try:
+                count = import_csv(kind, handle)
+            except ValueError as error:
+                raise click.ClickException(str(error))
+        print(f"Imported {count} rows into {IMPORT_TABLES[kind].name}.")
+        if kind == "requests":
+            # Imported rows bypass add_request, so bring the derived tables up to date.
+            print(f"Indexed {rebuild_search_index()} requests for search.")
+            print(f"Wrote history for {backfill_request_events()} requests.")
+            print(f"Rebuilt workload counters for {rebuild_technician_workloads()} technicians.")
+            print(f"Rebuilt failure statistics for {rebuild_failure_index()} equipment/fault/branch combinations.")
+            print(f"Scheduled {rebuild_sla_deadlines()} SLA deadlines.")
+            print(f"Queued {backfill_sync_columns()} requests for desktop sync.")
+
+    @app.cli.command("archive-requests")
+    @click.option("--older-than", "older_than", type=int, default=180, show_default=True,
+                  help="Archive closed requests that ended more than this many days ago.")
+    @click.option("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, show_default=True)
+    def archive_requests_command(older_than, batch_size):
+        requests_moved, notifications_moved = archive_closed_requests(older_than, batch_size)
+        print(f"Archived {requests_moved} requests and {notifications_moved} notifications.")
+
+    @app.cli.command("rebuild-failure-index")
+    def rebuild_failure_index_command():
+        print(f"Rebuilt failure statistics for {rebuild_failure_index()} equipment/fault/branch combinations.")
+
+    @app.cli.command("check-failure-index")
+    def check_failure_index_command():
+        differences = check_failure_index()
+        for key, column, stored, rebuilt in differences[:50]:
+            print(f"{' / '.join(key)}: {column} is {stored}, a rebuild gives {rebuilt}")
+        if differences:
+            raise click.ClickException(
+                f"{len(differences)} differences from a rebuild; run rebuild-failure-index to correct them."
+            )
+        print("Failure statistics match a rebuild.")
+
+    @app.cli.command("run-scheduler")
+    @click.option("--once", is_flag=True, help="Run a single tick and exit.")
+    def run_scheduler_command(once):
+        if once:
+            print(f"Generated {run_scheduler_tick()} preventive maintenance requests.")
+            print(f"Flagged {check_sla_breaches()} SLA breaches.")
+            return
+        run_scheduler(app, app.config["SCHEDULER_INTERVAL"])
+
+    @app.cli.command("add-schedule")
+    @click.option("--equipment", required=True)
+    @click.option("--branch", required=True)
+    @click.option("--every-days", type=int)
+    @click.option("--every-months", type=int)
+    @click.option("--starts", default=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                  help="First due time, YYYY-MM-DD HH:MM:SS (default: now).")
+    @click.option("--notes", default="")
+    def add_schedule_command(equipment, branch, every_days, every_months, starts, notes):
+        try:
+            schedule = create_schedule(
+                equipment, branch, starts, interval_days=every_days, interval_months=every_months, notes=notes
+            )
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        print(f"Created schedule #{schedule.schedule_id}, first due {schedule.next_due_at}.")
+
+    @app.cli.command("add-sla-policy")
+    @click.option("--maintenance-type", help="Defaults to any maintenance type.")
+    @click.option("--branch", help="Defaults to any branch.")
+    @click.option("--response-hours", type=float)
+    @click.option("--resolution-hours", type=float)
+    def add_sla_policy_command(maintenance_type, branch, response_hours, resolution_hours):
+        policy = SlaPolicy.query.filter_by(maintenance_type=maintenance_type, branch=branch).first()
+        if policy is None:
+            policy = SlaPolicy(maintenance_type=maintenance_type, branch=branch)
+            db.session.add(policy)
+        policy.response_hours = response_hours
+        policy.resolution_hours = resolution_hours
+        db.session.commit()
+        print(f"Saved SLA policy #{policy.policy_id}; scheduled {rebuild_sla_deadlines()} deadlines.")
+
+    @app.cli.command("rebuild-sla-deadlines")
+    def rebuild_sla_deadlines_command():
+        print(f"Scheduled {rebuild_sla_deadlines()} SLA deadlines.")
+
+    @app.cli.command("check-sla")
+    def check_sla_command():
+        print(f"Flagged {check_sla_breaches()} SLA breaches.")
+
+    @app.cli.command("backfill-sync")
+    def backfill_sync_command():
+        print(f"Queued {backfill_sync_columns()} requests for desktop sync.")
+
+    @app.cli.command("prune-changes")
+    @click.option("--older-than", "older_than", type=int, default=30, show_default=True,
+                  help="Delete change feed rows older than this many days.")
+    def prune_changes_command(older_than):
+        print(f"Pruned {prune_change_log(older_than)} change feed rows.")
+
+    @app.cli.command("add-webhook")
+    @click.option("--url", required=True)
+    @click.option("--events", default="*", show_default=True,
+                  help=f"Comma-separated events out of {', '.join(WEBHOOK_EVENTS)}, or * for all.")
+    @click.option("--secret", help="Sign bodies with HMAC-SHA256 in the X-Webhook-Signature header.")
+    def add_webhook_command(url, events, secret):
+        unknown = {name.strip() for name in events.split(",")} - set(WEBHOOK_EVENTS) - {"*"}
+        if unknown:
+            raise click.ClickException(f"unknown events: {', '.join(sorted(unknown))}")
+        endpoint = WebhookEndpoint(url=url, events=events, secret=secret)
+        db.session.add(endpoint)
+        db.session.commit()
+        print(f"Added webhook #{endpoint.endpoint_id}.")
+
+    @app.cli.command("dispatch-webhooks")
+    @click.option("--once", is_flag=True, help="Run a single round and exit.")
+    def dispatch_webhooks_command(once):
+        delivered = run_webhook_dispatcher(app, once=once)
+        print(f"Delivered {delivered} webhook events.")
+
+    @app.cli.command("webhook-stats")
+    def webhook_stats_command():
+        for row in webhook_stats():
+            print(
+                f"#{row['endpoint_id']} {row['url']}: {row['pending']} pending, "
+                f"{row['succeeded']}/{row['deliveries']} deliveries ok ({row['events']} events), "
+                f"latency p50 {row['latency_ms_p50']} ms / p95 {row['latency_ms_p95']} ms, "
+                f"lag p95 {row['lag_seconds_p95']} s"
+            )
+
+    @app.cli.command("seed-db")
+    def seed_db_command():
+        seed_data()
+        print("Seed data inserted.")
+
+    @app.cli.command("vendor-assets")
+    def vendor_assets_command():
+        vendor_assets(app.static_folder)
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        manifest = build_assets(app.static_folder, os.path.join(app.root_path, app.template_folder))
+        print(f"Built {len(manifest)} fingerprinted assets.")
+
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response instead of building it in memory.
+
+    Flashed messages are read up front: they are popped from the session, which
+    is saved before the first chunk of a streamed body is produced.
+    """
+    get_flashed_messages(with_categories=True)
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(100)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
+def use_replica(view):
+    """Serve the view's reads from the read replica, if one is configured."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def replica_reads():
+    """Serve the reads inside the block from the read replica, if one is configured."""
+    previous = g.get("use_replica", False)
+    g.use_replica = True
+    try:
+        yield
+    finally:
+        g.use_replica = previous
+
+
+def pin_recent_writers_to_primary():
+    """Read-your-writes: a user who wrote recently reads from the primary until the replica has caught up."""
+    last_write_at = session.get('last_write_at')
+    if last_write_at and time.time() - last_write_at < current_app.config['REPLICA_MAX_LAG_SECONDS']:
+        g.pin_primary = True
+
+
+def remember_write(response):
+    if g.get('db_wrote'):
+        session['last_write_at'] = time.time()
+    return response
+
+
+def sync_sqlite_replica():
+    """Copy a SQLite primary onto a SQLite replica, to try replica routing locally."""
+    primary, replica = db.engines[None], db.engines["replica"]
+    if primary.dialect.name != "sqlite" or replica.dialect.name != "sqlite":
+        raise RuntimeError("sync-replica only copies SQLite databases; use database replication otherwise")
+    source, target = primary.raw_connection(), replica.raw_connection()
+    try:
+        source.driver_connection.backup(target.driver_connection)
+    finally:
+        source.close()
+        target.close()
+
+
+def get_request_idempotency_key():
+    return request.form.get('idempotency_key') or request.headers.get('Idempotency-Key')
+
+
+def is_outbox_replay():
+    """Form posts replayed from the service worker's offline outbox are answered with JSON, not a redirect."""
+    return request.headers.get('X-Outbox-Replay') == '1'
+
+
+def current_user_id():
+    """The logged-in user's id; sessions created before it was stored look it up once."""
+    if 'user_id' not in session and 'username' in session:
+        user = User.query.filter_by(username=session['username']).first()
+        session['user_id'] = user.user_id if user else None
+    return session.get('user_id')
+
+
+def notification_audience():
+    """(recipient_type, recipient_id) whose notifications the logged-in user sees."""
+    if session.get('user_role') == 'technician':
+        return 'technician', session.get('technician_id')
+    return 'engineer', None
+
+
+def get_date_range():
+    """Optional ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD filter; invalid dates are ignored."""
+    dates = []
+    for name in ('date_from', 'date_to'):
+        value = request.args.get(name, '').strip()
+        try:
+            dates.append(datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d'))
+        except ValueError:
+            dates.append(None)
+    return tuple(dates)
+
+
+def get_form_version():
+    try:
+        return int(request.form['version'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def request_versions(request_ids):
+    """{request_id: version}, rendered into each form as the version its change is guarded by."""
+    if not request_ids:
+        return {}
+    return dict(
+        db.session.execute(
+            select(MaintenanceRequest.request_id, MaintenanceRequest.version)
+            .where(MaintenanceRequest.request_id.in_(set(request_ids)))
+        ).all()
+    )
+
+
+def register_routes(app):
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.before_request(pin_recent_writers_to_primary)
+    app.before_request(scheduler_thread.ensure_started)
+    app.after_request(remember_write)
+    app.after_request(compress_response)
+
+    @app.context_processor
+    def inject_build_hash():
+        return {'build_hash': app.config['BUILD_HASH']}
+
+    @app.route('/assets/<path:filename>')
+    def asset(filename):
+        directory = os.path.join(app.static_folder, 'dist')
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, mimetype=mimetype)
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @app.route('/sw.js')
+    def service_worker():
+        response = send_from_directory(app.static_folder, 'sw.js', max_age=0)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Service-Worker-Allowed'] = '/'
+        return response
+
+    @app.route('/')
+    def index():
+        if 'user_role' not in session:
+            return redirect(url_for('login'))
+        return render_template('dashboard.html', role=session['user_role'])
+
+    @app.route('/login', methods=['GET', 'POST'])
+    def login():
+        if request.method == 'POST':
+            username = request.form['username']
+            password = request.form['password']
+
+            auth_result = authenticate_user(username, password)
+            if auth_result:
+                role, technician_id, user_id = auth_result
+                session['user_role'] = role
+                session['username'] = username
+                session['user_id'] = user_id
+                if role == "technician" and technician_id:
+                    session['technician_id'] = technician_id
+                flash('تم تسجيل الدخول بنجاح', 'success')
+                return redirect(url_for('index'))
+            flash('اسم المستخدم أو كلمة المرور غير صحيحة', 'error')
+
+        return render_template('login.html')
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        flash('تم تسجيل الخروج بنجاح', 'success')
+        return redirect(url_for('login'))
+
+    @app.route('/create_request', methods=['GET', 'POST'])
+    def create_request():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'branch', 'admin']:
+            if is_outbox_replay():
+                return api_error('غير مصرح', 401 if 'user_role' not in session else 403)
+            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
+            return redirect(url_for('index'))
+
+        if request.method == 'POST':
+            try:
+                data = request_data_from(request.form)
+            except ValueError:
+                if is_outbox_replay():
+                    return api_error('يرجى تعبئة جميع الحقول المطلوبة', 400)
+                data = None
+                flash('يرجى تعبئة جميع الحقول المطلوبة', 'error')
+
+            request_id = data and add_request(data, idempotency_key=get_request_idempotency_key())
+            if is_outbox_replay():
+                if not request_id:
+                    return api_error('حدث خطأ في إنشاء الطلب', 500)
+                return jsonify({'request_id': request_id}), 201
+            if request_id:
+                flash(f'تم إنشاء الطلب #{request_id} بنجاح', 'success')
+                return redirect(url_for('index'))
+            elif data:
+                flash('حدث خطأ في إنشاء الطلب', 'error')
+
+        return render_template(
+            'create_request.html',
+            branches=Branch.query.order_by(Branch.branch_name.asc()).all(),
+            maintenance_types=MaintenanceType.query.order_by(MaintenanceType.type_name.asc()).all(),
+            equipment_names=EquipmentName.query.order_by(EquipmentName.equipment_name.asc()).all(),
+            fault_types=FaultType.query.order_by(FaultType.fault_name.asc()).all(),
+        )
+
+    @app.route('/requests')
+    @use_replica
+    def view_requests():
+        if 'user_role' not in session:
+            return redirect(url_for('login'))
+
+        # Archived requests are listed too, as in /report.
+        query = requests_query()
+        stream = request.args.get('stream')
+        if stream is None:
+            threshold = app.config['STREAM_ROWS_THRESHOLD']
+            counted = db.session.scalar(select(func.count()).select_from(query.limit(threshold + 1).subquery()))
+            stream = '1' if counted > threshold else '0'
+
+        if stream == '1':
+            return stream_page(
+                'requests.html',
+                requests=db.session.execute(query.execution_options(yield_per=app.config['STREAM_YIELD_PER'])),
+                has_requests=db.session.execute(query.limit(1)).first() is not None,
+                streaming=True,
+            )
+
+        requests = db.session.execute(query).all()
+        return render_template('requests.html', requests=requests, has_requests=bool(requests), streaming=False)
+
+    @app.route('/requests/search')
+    @use_replica
+    def search_requests_view():
+        if 'user_role' not in session:
+            return redirect(url_for('login'))
+
+        query_text = request.args.get('q', '').strip()
+        ranked_ids = search_requests(query_text)
+        by_id = {
+            item.request_id: item
+            for item in MaintenanceRequest.query.filter(MaintenanceRequest.request_id.in_(ranked_ids))
+        } if ranked_ids else {}
+        requests = [by_id[request_id] for request_id in ranked_ids if request_id in by_id]
+        return render_template(
+            'requests.html',
+            requests=requests,
+            has_requests=bool(requests),
+            streaming=False,
+            search_query=query_text,
+        )
+
+    @app.route('/engineer')
+    def engineer_dashboard():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
+            return redirect(url_for('index'))
+
+        notifications = get_notifications("engineer", user_id=current_user_id())
+        technicians = Technician.query.order_by(Technician.technician_name.asc()).all()
+        return render_template(
+            'engineer.html',
+            notifications=notifications,
+            technicians=technicians,
+            versions=request_versions([notification.request_id for notification in notifications]),
+        )
+
+    @app.route('/technician')
+    def technician_dashboard():
+        if 'user_role' not in session or session['user_role'] not in ['technician', 'admin']:
+            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
+            return redirect(url_for('index'))
+
+        technician_id = session.get('technician_id')
+        notifications = get_notifications("technician", technician_id, user_id=current_user_id())
+        return render_template(
+            'technician.html',
+            notifications=notifications,
+            versions=request_versions([notification.request_id for notification in notifications]),
+        )
+
+    @app.route('/notifications/read', methods=['POST'])
+    def read_notifications():
+        if 'user_role' not in session:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        user_id = current_user_id()
+        if request.form.get('all') == '1':
+            recipient_type = request.form.get('recipient_type') or notification_audience()[0]
+            recipient_id = session.get('technician_id') if recipient_type == 'technician' else None
+            ids = [
+                notification.notification_id
+                for notification in unread_notifications_query(recipient_type, recipient_id, user_id)
+            ]
+        else:
+            ids = [int(value) for value in request.form.getlist('notification_id') if value.isdigit()]
+        mark_notifications_read(user_id, ids)
+        return redirect(request.referrer or url_for('index'))
+
+    @app.route('/api/notifications/unread')
+    def api_unread_notifications():
+        if 'user_role' not in session:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        recipient_type, recipient_id = notification_audience()
+        user_id = current_user_id()
+        latest = unread_notifications_query(recipient_type, recipient_id, user_id).order_by(
+            Notification.notification_id.desc()
+        ).limit(20)
+        return jsonify({
+            'count': count_unread_notifications(recipient_type, recipient_id, user_id),
+            'notifications': [
+                {
+                    'notification_id': notification.notification_id,
+                    'request_id': notification.request_id,
+                    'message': notification.message,
+                    'created_at': notification.created_at,
+                }
+                for notification in latest
+            ],
+        })
+
+    @app.route('/assign_technician', methods=['POST'])
+    def assign_technician_route():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        try:
+            request_id = int(request.form['request_id'])
+        except (TypeError, ValueError):
+            flash('رقم الطلب غير صالح', 'error')
+            return redirect(url_for('engineer_dashboard'))
+        try:
+            technician_id = int(request.form['technician_id'])
+        except (KeyError, TypeError, ValueError):
+            flash('يرجى اختيار الفني', 'error')
+            return redirect(url_for('engineer_dashboard'))
+        # Dashboard rows carry the version they were rendered with, so a stale row
+        # never overwrites a change made since; a typed-in request number has none.
+        expected_version = get_form_version()
+
+        try:
+            if assign_technician(request_id, technician_id, expected_version=expected_version):
+                flash(f'تم تعيين الفني لطلب #{request_id}', 'success')
+            else:
+                flash('تعذر تعيين الفني', 'error')
+        except RequestConflictError as conflict:
+            flash(f'تعذر تعيين الفني: تم تعديل الطلب #{request_id} أو أنه مغلق ({conflict.current_status})', 'error')
+        return redirect(url_for('engineer_dashboard'))
+
+    @app.route('/update_status', methods=['POST'])
+    def update_status():
+        if 'user_role' not in session:
+            return jsonify({'error': 'غير مصرح'}), 401 if is_outbox_replay() else 403
+
+        try:
+            request_id = int(request.form['request_id'])
+        except (TypeError, ValueError):
+            if is_outbox_replay():
+                return api_error('رقم الطلب غير صالح', 400)
+            flash('رقم الطلب غير صالح', 'error')
+            return redirect(url_for('technician_dashboard'))
+        status = request.form['status']
+        # Without a version the status compare-and-swap still refuses a transition
+        # the request's current status does not allow.
+        expected_version = get_form_version()
+
+        try:
+            if update_request_status(
+                request_id,
+                status,
+                expected_version=expected_version,
+                idempotency_key=get_request_idempotency_key(),
+            ):
+                message, code = f'تم تحديث حالة الطلب #{request_id}', 200
+            else:
+                message, code = 'تعذر تحديث حالة الطلب', 404
+        except ValueError:
+            message, code = 'الحالة المطلوبة غير صالحة', 400
+        except RequestConflictError as conflict:
+            message, code = (
+                f'تعذر تحديث الطلب #{request_id}: حالته الحالية ({conflict.current_status}) لا تسمح بهذا التغيير '
+                'أو تم تعديله من مستخدم آخر',
+                409,
+            )
+
+        if is_outbox_replay():
+            if code != 200:
+                return api_error(message, code)
+            return jsonify({'request_id': request_id, 'status': status})
+        flash(message, 'success' if code == 200 else 'error')
+        if session['user_role'] == 'technician':
+            return redirect(url_for('technician_dashboard'))
+        return redirect(url_for('engineer_dashboard'))
 
     @app.route('/report')
+    @use_replica
     def report():
         if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
             flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
             return redirect(url_for('index'))
 
-        requests = MaintenanceRequest.query.order_by(MaintenanceRequest.request_id.desc()).all()
+        date_from, date_to = get_date_range()
+        requests = db.session.execute(requests_query(date_from, date_to)).all()
         stats = {
             "total": len(requests),
             "open": len([req for req in requests if req.status == "open"]),
             "in_progress": len([req for req in requests if req.status == "in_progress"]),
             "closed": len([req for req in requests if req.status == "closed"]),
         }
-        return render_template('report.html', requests=requests, stats=stats)
+        return render_template(
+            'report.html',
+            requests=requests,
+            stats=stats,
+            kpis=compute_kpis(date_from, date_to),
+            backlog_age_labels=BACKLOG_AGE_LABELS,
+            date_from=date_from,
+            date_to=date_to,
+        )
+
+    @app.route('/report/equipment')
+    @use_replica
+    def equipment_report():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            flash('غير مصرح لك بالوصول إلى هذه الصفحة', 'error')
+            return redirect(url_for('index'))
+
+        return render_template(
+            'equipment_report.html',
+            rows=equipment_reliability(),
+            repeat_days=app.config['REPEAT_FAILURE_DAYS'],
+        )
 
     @app.route('/export_excel')
+    @use_replica
     def export_excel():
         if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
             return jsonify({'error': 'غير مصرح'}), 403
 
-        requests = MaintenanceRequest.query.order_by(MaintenanceRequest.request_id.desc()).all()
-        data = []
-        for req in requests:
-            data.append({
-                'رقم الطلب': req.request_id,
-                'التاريخ': req.request_date,
-                'الطالب': req.requester_name,
-                'الهاتف': req.phone_number,
-                'الفرع': req.branch,
-                'نوع الصيانة': req.maintenance_type,
-                'المعدة': req.equipment_name,
-                'العطل': req.fault_type,
-                'الحالة': req.status
-            })
-
-        df = pd.DataFrame(data)
+        with spool_requests_csv(*get_date_range()) as spool:
+            df = pd.read_csv(
+                spool,
+                header=None,
+                names=list(EXPORT_COLUMNS.values()),
+                dtype={header: str for header in list(EXPORT_COLUMNS.values())[1:]},
+                keep_default_na=False,
+            )
         output = BytesIO()
         df.to_excel(output, index=False, engine='openpyxl')
         output.seek(0)
@@ -508,21 +3807,919 @@ def register_routes(app):
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         )
 
+    @app.route('/export_csv')
+    @use_replica
+    def export_csv():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        spool = spool_requests_csv(*get_date_range())
+        header = ('\ufeff' + ','.join(EXPORT_COLUMNS.values()) + '\r\n').encode('utf-8')
+
+        def generate():
+            yield header
+            yield from iter_file(spool)
+
+        return Response(
+            generate(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=maintenance_report.csv'},
+        )
+
+    @app.route('/api/kpis')
+    @use_replica
+    def api_kpis():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        return jsonify(compute_kpis(*get_date_range()))
+
     @app.route('/api/stats')
+    @use_replica
     def api_stats():
         if 'user_role' not in session:
             return jsonify({'error': 'غير مصرح'}), 403
 
-        requests = MaintenanceRequest.query.all()
+        # Counted in the database over hot and archived requests, like /report.
+        rows = requests_query(columns=['status'], ordered=False).subquery()
+        counts = dict(db.session.execute(select(rows.c.status, func.count()).group_by(rows.c.status)).all())
         stats = {
-            'total': len(requests),
-            'pending': len([r for r in requests if r.status == 'open']),
-            'in_progress': len([r for r in requests if r.status == 'in_progress']),
-            'completed': len([r for r in requests if r.status == 'closed'])
+            'total': sum(counts.values()),
+            'pending': counts.get('open', 0),
+            'in_progress': counts.get('in_progress', 0),
+            'completed': counts.get('closed', 0)
         }
 
         return jsonify(stats)
 
+    @app.route('/api/requests/<int:request_id>/timeline')
+    def api_request_timeline(request_id):
+        if 'user_role' not in session:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        at = request.args.get('at')
+        events = request_timeline(request_id, until=at)
+        if not events and db.session.get(MaintenanceRequest, request_id) is None:
+            return jsonify({'error': 'الطلب غير موجود'}), 404
+        return jsonify({
+            'request_id': request_id,
+            'at': at,
+            'state': replay_events(events),
+            'events': [event_as_dict(event) for event in events],
+        })
+
+    @app.route('/api/requests/<int:request_id>/durations')
+    def api_request_durations(request_id):
+        if 'user_role' not in session:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        at = request.args.get('at')
+        events = request_timeline(request_id, until=at)
+        if not events and db.session.get(MaintenanceRequest, request_id) is None:
+            return jsonify({'error': 'الطلب غير موجود'}), 404
+        return jsonify({'request_id': request_id, 'durations': durations_from_events(events, now=at)})
+
+    @app.route('/api/analytics/status-durations', methods=['GET', 'POST'])
+    def api_status_durations():
+        if 'user_role' not in session or session['user_role'] not in ['engineer', 'admin']:
+            return jsonify({'error': 'غير مصرح'}), 403
+
+        # Reads stay reads; a POST folds in new status changes first, like update-durations.
+        if request.method == 'POST':
+            update_status_durations()
+        return jsonify(status_duration_summary())
+
+
+# ---------- JSON API (v1) ----------
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_ROLES = {
+    'create': ('engineer', 'branch', 'admin'),
+    'assign': ('engineer', 'admin'),
+}
+
+
+def api_error(message, status, **extra):
+    return jsonify({'error': message, **extra}), status
+
+
+def api_columns(model):
+    """Columns named in ?fields=a,b (all columns by default); raises ValueError for unknown names."""
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    table = model.__table__
+    unknown = [name for name in names if name not in table.c]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return [table.c[name] for name in names] if names else list(table.columns)
+
+
+def api_page(query, model, key):
+    """One page of query, newest first, as {"data": [...], "next_cursor": ...}.
+
+    The cursor is the last key of the page, so a page costs an index range scan
+    however deep the client has paged, and rows added meanwhile do not shift pages.
+    """
+    try:
+        columns = api_columns(model)
+        limit = min(max(int(request.args.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            query = query.filter(key < int(cursor))
+    except ValueError as error:
+        return api_error(str(error), 400)
+
+    rows = query.with_entities(key.label('_cursor'), *columns).order_by(key.desc()).limit(limit + 1).all()
+    return jsonify({
+        'data': [{column.name: row._mapping[column] for column in columns} for row in rows[:limit]],
+        'next_cursor': str(rows[limit - 1]._cursor) if len(rows) > limit else None,
+    })
+
+
+def api_batch_operation(operation):
+    """Apply one operation of a batch in the current transaction; returns (message, status) on failure."""
+    op = operation.get('op')
+    try:
+        request_id = int(operation['request_id'])
+        version = int(operation['version']) if operation.get('version') is not None else None
+    except (KeyError, TypeError, ValueError):
+        return 'رقم الطلب أو الإصدار غير صالح', 400
+    if op == 'status':
+        done = stage_status_change(request_id, operation.get('status'), expected_version=version)
+    elif op == 'assign':
+        if session['user_role'] not in API_ROLES['assign']:
+            return 'غير مصرح', 403
+        try:
+            technician_id = int(operation['technician_id'])
+        except (KeyError, TypeError, ValueError):
+            return 'يرجى اختيار الفني', 400
+        done = stage_assignment(request_id, technician_id, expected_version=version)
+    else:
+        return f'عملية غير معروفة: {op}', 400
+    return None if done else ('الطلب أو الفني غير موجود', 404)
+
+
+# ---------- change feed ----------
+CHANGE_FEED_PAGE_SIZE = 1000
+CHANGE_FEED_MAX_WAIT = 30
+CHANGE_FEED_POLL_SECONDS = 1
+# Models whose ORM inserts, updates and deletes are recorded automatically: (entity, primary key).
+CHANGE_FEED_ENTITIES = {
+    MaintenanceRequest: ("request", "request_id"),
+    Notification: ("notification", "notification_id"),
+    NotificationReceipt: ("notification_read", "notification_id"),
+    PurchaseOrder: ("purchase_order", "purchase_order_id"),
+    SparePartsRequest: ("spare_part_request", "spare_request_id"),
+}
+# Wakes long-polling readers in this process when a commit adds changes; other processes poll.
+change_feed_signal = threading.Condition()
+
+
+def record_change(entity, entity_id, operation, **data):
+    """Queue a change-feed row; it is written in the same commit as the change.
+
+    Bulk UPDATE/DELETE statements call this themselves; ORM writes to
+    CHANGE_FEED_ENTITIES are picked up after each flush.
+    """
+    db.session.info.setdefault("changes", []).append((entity, entity_id, operation, data))
+
+
+def changes_from_flush(session, flush_context):
+    for instances, operation in ((session.new, "insert"), (session.dirty, "update"), (session.deleted, "delete")):
+        for instance in instances:
+            entity, key = CHANGE_FEED_ENTITIES.get(type(instance), (None, None))
+            if entity is None:
+                continue
+            state = inspect(instance)
+            if operation == "insert":
+                data = {column.key: getattr(instance, column.key) for column in state.mapper.column_attrs}
+            elif operation == "update":
+                data = {attr.key: attr.value for attr in state.attrs if attr.history.has_changes()}
+                if not data:
+                    continue
+            else:
+                data = {}
+            record_change(entity, getattr(instance, key), operation, **data)
+
+
+def write_change_log(session):
+    session.flush()
+    changes = session.info.pop("changes", None)
+    if not changes:
+        return
+    first_seq = next_sequence("changes", len(changes)) - len(changes) + 1
+    changed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    session.execute(
+        ChangeLog.__table__.insert(),
+        [
+            {
+                "seq": first_seq + position,
+                "entity": entity,
+                "entity_id": entity_id,
+                "operation": operation,
+                "changed_at": changed_at,
+                "data": json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str) if data else None,
+            }
+            for position, (entity, entity_id, operation, data) in enumerate(changes)
+        ],
+    )
+    session.info["changes_written"] = True
+
+
+def signal_change_feed(session):
+    if session.info.pop("changes_written", False):
+        with change_feed_signal:
+            change_feed_signal.notify_all()
+
+
+def discard_changes(session, previous_transaction=None):
+    session.info.pop("changes", None)
+    session.info.pop("changes_written", None)
+
+
+event.listen(RoutingSession, "after_flush", changes_from_flush)
+event.listen(RoutingSession, "before_commit", write_change_log)
+event.listen(RoutingSession, "after_commit", signal_change_feed)
+event.listen(RoutingSession, "after_rollback", discard_changes)
+
+
+def read_changes(after, limit=CHANGE_FEED_PAGE_SIZE, wait=0):
+    """Changes after seq `after`, oldest first; with wait, blocks up to that many seconds until there are some."""
+    table = ChangeLog.__table__
+    deadline = time.monotonic() + wait
+    while True:
+        rows = db.session.execute(select(table).where(table.c.seq > after).order_by(table.c.seq).limit(limit)).all()
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            return rows
+        # End the read transaction, so the next query sees what was committed meanwhile.
+        db.session.rollback()
+        with change_feed_signal:
+            change_feed_signal.wait(min(remaining, CHANGE_FEED_POLL_SECONDS))
+
+
+def change_feed_line(row):
+    """One NDJSON line; the stored data is already JSON and is spliced in as is."""
+    head = json.dumps(
+        {"seq": row.seq, "entity": row.entity, "id": row.entity_id, "op": row.operation, "at": row.changed_at},
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return f'{head[:-1]},"data":{row.data or "null"}}}\n'
+
+
+def prune_change_log(older_than_days, batch_size=10000):
+    """Delete change-feed rows older than older_than_days; returns how many."""
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    table = ChangeLog.__table__
+    pruned = 0
+    while True:
+        seqs = select(table.c.seq).where(table.c.changed_at < cutoff).order_by(table.c.seq).limit(batch_size)
+        deleted = db.session.execute(delete(table).where(table.c.seq.in_(seqs))).rowcount
+        db.session.commit()
+        pruned += deleted
+        if deleted < batch_size:
+            return pruned
+
+
+# ---------- outbound webhooks ----------
+WEBHOOK_EVENTS = ("created", "assigned", "closed")
+WEBHOOK_REQUEST_FIELDS = (
+    "request_date", "requester_name", "branch", "maintenance_type", "equipment_name", "fault_type", "status",
+)
+WEBHOOK_BACKOFF_CAP_SECONDS = 3600
+
+
+def webhook_endpoints():
+    """Active endpoints as (endpoint_id, events), read once per transaction."""
+    endpoints = db.session.info.get("webhook_endpoints")
+    if endpoints is None:
+        endpoints = db.session.info["webhook_endpoints"] = [
+            (row.endpoint_id, {name.strip() for name in row.events.split(",")})
+            for row in db.session.execute(
+                select(WebhookEndpoint.endpoint_id, WebhookEndpoint.events).where(WebhookEndpoint.active.is_(True))
+            )
+        ]
+    return endpoints
+
+
+def forget_webhook_endpoints(session, previous_transaction=None):
+    session.info.pop("webhook_endpoints", None)
+
+
+event.listen(RoutingSession, "after_commit", forget_webhook_endpoints)
+event.listen(RoutingSession, "after_rollback", forget_webhook_endpoints)
+
+
+def enqueue_webhooks(event_type, request_id, **fields):
+    """Add an event to the outbox of every endpoint that wants it, in the current transaction.
+
+    Nothing is sent here; the dispatcher (flask dispatch-webhooks) delivers
+    committed events, so a slow endpoint never delays the user's request.
+    """
+    endpoint_ids = [
+        endpoint_id for endpoint_id, events in webhook_endpoints() if "*" in events or event_type in events
+    ]
+    if not endpoint_ids:
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    payload = json.dumps({"request_id": request_id, **fields}, ensure_ascii=False, separators=(",", ":"), default=str)
+    db.session.add_all(
+        WebhookOutbox(
+            endpoint_id=endpoint_id, event_type=event_type, request_id=request_id, payload=payload,
+            created_at=now, next_attempt_at=now,
+        )
+        for endpoint_id in endpoint_ids
+    )
+
+
+def webhook_backoff(attempts, base_seconds):
+    """Seconds before retry number `attempts`: doubling from base_seconds, capped, with jitter."""
+    delay = min(base_seconds * 2 ** (attempts - 1), WEBHOOK_BACKOFF_CAP_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def webhook_body(rows):
+    """The JSON body for a batch; events of the same request are coalesced into one entry.
+
+    Each entry lists its events (with ids to de-duplicate retried deliveries) and
+    the request fields they carried, later events overriding earlier ones.
+    """
+    entries = {}
+    for row in rows:
+        entry = entries.setdefault(row.request_id, {"request_id": row.request_id, "events": [], "request": {}})
+        entry["events"].append({"id": row.outbox_id, "type": row.event_type, "at": row.created_at})
+        entry["request"].update(json.loads(row.payload))
+    return json.dumps({"deliveries": list(entries.values())}, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def send_webhook(url, secret, body, timeout):
+    """POST body to url; returns (status code or None, error or None, seconds)."""
+    headers = {"Content-Type": "application/json", "User-Agent": "MMS-Webhooks/1"}
+    if secret:
+        headers["X-Webhook-Signature"] = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body, headers=headers), timeout=timeout) as response:
+            status, error = response.status, None
+    except urllib.error.HTTPError as failure:
+        status, error = failure.code, str(failure)
+    except (urllib.error.URLError, OSError) as failure:
+        status, error = None, str(getattr(failure, "reason", failure))
+    return status, error, time.perf_counter() - started
+
+
+def claim_webhook_batches(now, batch_size, lease_seconds):
+    """Claim the oldest due events of each endpoint, up to batch_size each, and commit the claim.
+
+    An endpoint whose oldest pending event is waiting for a retry is skipped, so
+    each endpoint receives its events in order. Claimed events are not due again
+    until lease_seconds have passed, in case this dispatcher dies mid-delivery.
+    """
+    outbox = WebhookOutbox.__table__
+    pending = (outbox.c.delivered_at.is_(None), outbox.c.failed_at.is_(None))
+    now_text = now.strftime("%Y-%m-%d %H:%M:%S")
+    lease_until = (now + timedelta(seconds=lease_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    endpoints = db.session.execute(
+        select(WebhookEndpoint.endpoint_id, WebhookEndpoint.url, WebhookEndpoint.secret).where(
+            WebhookEndpoint.endpoint_id.in_(select(outbox.c.endpoint_id).where(*pending).distinct())
+        )
+    ).all()
+
+    batches = []
+    for endpoint in endpoints:
+        oldest = db.session.execute(
+            select(outbox.c.outbox_id, outbox.c.next_attempt_at)
+            .where(outbox.c.endpoint_id == endpoint.endpoint_id, *pending)
+            .order_by(outbox.c.outbox_id)
+            .limit(batch_size)
+        ).all()
+        if not oldest or oldest[0].next_attempt_at > now_text:
+            continue
+        due = [row.outbox_id for row in oldest if row.next_attempt_at <= now_text]
+        # Compare-and-swap on next_attempt_at: a concurrent dispatcher cannot claim the same events.
+        rows = db.session.execute(
+            update(outbox)
+            .where(outbox.c.outbox_id.in_(due), outbox.c.next_attempt_at <= now_text, *pending)
+            .values(next_attempt_at=lease_until, attempts=outbox.c.attempts + 1)
+            .returning(
+                outbox.c.outbox_id, outbox.c.event_type, outbox.c.request_id, outbox.c.payload,
+                outbox.c.created_at, outbox.c.attempts,
+            )
+        ).all()
+        if rows:
+            batches.append((endpoint, sorted(rows, key=lambda row: row.outbox_id)))
+    db.session.commit()
+    return batches
+
+
+def finish_webhook_batch(endpoint, rows, status, error, seconds, started_at, config):
+    """Record one delivery attempt and mark its events delivered, or schedule their retry."""
+    outbox = WebhookOutbox.__table__
+    finished_at = datetime.now()
+    finished_text = finished_at.strftime("%Y-%m-%d %H:%M:%S")
+    succeeded = status is not None and 200 <= status < 300
+    ids = [row.outbox_id for row in rows]
+    if succeeded:
+        db.session.execute(update(outbox).where(outbox.c.outbox_id.in_(ids)).values(delivered_at=finished_text))
+    else:
+        db.session.execute(
+            outbox.update()
+            .where(outbox.c.outbox_id == bindparam("id"))
+            .values(next_attempt_at=bindparam("next_attempt_at"), failed_at=bindparam("failed_at")),
+            [
+                {
+                    "id": row.outbox_id,
+                    "next_attempt_at": (
+                        finished_at + timedelta(seconds=webhook_backoff(row.attempts, config["WEBHOOK_BACKOFF_SECONDS"]))
+                    ).strftime("%Y-%m-%d %H:%M:%S"),
+                    "failed_at": finished_text if row.attempts >= config["WEBHOOK_MAX_ATTEMPTS"] else None,
+                }
+                for row in rows
+            ],
+        )
+    oldest = datetime.fromisoformat(min(row.created_at for row in rows))
+    db.session.add(
+        WebhookDelivery(
+            endpoint_id=endpoint.endpoint_id,
+            started_at=started_at,
+            events=len(rows),
+            status_code=status,
+            error=error,
+            succeeded=succeeded,
+            latency_ms=round(seconds * 1000),
+            lag_seconds=max(round((finished_at - oldest).total_seconds()), 0),
+        )
+    )
+    db.session.commit()
+    return succeeded
+
+
+def dispatch_webhooks(executor, now=None):
+    """One round: claim due batches, POST them to their endpoints in parallel, record the outcomes.
+
+    Returns the number of events delivered.
+    """
+    config = current_app.config
+    # The dispatcher runs outside a request, and both the claim and the outcome are writes.
+    g.sqlite_immediate = True
+    batches = claim_webhook_batches(
+        now or datetime.now(), config["WEBHOOK_BATCH_SIZE"], config["WEBHOOK_TIMEOUT"] * 3
+    )
+    started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Only the HTTP calls run in the pool; the database work stays on this thread and its session.
+    futures = [
+        (endpoint, rows, executor.submit(send_webhook, endpoint.url, endpoint.secret, webhook_body(rows),
+                                         config["WEBHOOK_TIMEOUT"]))
+        for endpoint, rows in batches
+    ]
+    delivered = 0
+    for endpoint, rows, future in futures:
+        if finish_webhook_batch(endpoint, rows, *future.result(), started_at, config):
+            delivered += len(rows)
+    return delivered
+
+
+def run_webhook_dispatcher(app, once=False):
+    """Deliver outbox events until stopped; sleeps WEBHOOK_POLL_SECONDS whenever a round found nothing to send."""
+    with ThreadPoolExecutor(max_workers=app.config["WEBHOOK_CONCURRENCY"], thread_name_prefix="webhook") as executor:
+        while True:
+            with app.app_context():
+                try:
+                    delivered = dispatch_webhooks(executor)
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception("webhook dispatch failed")
+                    delivered = 0
+                db.session.remove()
+            if once:
+                return delivered
+            if not delivered:
+                time.sleep(app.config["WEBHOOK_POLL_SECONDS"])
+
+
+def webhook_stats(last=1000):
+    """Per endpoint: pending events, and success rate, latency and lag percentiles of the last deliveries."""
+    outbox = WebhookOutbox.__table__
+    pending = dict(
+        db.session.execute(
+            select(outbox.c.endpoint_id, func.count())
+            .where(outbox.c.delivered_at.is_(None), outbox.c.failed_at.is_(None))
+            .group_by(outbox.c.endpoint_id)
+        ).all()
+    )
+    stats = []
+    for endpoint in WebhookEndpoint.query.order_by(WebhookEndpoint.endpoint_id):
+        deliveries = (
+            WebhookDelivery.query.filter_by(endpoint_id=endpoint.endpoint_id)
+            .order_by(WebhookDelivery.delivery_id.desc())
+            .limit(last)
+            .all()
+        )
+        latencies = sorted(delivery.latency_ms for delivery in deliveries)
+        lags = sorted(delivery.lag_seconds for delivery in deliveries if delivery.succeeded)
+
+        def percentile(values, fraction):
+            return values[min(int(len(values) * fraction), len(values) - 1)] if values else None
+
+        stats.append({
+            "endpoint_id": endpoint.endpoint_id,
+            "url": endpoint.url,
+            "pending": pending.get(endpoint.endpoint_id, 0),
+            "deliveries": len(deliveries),
+            "succeeded": sum(delivery.succeeded for delivery in deliveries),
+            "events": sum(delivery.events for delivery in deliveries),
+            "latency_ms_p50": percentile(latencies, 0.5),
+            "latency_ms_p95": percentile(latencies, 0.95),
+            "lag_seconds_p95": percentile(lags, 0.95),
+        })
+    return stats
+
+
+# ---------- desktop sync ----------
+SYNC_PAGE_SIZE = 500
+SYNC_COLUMNS = (
+    'sync_uuid', 'request_id', 'request_date', 'requester_name', 'phone_number', 'branch', 'maintenance_type',
+    'equipment_name', 'fault_type', 'notes', 'assigned_technician', 'assigned_technician_id', 'status',
+    'start_time', 'end_time', 'version', 'sync_seq', 'sync_origin',
+)
+# Set when a request is created; a push that changes them on an existing request is refused for that field.
+SYNC_FIXED_FIELDS = (
+    'request_date', 'requester_name', 'phone_number', 'branch', 'maintenance_type', 'equipment_name', 'fault_type',
+    'notes',
+)
+# How far along a request is; on a conflict the side that is further along wins.
+STATUS_RANK = {'open': 0, 'in_progress': 1, 'waiting': 1, 'closed': 2}
+
+
+def sync_rows(*where, limit=None):
+    table = MaintenanceRequest.__table__
+    query = select(*[table.c[name] for name in SYNC_COLUMNS]).where(*where).order_by(table.c.sync_seq)
+    return [dict(row._mapping) for row in db.session.execute(query.limit(limit))]
+
+
+def sync_technicians():
+    """Technicians as clients need them to assign by id; matched on their side by phone number, which is unique."""
+    query = (
+        select(Technician.technician_id, Technician.technician_name, Technician.phone_number, Branch.branch_name)
+        .join(Branch, Branch.branch_id == Technician.branch_id)
+        .order_by(Technician.technician_id)
+    )
+    return [dict(row._mapping) for row in db.session.execute(query)]
+
+
+def status_path(from_status, to_status):
+    """The shortest list of statuses that leads from from_status to to_status, or None."""
+    paths = {from_status: []}
+    queue = [from_status]
+    while queue:
+        status = queue.pop(0)
+        if status == to_status:
+            return paths[status]
+        for target, sources in STATUS_TRANSITIONS.items():
+            if status in sources and target not in paths:
+                paths[target] = paths[status] + [target]
+                queue.append(target)
+    return None
+
+
+def apply_sync_changes(changes, origin=None):
+    """Apply rows pushed by a desktop client in the current transaction.
+
+    Returns (rows as stored, rejected) where rejected lists the edits that were
+    not applied: {"sync_uuid", "fields"} for changes to SYNC_FIXED_FIELDS of an
+    existing request, an assigned_technician_id the server does not know, or an
+    assigned_technician name sent without an id.
+
+    Rows are matched by sync_uuid and unknown ones are created in one batch.
+    Technicians are assigned by assigned_technician_id; names are not unique. If
+    a server row has changed since the client's base_version, the server keeps
+    its technician and whichever status is further along. Rows changed here are
+    marked with origin, so the client's next pull does not send them back.
+    """
+    sync_uuids = []
+    for index, change in enumerate(changes):
+        try:
+            if not isinstance(change, dict) or not change.get('sync_uuid'):
+                raise ValueError('sync_uuid is required')
+            if (change.get('status') or 'open') not in STATUS_RANK:
+                raise ValueError(f"unknown status: {change['status']}")
+            int(change.get('base_version') or 1)
+            if change.get('assigned_technician_id') is not None:
+                int(change['assigned_technician_id'])
+        except (TypeError, ValueError) as error:
+            raise ValueError(f'changes[{index}]: {error}')
+        sync_uuids.append(str(change['sync_uuid']))
+    if len(set(sync_uuids)) < len(sync_uuids):
+        raise ValueError('each sync_uuid may appear once per push')
+
+    since = next_sync_seq(0)
+    table = MaintenanceRequest.__table__
+    current = {
+        row.sync_uuid: row
+        for row in db.session.execute(
+            select(
+                table.c.sync_uuid, table.c.request_id, table.c.status, table.c.assigned_technician,
+                table.c.assigned_technician_id, table.c.version, *[table.c[name] for name in SYNC_FIXED_FIELDS],
+            ).where(table.c.sync_uuid.in_(sync_uuids))
+        )
+    }
+    technician_ids = set(db.session.scalars(select(Technician.technician_id)))
+    new = {}
+    for index, (sync_uuid, change) in enumerate(zip(sync_uuids, changes)):
+        if sync_uuid not in current:
+            try:
+                data = request_data_from(change)
+            except ValueError as error:
+                raise ValueError(f'changes[{index}]: {error}')
+            data.update(sync_uuid=sync_uuid, request_date=change.get('request_date'))
+            technician_id = change.get('assigned_technician_id')
+            new[sync_uuid] = (data, technician_id is not None and int(technician_id) in technician_ids)
+    for dispatch in (True, False):
+        # Rows the client has already assigned are not dispatched automatically.
+        batch = [sync_uuid for sync_uuid, (_, assigned) in new.items() if assigned != dispatch]
+        if batch:
+            request_items = stage_requests([new[sync_uuid][0] for sync_uuid in batch], dispatch=dispatch)
+            current.update(zip(batch, request_items))
+
+    request_ids = []
+    rejected = []
+    for sync_uuid, change in zip(sync_uuids, changes):
+        row = current[sync_uuid]
+        fields = []
+        if sync_uuid not in new:
+            fields = [
+                name for name in SYNC_FIXED_FIELDS
+                if name in change and (change[name] or '') != (getattr(row, name) or '')
+            ]
+        technician_id = change.get('assigned_technician_id')
+        if technician_id is not None and int(technician_id) not in technician_ids:
+            fields.append('assigned_technician_id')
+            technician_id = None
+        elif technician_id is None and (change.get('assigned_technician') or None) not in (None, row.assigned_technician):
+            # A technician named without an id: names are not unique, so it is not guessed.
+            fields.append('assigned_technician')
+        if fields:
+            rejected.append({'sync_uuid': sync_uuid, 'fields': fields})
+        conflict = sync_uuid not in new and row.version != int(change.get('base_version') or 1)
+        apply_sync_edits(row.request_id, row.status, row.assigned_technician_id, conflict, change, technician_id)
+        request_ids.append(row.request_id)
+
+    db.session.execute(
+        update(MaintenanceRequest)
+        .where(MaintenanceRequest.request_id.in_(request_ids), MaintenanceRequest.sync_seq > since)
+        .values(sync_origin=origin)
+        .execution_options(synchronize_session=False)
+    )
+    rows = {row['sync_uuid']: row for row in sync_rows(MaintenanceRequest.request_id.in_(request_ids))}
+    return [rows[sync_uuid] for sync_uuid in sync_uuids], rejected
+
+
+def apply_sync_edits(request_id, status, technician_id, conflict, change, wanted_technician_id):
+    wanted_status = change.get('status') or 'open'
+    # A request closed on the server stays as the server has it.
+    if (
+        status != 'closed'
+        and wanted_technician_id is not None
+        and int(wanted_technician_id) != technician_id
+        and (not conflict or technician_id is None)
+    ):
+        stage_assignment(request_id, int(wanted_technician_id))
+    if wanted_status != status and (not conflict or STATUS_RANK[wanted_status] > STATUS_RANK[status]):
+        for step in status_path(status, wanted_status) or []:
+            stage_status_change(
+                request_id, step,
+                start_time=change.get('start_time') if step == 'in_progress' else None,
+                end_time=change.get('end_time') if step == 'closed' else None,
+            )
+
+
+def backfill_sync_columns(batch_size=1000):
+    """Give requests written outside stage_requests (bulk imports, older rows) a sync uuid and sequence number."""
+    table = MaintenanceRequest.__table__
+    count = 0
+    while True:
+        ids = db.session.scalars(
+            select(table.c.request_id)
+            .where((table.c.sync_uuid.is_(None)) | (table.c.sync_seq.is_(None)))
+            .order_by(table.c.request_id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            return count
+        first_seq = next_sync_seq(len(ids)) - len(ids) + 1
+        db.session.execute(
+            table.update()
+            .where(table.c.request_id == bindparam('id'))
+            .values(sync_uuid=func.coalesce(table.c.sync_uuid, bindparam('uuid')), sync_seq=bindparam('seq')),
+            [
+                {'id': request_id, 'uuid': str(uuid.uuid4()), 'seq': first_seq + position}
+                for position, request_id in enumerate(ids)
+            ],
+        )
+        db.session.commit()
+        count += len(ids)
+
+
+def register_api(app):
+    @app.before_request
+    def api_require_login():
+        if request.path.startswith('/api/v1/') and 'user_role' not in session:
+            return api_error('غير مصرح', 401)
+
+    @app.before_request
+    def api_require_token():
+        """Desktop sync and the change feed authenticate with "Authorization: Bearer <token>"; without one they are off."""
+        for prefix, setting in (('/api/sync', 'SYNC_TOKEN'), ('/api/changes', 'CHANGE_FEED_TOKEN')):
+            if request.path == prefix or request.path.startswith(prefix + '/'):
+                break
+        else:
+            return None
+        token = app.config[setting]
+        if not token:
+            return api_error('غير مفعل', 404)
+        supplied = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(supplied, f'Bearer {token}'.encode()):
+            return api_error('غير مصرح', 401)
+        return None
+
+    @app.route('/api/v1/session')
+    def api_v1_session():
+        """Who is logged in, and the CSRF token to send as X-CSRFToken with POST requests."""
+        return jsonify({
+            'user_id': current_user_id(),
+            'role': session['user_role'],
+            'technician_id': session.get('technician_id'),
+            'csrf_token': generate_csrf(),
+        })
+
+    @app.route('/api/v1/requests')
+    @use_replica
+    def api_v1_requests():
+        query = MaintenanceRequest.query
+        for name in ('status', 'branch', 'assigned_technician_id'):
+            if request.args.get(name):
+                query = query.filter(getattr(MaintenanceRequest, name) == request.args[name])
+        return api_page(query, MaintenanceRequest, MaintenanceRequest.request_id)
+
+    @app.route('/api/v1/requests/<int:request_id>')
+    def api_v1_request(request_id):
+        try:
+            columns = api_columns(MaintenanceRequest)
+        except ValueError as error:
+            return api_error(str(error), 400)
+        row = db.session.execute(
+            select(*columns).where(MaintenanceRequest.request_id == request_id)
+        ).first()
+        if row is None:
+            return api_error('الطلب غير موجود', 404)
+        return jsonify(dict(row._mapping))
+
+    @app.route('/api/v1/requests', methods=['POST'])
+    def api_v1_create_request():
+        if session['user_role'] not in API_ROLES['create']:
+            return api_error('غير مصرح', 403)
+        try:
+            data = request_data_from(request.get_json(silent=True) or {})
+        except ValueError as error:
+            return api_error(str(error), 400)
+        request_id = add_request(data, idempotency_key=request.headers.get('Idempotency-Key'))
+        return jsonify({'request_id': request_id}), 201
+
+    @app.route('/api/v1/batch', methods=['POST'])
+    def api_v1_batch():
+        """Status changes and assignments applied in one transaction: all of them, or none."""
+        operations = (request.get_json(silent=True) or {}).get('operations')
+        if not isinstance(operations, list) or not operations:
+            return api_error('operations must be a non-empty list', 400)
+        if len(operations) > API_MAX_PAGE_SIZE:
+            return api_error(f'at most {API_MAX_PAGE_SIZE} operations per batch', 400)
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if get_idempotent_result(idempotency_key):
+            return jsonify({'applied': len(operations), 'replayed': True})
+        g.sqlite_immediate = True
+        for index, operation in enumerate(operations):
+            try:
+                error = api_batch_operation(operation if isinstance(operation, dict) else {})
+            except ValueError:
+                error = 'الحالة المطلوبة غير صالحة', 400
+            except RequestConflictError as conflict:
+                db.session.rollback()
+                return api_error(
+                    'تم تعديل الطلب من مستخدم آخر أو أن حالته لا تسمح بهذا التغيير', 409,
+                    index=index, request_id=conflict.request_id,
+                    current_status=conflict.current_status, current_version=conflict.current_version,
+                )
+            if error:
+                db.session.rollback()
+                return api_error(*error, index=index)
+
+        commit_idempotent(idempotency_key, 'batch', None)
+        for operation in operations:
+            fragment_cache.invalidate(int(operation['request_id']))
+        return jsonify({'applied': len(operations)})
+
+    @app.route('/api/v1/notifications')
+    def api_v1_notifications():
+        recipient_type, recipient_id = notification_audience()
+        query = unread_notifications_query(recipient_type, recipient_id, current_user_id())
+        return api_page(query, Notification, Notification.notification_id)
+
+    @app.route('/api/v1/notifications/read', methods=['POST'])
+    def api_v1_read_notifications():
+        ids = (request.get_json(silent=True) or {}).get('notification_ids')
+        if not isinstance(ids, list) or not all(isinstance(value, int) for value in ids):
+            return api_error('notification_ids must be a list of integers', 400)
+        mark_notifications_read(current_user_id(), ids)
+        return jsonify({'read': len(ids)})
+
+    @app.route('/api/v1/technicians')
+    def api_v1_technicians():
+        return api_page(Technician.query, Technician, Technician.technician_id)
+
+    @app.route('/api/changes')
+    def api_changes():
+        """Writes after ?after=<seq> as NDJSON, oldest first; ?wait=<seconds> holds the request until one arrives.
+
+        X-Next-After is the seq to pass next time, also when nothing came back.
+        """
+        try:
+            after = int(request.args.get('after', 0))
+            limit = min(max(int(request.args.get('limit', CHANGE_FEED_PAGE_SIZE)), 1), CHANGE_FEED_PAGE_SIZE)
+            wait = min(max(float(request.args.get('wait', 0)), 0), CHANGE_FEED_MAX_WAIT)
+        except ValueError:
+            return api_error('after, limit and wait must be numbers', 400)
+        if g.get('long_poll_refused'):
+            wait = 0
+        rows = read_changes(after, limit, wait)
+        response = app.response_class(''.join(change_feed_line(row) for row in rows), mimetype='application/x-ndjson')
+        response.headers['X-Next-After'] = str(rows[-1].seq if rows else after)
+        return response
+
+    @app.route('/api/sync')
+    def api_sync_pull():
+        """Requests changed after sequence number ?since=, oldest change first.
+
+        Rows last changed by ?client='s own push are left out; it already has them.
+        """
+        try:
+            since = int(request.args.get('since', 0))
+            limit = min(max(int(request.args.get('limit', SYNC_PAGE_SIZE)), 1), SYNC_PAGE_SIZE)
+        except ValueError:
+            return api_error('since and limit must be integers', 400)
+        client = request.args.get('client')
+        rows = sync_rows(MaintenanceRequest.sync_seq > since, limit=limit + 1)
+        page = rows[:limit]
+        return jsonify({
+            'changes': [row for row in page if not client or row['sync_origin'] != client],
+            'next_since': page[-1]['sync_seq'] if page else since,
+            'has_more': len(rows) > limit,
+        })
+
+    @app.route('/api/sync/technicians')
+    def api_sync_technicians():
+        return jsonify({'technicians': sync_technicians()})
+
+    @app.route('/api/sync/push', methods=['POST'])
+    @csrf.exempt
+    def api_sync_push():
+        """Rows created or changed offline, applied in one transaction; returns each row as stored
+        and the edits that were refused."""
+        payload = request.get_json(silent=True) or {}
+        changes = payload.get('changes')
+        if not isinstance(changes, list) or not changes:
+            return api_error('changes must be a non-empty list', 400)
+        if len(changes) > SYNC_PAGE_SIZE:
+            return api_error(f'at most {SYNC_PAGE_SIZE} changes per push', 400)
+
+        g.sqlite_immediate = True
+        try:
+            rows, rejected = apply_sync_changes(changes, origin=str(payload.get('client_id') or '') or None)
+        except ValueError as error:
+            db.session.rollback()
+            return api_error(str(error), 400)
+        except RequestConflictError as conflict:
+            # Changed by a concurrent writer between our read and write; the client pushes again.
+            db.session.rollback()
+            return api_error('تم تعديل الطلب من مستخدم آخر، أعد المزامنة', 409, request_id=conflict.request_id)
+        db.session.commit()
+        for row in rows:
+            fragment_cache.invalidate(row['request_id'])
+        return jsonify({'rows': rows, 'rejected': rejected})
+
+    @app.route('/api/v1/lookups')
+    def api_v1_lookups():
+        """The choices of the request form, in one round trip."""
+        return jsonify({
+            'branches': db.session.scalars(select(Branch.branch_name).order_by(Branch.branch_name)).all(),
+            'maintenance_types': db.session.scalars(
+                select(MaintenanceType.type_name).order_by(MaintenanceType.type_name)
+            ).all(),
+            'equipment_names': db.session.scalars(
+                select(EquipmentName.equipment_name).order_by(EquipmentName.equipment_name)
+            ).all(),
+            'fault_types': db.session.scalars(select(FaultType.fault_name).order_by(FaultType.fault_name)).all(),
+        })
+
 
 app = create_app()
 